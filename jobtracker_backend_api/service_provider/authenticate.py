@@ -1,10 +1,33 @@
+import functools
+import json
 import os
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from datetime import timezone as dt_timezone
 
+from django.db import transaction
+from django.utils import timezone
+
+from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+
+# Authorized service objects kept per worker process, least recently used evicted
+SERVICE_CACHE_SIZE = int(os.getenv("GOOGLE_SERVICE_CACHE_SIZE", 128))
+# Lifetime of a cached service when the user has no token_expiry recorded
+DEFAULT_SERVICE_TTL = timedelta(minutes=50)
+# Access tokens this close to expiry are refreshed before they are used
+TOKEN_REFRESH_MARGIN = timedelta(seconds=int(os.getenv("TOKEN_REFRESH_MARGIN", 300)))
+
+_service_cache = OrderedDict()
+_service_cache_lock = threading.Lock()
 
 
-def _get_google_auth_credentials(google_access_token, google_refresh_token):
+def _get_google_auth_credentials(
+    google_access_token, google_refresh_token, token_expiry=None
+):
     """Get Google OAuth credentials for the user."""
     creds = Credentials(
         token=google_access_token,
@@ -13,14 +36,70 @@ def _get_google_auth_credentials(google_access_token, google_refresh_token):
         client_id=os.environ["GOOGLE_API_CLIENT_ID"],
         client_secret=os.environ["GOOGLE_API_CLIENT_SECRET"],
     )
+    if token_expiry is not None:
+        # google-auth compares expiry against a naive UTC datetime
+        creds.expiry = timezone.make_naive(token_expiry, dt_timezone.utc)
     return creds
 
 
+def _token_is_fresh(user):
+    return (
+        bool(user.google_access_token)
+        and user.token_expiry is not None
+        and user.token_expiry > timezone.now() + TOKEN_REFRESH_MARGIN
+    )
+
+
+def refresh_user_token(user):
+    """Refresh the user's access token and save it with its expiry.
+
+    The user row is locked while refreshing, so concurrent tasks for the same
+    user wait for the first refresh and then reuse the token it saved instead
+    of each refreshing on their own."""
+    model = type(user)
+    with transaction.atomic():
+        locked = model.objects.select_for_update().get(pk=user.pk)
+        if not _token_is_fresh(locked):
+            creds = _get_google_auth_credentials(
+                locked.google_access_token, locked.google_refresh_token
+            )
+            creds.refresh(Request())
+            locked.google_access_token = creds.token
+            locked.token_expiry = timezone.make_aware(creds.expiry, dt_timezone.utc)
+            locked.save(update_fields=["google_access_token", "token_expiry"])
+    user.google_access_token = locked.google_access_token
+    user.token_expiry = locked.token_expiry
+    return user
+
+
+def get_user_credentials(user):
+    """Return credentials for the user, refreshing the stored token only when it
+    is missing, expired or about to expire. A fresh token costs no requests."""
+    if not _token_is_fresh(user):
+        refresh_user_token(user)
+    return _get_google_auth_credentials(
+        user.google_access_token, user.google_refresh_token, user.token_expiry
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _get_discovery_document(service_name, version):
+    """Load and parse the discovery document bundled with the client library
+    once per process, instead of on every build."""
+    return json.loads(discovery_cache.get_static_doc(service_name, version))
+
+
+def _build_service(service_name, version, creds):
+    return build_from_document(
+        _get_discovery_document(service_name, version), credentials=creds
+    )
+
+
 def get_gmail_service(google_access_token, google_refresh_token):
     """Authenticate and return Gmail service clients."""
     creds = _get_google_auth_credentials(google_access_token, google_refresh_token)
     try:
-        gmail_service = build("gmail", "v1", credentials=creds)
+        gmail_service = _build_service("gmail", "v1", creds)
         return gmail_service
     except Exception as e:
         print(f"Error getting Gmail service: {e}")
@@ -30,5 +109,45 @@ def get_gmail_service(google_access_token, google_refresh_token):
 def get_googlesheet_service(google_access_token, google_refresh_token):
     """Authenticate and return Google Sheets service client."""
     creds = _get_google_auth_credentials(google_access_token, google_refresh_token)
-    sheets_service = build("sheets", "v4", credentials=creds)
+    sheets_service = _build_service("sheets", "v4", creds)
     return sheets_service
+
+
+def _get_cached_service(user, service_name, version):
+    """Return an authorized service for the user, reusing the one built for an
+    earlier fetch until the user's token expires or changes."""
+    key = (user.pk, service_name, version)
+    with _service_cache_lock:
+        entry = _service_cache.get(key)
+        if (
+            entry is not None
+            and entry["access_token"] == user.google_access_token
+            and entry["expires_at"] > timezone.now() + TOKEN_REFRESH_MARGIN
+        ):
+            _service_cache.move_to_end(key)
+            return entry["service"]
+
+    creds = get_user_credentials(user)
+    service = _build_service(service_name, version, creds)
+    # Lets rate_limits.service_keys charge calls to the user's quota
+    service.rate_limit_user = user.pk
+    with _service_cache_lock:
+        _service_cache[key] = {
+            "service": service,
+            "access_token": user.google_access_token,
+            "expires_at": user.token_expiry or timezone.now() + DEFAULT_SERVICE_TTL,
+        }
+        _service_cache.move_to_end(key)
+        while len(_service_cache) > SERVICE_CACHE_SIZE:
+            _service_cache.popitem(last=False)
+    return service
+
+
+def get_user_gmail_service(user):
+    """Return the cached Gmail service client for the user."""
+    return _get_cached_service(user, "gmail", "v1")
+
+
+def get_user_googlesheet_service(user):
+    """Return the cached Google Sheets service client for the user."""
+    return _get_cached_service(user, "sheets", "v4")
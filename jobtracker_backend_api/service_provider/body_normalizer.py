@@ -0,0 +1,246 @@
+import functools
+import os
+import re
+from collections import Counter
+
+from .parsers import estimate_tokens
+
+try:
+    import tiktoken
+except ImportError:  # Tokens are counted by estimate_tokens instead
+    tiktoken = None
+
+# Separator line Outlook and others put above the quoted message
+ORIGINAL_MESSAGE_RE = re.compile(r"^(-{2,} ?Original Message ?-{2,}|_{20,})$", re.I)
+
+# Gmail's and Apple Mail's forwarded message markers; the headers below them
+# look like a quote header but are the message itself
+FORWARDED_RE = re.compile(r"^-*\s*(begin )?forwarded message", re.I)
+
+# A reply with less new text than this, like "Tuesday at 3pm works", keeps
+# the history it quotes, which says what the reply is about
+MIN_REPLY_CHARS = 40
+
+# Paragraphs that carry no information about an application: unsubscribe
+# and preference links, legal notices, copyright lines and the like
+BOILERPLATE_RE = re.compile(
+    r"unsubscribe"
+    r"|manage (your )?(email |notification )?(preferences|settings)"
+    r"|view (this email )?in (your )?browser"
+    r"|all rights reserved|copyright|©"
+    r"|privacy (policy|notice|statement)"
+    r"|you('re| are) receiving this|this e-?mail was sent to"
+    r"|confidentiality|(e-?mail|message)[^.]{0,60}confidential"
+    r"|intended (solely |only )?for the"
+    r"|if you (are not|have received this)"
+    r"|do not reply|automated (message|e-?mail)"
+    r"|powered by|follow us on|sent from my"
+    r"|equal opportunity employer",
+    re.I,
+)
+
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+# A footer paragraph this short is dropped on any boilerplate match
+SHORT_FOOTER_CHARS = 80
+
+# Share of a longer paragraph's text that must be boilerplate sentences
+BOILERPLATE_SHARE = 0.6
+
+WORD_RE = re.compile(r"\w")
+
+URL_RE = re.compile(r"\b(?:https?://|www\.)[^\s<>\"'()\[\]]+", re.I)
+
+# A subject over the budget still leaves the body this many tokens
+MIN_BODY_TOKENS = 50
+
+STEPS = ["quoted", "whitespace", "boilerplate", "links", "budget"]
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model):
+    """The tokenizer of the model, or None to count by estimate when
+    tiktoken is not installed or cannot load the encoding."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception as error:
+        print(f"Counting tokens by estimate, no encoding for {model}: {error}")
+        return None
+
+
+def count_tokens(text, model="gpt-4o-mini"):
+    if not text:
+        return 0
+    encoding = get_encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text, max_tokens, model="gpt-4o-mini"):
+    """The start of text, at most max_tokens long, cut at a word boundary."""
+    encoding = get_encoding(model)
+    if encoding is None:
+        cut = text[: max_tokens * 4]
+    else:
+        cut = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    if len(cut) < len(text) and " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut
+
+
+def _starts_quote(line, following):
+    if ORIGINAL_MESSAGE_RE.match(line):
+        return True
+    next_line = following[0].strip() if following else ""
+    if line.startswith("On ") and (
+        line.endswith("wrote:") or next_line.endswith("wrote:")
+    ):
+        # Gmail's "On <date>, <sender> wrote:", which may wrap
+        return True
+    # Outlook's From:/Sent: header block
+    return line.startswith("From:") and next_line.startswith(("Sent:", "Date:"))
+
+
+def strip_quoted_history(lines):
+    """The lines of a reply without the history it quotes: everything from
+    the quote header on, and lines quoted with ">". A forwarded message, and
+    a reply under MIN_REPLY_CHARS of new text, are left as they are."""
+    kept = []
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        if FORWARDED_RE.match(stripped):
+            return lines
+        if _starts_quote(stripped, lines[index + 1 : index + 2]):
+            break
+        if not stripped.startswith(">"):
+            kept.append(line)
+    new_text = "".join("".join(line.split()) for line in kept)
+    return kept if len(new_text) >= MIN_REPLY_CHARS else lines
+
+
+def split_paragraphs(lines):
+    """Blank-line separated paragraphs, hard-wrapped lines rejoined and
+    whitespace collapsed. Paragraphs without a word, like the invisible
+    filler of marketing mail, are dropped."""
+    paragraphs, current = [], []
+    for line in lines + [""]:
+        if line.strip():
+            current.append(line)
+        elif current:
+            paragraph = " ".join(" ".join(current).split())
+            if WORD_RE.search(paragraph):
+                paragraphs.append(paragraph)
+            current = []
+    return paragraphs
+
+
+def is_boilerplate(paragraph):
+    """Whether a paragraph is footer text: short with a boilerplate phrase,
+    or mostly made of sentences that are."""
+    if len(paragraph) <= SHORT_FOOTER_CHARS:
+        return bool(BOILERPLATE_RE.search(paragraph))
+    sentences = SENTENCE_END_RE.split(paragraph)
+    matched = sum(len(s) for s in sentences if BOILERPLATE_RE.search(s))
+    return matched >= BOILERPLATE_SHARE * sum(len(s) for s in sentences)
+
+
+def drop_boilerplate(paragraphs):
+    """Drop the footer paragraphs at the end of the body. Anything above the
+    last paragraph with content is kept, and so is the opening paragraph,
+    so a status sentence next to a "do not reply" is never lost."""
+    end = len(paragraphs)
+    while end > 1 and is_boilerplate(paragraphs[end - 1]):
+        end -= 1
+    return paragraphs[:end]
+
+
+def collapse_urls(text):
+    """Replace every URL by its host, dropping paths and tracking parameters."""
+
+    def host(match):
+        url = match.group(0)
+        return url.split("//", 1)[-1].split("/", 1)[0].split("?", 1)[0].lower()
+
+    return URL_RE.sub(host, text)
+
+
+class BodyNormalizer:
+    """Shrink an email body before it is classified: quoted history, URLs,
+    boilerplate and footers go, and what is left is cut to BODY_TOKEN_BUDGET
+    tokens for subject and body together, keeping the opening paragraphs.
+
+    stats counts the emails normalized and truncated. With track_tokens set,
+    as the benchmark and report_body_tokens do, it also counts the tokens of
+    the bodies before and after; a fetch leaves it off so whole raw bodies
+    are not tokenized. BODY_NORMALIZE_ENABLED=false only flattens the body
+    onto one line, as before.
+    """
+
+    def __init__(self, model="gpt-4o-mini", track_tokens=False):
+        self.model = model
+        self.enabled = os.getenv("BODY_NORMALIZE_ENABLED", "true").lower() == "true"
+        self.token_budget = int(os.getenv("BODY_TOKEN_BUDGET", 512))
+        self.track_tokens = track_tokens
+        self.stats = Counter()
+
+    def normalize(self, subject, text, breakdown=None):
+        """The normalized body. Given a breakdown Counter, the tokens left
+        after each of STEPS are added to it."""
+        if not text:
+            return ""
+        if not self.enabled:
+            return text.replace("\n", "").strip()
+
+        def after(step, parts):
+            if breakdown is not None:
+                breakdown[step] += count_tokens("\n".join(parts), self.model)
+
+        lines = strip_quoted_history(text.splitlines())
+        after("quoted", lines)
+        paragraphs = split_paragraphs(lines)
+        after("whitespace", paragraphs)
+        paragraphs = drop_boilerplate(paragraphs)
+        after("boilerplate", paragraphs)
+        paragraphs = [collapse_urls(paragraph) for paragraph in paragraphs]
+        after("links", paragraphs)
+        paragraphs = self.fit_budget(subject, paragraphs)
+        after("budget", paragraphs)
+
+        body = "\n".join(paragraphs)
+        self.stats["emails"] += 1
+        if self.track_tokens:
+            self.stats["tokens_in"] += count_tokens(text, self.model)
+            self.stats["tokens_out"] += count_tokens(body, self.model)
+        return body
+
+    def fit_budget(self, subject, paragraphs):
+        """The opening paragraphs that fit the budget left by the subject,
+        the first one that does not cut to size."""
+        budget = max(
+            self.token_budget - count_tokens(subject, self.model), MIN_BODY_TOKENS
+        )
+        kept = []
+        for paragraph in paragraphs:
+            tokens = count_tokens(paragraph, self.model)
+            if tokens > budget:
+                self.stats["truncated"] += 1
+                kept.append(truncate_tokens(paragraph, budget, self.model))
+                break
+            kept.append(paragraph)
+            budget -= tokens
+        return [paragraph for paragraph in kept if paragraph]
+
+    def report(self):
+        """Tokens of the bodies normalized so far, before and after."""
+        tokens_in, tokens_out = self.stats["tokens_in"], self.stats["tokens_out"]
+        return {
+            "emails": self.stats["emails"],
+            "tokens_in": tokens_in,
+            "tokens_out": tokens_out,
+            "tokens_saved": tokens_in - tokens_out,
+            "saved_share": 1 - tokens_out / tokens_in if tokens_in else 0.0,
+            "truncated": self.stats["truncated"],
+        }
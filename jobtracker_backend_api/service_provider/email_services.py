@@ -1,214 +1,779 @@
 import base64
+import binascii
 import email
+import math
 import os
+import re
+import time
 from datetime import datetime, timezone
+from html.parser import HTMLParser
+
+from django.db import transaction
+from django.db.models import Max
 
-from bs4 import BeautifulSoup
 from google.auth.exceptions import RefreshError
 from googleapiclient.errors import HttpError
 
-from .authenticate import get_gmail_service, get_googlesheet_service
+from .authenticate import (
+    get_user_credentials,
+    get_user_gmail_service,
+    get_user_googlesheet_service,
+)
+from .body_normalizer import BodyNormalizer
+from .extraction_cache import CachedExtractor
 from .googlesheet_services import add_job_to_sheet, get_first_sheet_name
-from .models import FetchLog, JobApplied
-from .parsers import OpenAIExtractor
-
-openai_extractor = OpenAIExtractor()
+from .message_ledger import MessageLedger
+from .models import FetchLog, JobApplied, User
+from .parsers import LocalExtractor, OpenAIExtractor
+from .prefilter import EmailPrefilter
+from .rate_limits import (
+    GMAIL_GET_COST,
+    GMAIL_HISTORY_COST,
+    GMAIL_LIST_COST,
+    MAX_RETRIES,
+    acquire,
+    backoff_delay,
+    call_with_rate_limit,
+    is_rate_limited,
+    is_retryable,
+    service_keys,
+    throttle,
+)
+from .response_cache import bump_data_version
+from .thread_pools import WorkerPool
+
+openai_extractor = CachedExtractor(OpenAIExtractor())
+email_extractor = LocalExtractor(openai_extractor)
+body_normalizer = BodyNormalizer(openai_extractor.model)
+email_prefilter = EmailPrefilter()
+
+TEXT_CONTENT_TYPES = ("text/plain", "text/html")
+
+CHARSET_RE = re.compile(r'charset="?([^";\s]+)', re.IGNORECASE)
+
+# Headers fetched in the first, metadata-only phase of a page download
+SCREENING_HEADERS = ["From", "Subject", "List-Id", "List-Unsubscribe"]
+METADATA_FIELDS = "id,threadId,labelIds,internalDate,payload/headers"
+FULL_FIELDS = (
+    "id,threadId,labelIds,internalDate,"
+    "payload(mimeType,filename,headers,body/data,parts)"
+)
+
+# Gmail accepts at most 100 sub-requests in a single batch HTTP call but
+# documents 50 or fewer, larger batches being likely to hit rate limits
+GMAIL_BATCH_LIMIT = 50
+
+# Labels of added messages that a date-window search would not return either
+SKIPPED_HISTORY_LABELS = {"SPAM", "TRASH", "DRAFT"}
+
+
+class HistoryExpiredError(Exception):
+    """The stored Gmail historyId is too old to list changes from."""
 
 
 def is_user_authorized(user):
-    service = get_gmail_service(user.google_access_token, user.google_refresh_token)
+    """A stored token that has not expired needs no probe request; otherwise
+    the user is authorized if the refresh token still works."""
     try:
-        # Try a simple API call, e.g., get the user's profile
-        service.users().getProfile(userId="me").execute()
-        # print("User is authorized. Email:", profile.get("emailAddress"))
+        get_user_credentials(user)
         return True
-    except (HttpError, RefreshError) as error:
+    except RefreshError as error:
         print("User is NOT authorized or token is invalid:", error)
         return False
 
-def extract_text_content(part):
-    content_type = part.get_content_type()
+
+class _HTMLTextExtractor(HTMLParser):
+    """Collect the text of an HTML document while it is parsed, without
+    building a tree. Script, style and other non-visible content is dropped."""
+
+    SKIPPED_TAGS = {"head", "script", "style", "noscript", "template", "title"}
+    # Tags ending a paragraph, so the body normalizer can tell them apart
+    BLOCK_TAGS = {"p", "div", "table", "tr", "li", "h1", "h2", "h3", "h4", "h5", "h6"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.chunks = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag == "br":
+            self.chunks.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag in self.BLOCK_TAGS:
+            self.chunks.append("\n\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.chunks.append(data)
+
+
+def html_to_text(html):
+    parser = _HTMLTextExtractor()
+    parser.feed(html)
+    parser.close()
+    return "".join(parser.chunks)
+
+
+def is_text_part(part):
     content_disposition = str(part.get("Content-Disposition"))
-    if (
-        content_type == "text/plain"
-        and "attachment" not in content_disposition
-    ):
-        charset = part.get_content_charset() or "utf-8"
-        
-        return  part.get_payload(decode=True).decode(charset, errors="replace")
-        
-    elif (
-        content_type == "text/html"
+    return (
+        part.get_content_type() in TEXT_CONTENT_TYPES
         and "attachment" not in content_disposition
-    ):
-        charset = part.get_content_charset() or "utf-8"
-        html = part.get_payload(decode=True).decode(
-            charset, errors="replace"
-        )
-        soup = BeautifulSoup(html, "html.parser")
-        return soup.get_text()
-    return None
+    )
 
-def extract_body(mime_msg):
-    single = not mime_msg.is_multipart()
-    parts = [mime_msg] if single else list(mime_msg.walk())
+
+def _base64_prefix(data, max_bytes):
+    """The start of base64 data that decodes to at least max_bytes, so a
+    long part is not decoded whole. Line breaks are dropped."""
+    needed = math.ceil(max_bytes / 3) * 4
+    # Line breaks take fewer characters than the base64 lines they end
+    return "".join(data[: needed * 2].split())[:needed]
+
+
+def _decode_text(data, charset, content_type):
+    try:
+        text = data.decode(charset, errors="replace")
+    except LookupError:
+        text = data.decode("utf-8", errors="replace")
+    if content_type == "text/html":
+        # A cut payload can end inside a tag, like "<p>Hello</p><spa"
+        if text.rfind("<") > text.rfind(">"):
+            text = text[: text.rfind("<")]
+        return html_to_text(text)
+    return text
+
+
+def _part_bytes(part, max_bytes=None):
+    """The decoded payload of a MIME part, at most max_bytes of it."""
+    if max_bytes is None:
+        return part.get_payload(decode=True) or b""
+    if part.get("Content-Transfer-Encoding", "").lower() == "base64":
+        try:
+            prefix = _base64_prefix(part.get_payload(), max_bytes)
+            return base64.b64decode(prefix)[:max_bytes]
+        except (binascii.Error, ValueError):
+            pass  # Decoded leniently below, like any other payload
+    return (part.get_payload(decode=True) or b"")[:max_bytes]
+
+
+def extract_text_content(part, max_bytes=None):
+    """Decode a text/plain or text/html part to text, reading at most
+    max_bytes of its payload. Returns None for any other part."""
+    if not is_text_part(part):
+        return None
+    charset = part.get_content_charset() or "utf-8"
+    return _decode_text(_part_bytes(part, max_bytes), charset, part.get_content_type())
+
+
+def extract_body(mime_msg, max_bytes=None):
+    """Extract the text body of a message. The text/plain parts are used when
+    there are any, the HTML parts otherwise; other parts are never decoded.
+    At most max_bytes (BODY_MAX_BYTES by default) are decoded per message.
+    Line breaks are kept for the body normalizer."""
+    if max_bytes is None:
+        max_bytes = int(os.getenv("BODY_MAX_BYTES", 64 * 1024))
+
+    text_parts = [
+        part
+        for part in mime_msg.walk()
+        if not part.is_multipart() and is_text_part(part)
+    ]
+    plain_parts = [p for p in text_parts if p.get_content_type() == "text/plain"]
 
     contents = []
-    for part in parts:
-        contents.append(extract_text_content(part))
+    remaining = max_bytes
+    for part in plain_parts or text_parts:
+        if remaining <= 0:
+            break
+        data = _part_bytes(part, remaining)
+        remaining -= len(data)
+        charset = part.get_content_charset() or "utf-8"
+        contents.append(_decode_text(data, charset, part.get_content_type()))
 
-    return "\n".join(contents).replace("\n", "").replace("\r", "").strip()
+    return "\n".join(contents).replace("\r", "").strip()
 
 
-def get_user_job_count(user):
-    return JobApplied.objects.filter(user=user).count()
+def get_last_fetch_log(user):
+    return FetchLog.objects.filter(user=user).order_by("-last_fetch_date").first()
 
 
 def get_after_date(user):
-    fetch_log = FetchLog.objects.filter(user=user).order_by("-last_fetch_date").first()
-    last_fetch_date = fetch_log.last_fetch_date if fetch_log else None
-    after_date = get_after_date(last_fetch_date, timezone.now())
-    return after_date
+    fetch_log = get_last_fetch_log(user)
+    return fetch_log.last_fetch_date if fetch_log else datetime.now(timezone.utc)
+
+
+def get_start_history_id(user):
+    """Return the historyId to sync from, or None when a date scan is needed."""
+    if os.getenv("GMAIL_SYNC_MODE", "history") != "history":
+        return None
+    fetch_log = get_last_fetch_log(user)
+    return fetch_log.history_id if fetch_log else None
+
+
+def get_mailbox_history_id(gmail_service):
+    """Return the current historyId of the user's mailbox."""
+    profile = call_with_rate_limit(
+        gmail_service.users().getProfile(userId="me").execute,
+        service_keys("gmail", gmail_service),
+    )
+    return profile["historyId"]
 
 
-def get_messages_and_next_page_token(gmail_service, after_date_string, next_page_token=None, batch_size=10):
+def get_messages_and_next_page_token(
+    gmail_service, after_date_string, next_page_token=None, batch_size=10
+):
     """Fetch messages from Gmail after a specific date.
     Returns a list of messages and the next page token [message, nextPageToken].
-    If any error happens during getting messages, return empty list with none for 
-    next page token"""
+    Raises HttpError once retries are exhausted, rather than ending the listing
+    early, so the fetch can resume from its last committed page."""
+    request = (
+        gmail_service.users()
+        .messages()
+        .list(
+            userId="me",
+            q=f"after:{after_date_string}",
+            maxResults=batch_size,
+            pageToken=next_page_token,
+        )
+    )
+    results = call_with_rate_limit(
+        request.execute, service_keys("gmail", gmail_service), GMAIL_LIST_COST
+    )
+    return results.get("messages", []), results.get("nextPageToken")
+
+
+def get_history_messages_and_next_page_token(
+    gmail_service, start_history_id, next_page_token=None, batch_size=10
+):
+    """Fetch messages added to the mailbox since a stored historyId.
+    Returns a list of messages and the next page token [message, nextPageToken].
+    Raises HistoryExpiredError when Gmail no longer has history that old, other
+    errors like get_messages_and_next_page_token."""
     try:
-        results = (
+        request = (
             gmail_service.users()
-            .messages()
+            .history()
             .list(
                 userId="me",
-                q=f"after:{after_date_string}",
+                startHistoryId=start_history_id,
+                historyTypes="messageAdded",
                 maxResults=batch_size,
                 pageToken=next_page_token,
             )
-            .execute()
         )
-        return results.get("messages", []), results.get("nextPageToken")
+        results = call_with_rate_limit(
+            request.execute, service_keys("gmail", gmail_service), GMAIL_HISTORY_COST
+        )
     except HttpError as error:
-        print(f"An error occurred while fetching messages: {error}")
-        return [], None
+        if error.resp.status == 404:
+            raise HistoryExpiredError(start_history_id) from error
+        raise
+
+    messages = []
+    seen_ids = set()
+    for record in results.get("history", []):
+        for added in record.get("messagesAdded", []):
+            message = added["message"]
+            if message["id"] in seen_ids:
+                continue
+            if SKIPPED_HISTORY_LABELS.intersection(message.get("labelIds", [])):
+                continue
+            seen_ids.add(message["id"])
+            messages.append({"id": message["id"], "threadId": message["threadId"]})
+    return messages, results.get("nextPageToken")
+
+
+def list_message_page(gmail_service, sync_state, next_page_token, batch_size):
+    """List one page of messages to process for this fetch.
+    Uses the history API while sync_state holds a start_history_id, and falls
+    back to an after-date scan from the first page once that history expired."""
+    if sync_state["start_history_id"]:
+        try:
+            return get_history_messages_and_next_page_token(
+                gmail_service,
+                sync_state["start_history_id"],
+                next_page_token,
+                batch_size,
+            )
+        except HistoryExpiredError:
+            print(
+                f"History id {sync_state['start_history_id']} expired, fetching "
+                f"emails after {sync_state['after_date_string']} instead."
+            )
+            sync_state["start_history_id"] = None
+            next_page_token = None
+    return get_messages_and_next_page_token(
+        gmail_service, sync_state["after_date_string"], next_page_token, batch_size
+    )
 
 
-def classify_email(gmail_service, user, msg, curr_job_count):
-    msg_data = (
-        gmail_service.users()
-        .messages()
-        .get(userId="me", id=msg["id"], format="raw")
-        .execute()
-    )
+def _download_round(gmail_service, messages, message_format, params, can_retry):
+    """One pass of batch requests over messages. Returns the payloads that
+    came back, the ids worth retrying and the errors that made them so."""
+    payloads = {}
+    retry_errors = {}
+    keys = service_keys("gmail", gmail_service)
+
+    def _on_response(request_id, response, exception):
+        if exception is None:
+            payloads[request_id] = response
+        elif can_retry and is_retryable(exception):
+            retry_errors[request_id] = exception
+        else:
+            print(
+                f"An error occurred while downloading message {request_id}: {exception}"
+            )
+
+    for start in range(0, len(messages), GMAIL_BATCH_LIMIT):
+        chunk = messages[start : start + GMAIL_BATCH_LIMIT]
+        batch = gmail_service.new_batch_http_request(callback=_on_response)
+        for msg in chunk:
+            batch.add(
+                gmail_service.users()
+                .messages()
+                .get(userId="me", id=msg["id"], format=message_format, **params),
+                request_id=msg["id"],
+            )
+        acquire(keys, GMAIL_GET_COST * len(chunk))
+        try:
+            batch.execute()
+        except HttpError as error:
+            if not (can_retry and is_retryable(error)):
+                print(f"An error occurred while downloading a message batch: {error}")
+                continue
+            retry_errors.update((msg["id"], error) for msg in chunk)
+    return payloads, retry_errors
+
+
+def download_messages(gmail_service, messages, message_format="raw", **params):
+    """Download message payloads through Gmail's batch endpoint.
+    Each HTTP call carries up to GMAIL_BATCH_LIMIT sub-requests; params are
+    passed on to messages().get (e.g. fields, metadataHeaders). Sub-requests
+    that hit a rate limit or server error are retried in a later batch with
+    backoff. Returns a dict mapping message id to its payload; messages that
+    fail to download are reported and left out so one bad item does not sink
+    the page."""
+    payloads = {}
+    pending = messages
+    for attempt in range(MAX_RETRIES + 1):
+        received, retry_errors = _download_round(
+            gmail_service, pending, message_format, params, attempt < MAX_RETRIES
+        )
+        payloads.update(received)
+        if not retry_errors:
+            break
+        error = next(iter(retry_errors.values()))
+        delay = backoff_delay(attempt, error)
+        if is_rate_limited(error):
+            throttle(service_keys("gmail", gmail_service)[-1:], delay)
+        print(f"Retrying {len(retry_errors)} messages in {delay:.1f}s after: {error}")
+        time.sleep(delay)
+        pending = [msg for msg in pending if msg["id"] in retry_errors]
+    return payloads
+
+
+def parse_message(msg_data):
+    """Decode a raw Gmail message into the fields used for classification.
+    Returns None when the message has no raw content."""
     if "raw" not in msg_data:
-        print(f"Message {msg['id']} does not have raw content, skipping.")
-        return None, None, None, None
+        print(f"Message {msg_data.get('id')} does not have raw content, skipping.")
+        return None
 
     mime_msg = email.message_from_bytes(base64.urlsafe_b64decode(msg_data["raw"]))
-    sender = mime_msg["from"]
     subject = mime_msg["subject"] if mime_msg["subject"] else "No Subject"
+    return {
+        "id": msg_data.get("id"),
+        "thread_id": msg_data.get("threadId"),
+        "internal_date": int(msg_data.get("internalDate", 0)),
+        "label_ids": msg_data.get("labelIds", []),
+        "headers": {name.lower(): value for name, value in mime_msg.items()},
+        "sender": mime_msg["from"],
+        "subject": subject,
+        "body": body_normalizer.normalize(subject, extract_body(mime_msg)),
+    }
+
+
+def _header_dict(payload):
+    return {
+        header["name"].lower(): header["value"] for header in payload.get("headers", [])
+    }
+
+
+def _walk_payload(part):
+    yield part
+    for child in part.get("parts", []):
+        yield from _walk_payload(child)
+
+
+def _payload_part_bytes(part, max_bytes):
+    prefix = _base64_prefix(part["body"]["data"], max_bytes)
+    # The data may come without its padding
+    return base64.urlsafe_b64decode(prefix + "=" * (-len(prefix) % 4))[:max_bytes]
+
+
+def extract_payload_body(payload, max_bytes=None):
+    """extract_body for the parsed payload of a format="full" message, with
+    the same rules: text/plain first, HTML otherwise, at most max_bytes."""
+    if max_bytes is None:
+        max_bytes = int(os.getenv("BODY_MAX_BYTES", 64 * 1024))
+
+    text_parts = [
+        part
+        for part in _walk_payload(payload)
+        if part.get("mimeType") in TEXT_CONTENT_TYPES
+        and not part.get("filename")
+        and part.get("body", {}).get("data")
+    ]
+    plain_parts = [p for p in text_parts if p["mimeType"] == "text/plain"]
 
-    # Extract email body
-    body = extract_body(mime_msg)
-
-    # Extract job application data
-    (
-        is_job_application_email,
-        job_title,
-        company_name,
-        application_status,
-    ) = extract_email_data(subject, body)
-
-    if is_job_application_email:
-        job_applied, created = JobApplied.objects.get_or_create(
-            user=user,
-            job_title=job_title,
-            company=company_name,
-            defaults={
-                "status": application_status,
-                "sender_email": sender,
-                "row_number": curr_job_count + 1,
-            },
+    contents = []
+    remaining = max_bytes
+    for part in plain_parts or text_parts:
+        if remaining <= 0:
+            break
+        data = _payload_part_bytes(part, remaining)
+        remaining -= len(data)
+        match = CHARSET_RE.search(_header_dict(part).get("content-type", ""))
+        charset = match.group(1) if match else "utf-8"
+        contents.append(_decode_text(data, charset, part["mimeType"]))
+
+    return "\n".join(contents).replace("\r", "").strip()
+
+
+def parse_payload_message(msg_data):
+    """Turn a format="metadata" or format="full" Gmail message into the fields
+    used for classification. Metadata-only messages get an empty body."""
+    payload = msg_data.get("payload", {})
+    headers = _header_dict(payload)
+    subject = headers.get("subject") or "No Subject"
+    return {
+        "id": msg_data.get("id"),
+        "thread_id": msg_data.get("threadId"),
+        "internal_date": int(msg_data.get("internalDate", 0)),
+        "label_ids": msg_data.get("labelIds", []),
+        "headers": headers,
+        "sender": headers.get("from"),
+        "subject": subject,
+        "body": body_normalizer.normalize(subject, extract_payload_body(payload)),
+    }
+
+
+def download_emails(gmail_service, messages, ledger=None):
+    """Download a page of messages for classification.
+    With GMAIL_METADATA_FIRST (the default) this is done in two phases: the
+    screening headers of every message first, then the body of only those the
+    prefilter lets through. Bodies come in format="full", which leaves out
+    attachment data. Given a MessageLedger, messages it already knows are not
+    downloaded, only the newest message of a thread is kept and the messages
+    screened out are recorded. Returns the parsed emails and how many were
+    screened out on their headers."""
+    if ledger is not None:
+        messages = ledger.filter_new(messages)
+    if os.getenv("GMAIL_METADATA_FIRST", "true").lower() != "true":
+        payloads = download_messages(gmail_service, messages)
+        emails = [
+            parse_message(payloads[msg["id"]])
+            for msg in messages
+            if msg["id"] in payloads
+        ]
+        emails = [email_data for email_data in emails if email_data]
+        _note_failed(ledger, len(messages) - len(emails))
+        return _newest_in_thread(ledger, emails), 0
+
+    metadata = download_messages(
+        gmail_service,
+        messages,
+        "metadata",
+        metadataHeaders=SCREENING_HEADERS,
+        fields=METADATA_FIELDS,
+    )
+    _note_failed(ledger, len(messages) - len(metadata))
+    screened = _newest_in_thread(
+        ledger,
+        [
+            parse_payload_message(metadata[msg["id"]])
+            for msg in messages
+            if msg["id"] in metadata
+        ],
+    )
+    candidates, screened_out = [], []
+    for email_data in screened:
+        if email_prefilter.should_download(email_data):
+            candidates.append({"id": email_data["id"]})
+        else:
+            screened_out.append(email_data)
+    if ledger is not None:
+        ledger.record(screened_out)
+
+    bodies = download_messages(gmail_service, candidates, "full", fields=FULL_FIELDS)
+    emails = [
+        parse_payload_message(bodies[msg["id"]])
+        for msg in candidates
+        if msg["id"] in bodies
+    ]
+    _note_failed(ledger, len(candidates) - len(emails))
+    return emails, len(screened_out)
+
+
+def _newest_in_thread(ledger, emails):
+    return emails if ledger is None else ledger.newest_in_thread(emails)
+
+
+def _note_failed(ledger, count):
+    if ledger is not None and count:
+        ledger.note_failed(count)
+
+
+def save_jobs(user, found_jobs):
+    """Upsert the jobs found on a page with one bulk_create.
+    found_jobs are dicts with job_title, company, status and sender_email,
+    and the internal_date of their message; a job found more than once keeps
+    the status of its newest message, whatever order the mail was listed in.
+    New jobs take the next free sheet rows, assigned in the same transaction
+    as the insert. Returns the saved jobs as sheet rows."""
+    latest = {}
+    for job in sorted(found_jobs, key=lambda job: job.get("internal_date", 0)):
+        latest[(job["job_title"] or "", job["company"] or "")] = job
+    if not latest:
+        return []
+
+    with transaction.atomic():
+        # Lock the user so concurrent fetches cannot hand out the same rows
+        User.objects.select_for_update().filter(pk=user.pk).first()
+        existing_rows = {
+            (job.job_title, job.company): job.row_number
+            for job in JobApplied.objects.filter(
+                user=user, company__in={company for _, company in latest}
+            ).only("job_title", "company", "row_number")
+        }
+        last_row = JobApplied.objects.filter(user=user).aggregate(
+            last_row=Max("row_number")
+        )["last_row"]
+        # Row 1 of the sheet is the header
+        next_row = (last_row or 1) + 1
+
+        jobs = []
+        for (job_title, company), job in latest.items():
+            row_number = existing_rows.get((job_title, company))
+            if row_number is None:
+                row_number = next_row
+                next_row += 1
+            jobs.append(
+                JobApplied(
+                    user=user,
+                    job_title=job_title,
+                    company=company,
+                    status=job["status"],
+                    sender_email=job["sender_email"],
+                    row_number=row_number,
+                )
+            )
+        JobApplied.objects.bulk_create(
+            jobs,
+            update_conflicts=True,
+            unique_fields=["user", "job_title", "company"],
+            update_fields=["status"],
         )
-        if created:
-            curr_job_count += 1
-        job_applied.status = application_status
-        job_applied.save()
+        bump_data_version(user.pk)
 
-    return job_title, company_name, application_status, job_applied
+    return [
+        {
+            "job_title": job.job_title,
+            "company": job.company,
+            "status": job.status,
+            "row_number": job.row_number,
+        }
+        for job in jobs
+    ]
 
 
-def get_emails(user):
+def _extract_in_worker(email_data):
     try:
-        # print("User is authorized:", is_user_authorized(user))
-        gmail_service = get_gmail_service(
-            user.google_access_token, user.google_refresh_token
-        )
-        # print("Gmail service obtained.")
-        sheet_service = get_googlesheet_service(
-            user.google_access_token, user.google_refresh_token
+        return extract_email_data(
+            email_data["subject"], email_data["body"], email_data["sender"]
         )
-        # print("Google Sheets service obtained.")
+    except Exception as error:
+        print(f"An error occurred while extracting message {email_data['id']}: {error}")
+        return None
+
+
+def extract_page(emails):
+    """Extract all emails. Results keep the order of emails; an email whose
+    extraction failed maps to None. With EXTRACTION_BATCH_SIZE above 1 the
+    extractor packs several emails per request, otherwise extract_email_data
+    runs for each email, at most EXTRACTION_CONCURRENCY at a time."""
+    if not emails:
+        return []
+    if int(os.getenv("EXTRACTION_BATCH_SIZE", 10)) > 1:
+        return [
+            extracted_fields(response) if isinstance(response, dict) else None
+            for response in email_extractor.get_responses(emails)
+        ]
+    concurrency = int(os.getenv("EXTRACTION_CONCURRENCY", 8))
+    # Workers query the extraction cache over a connection each
+    with WorkerPool(max_workers=min(concurrency, len(emails))) as executor:
+        return list(executor.map(_extract_in_worker, emails))
+
+
+def find_jobs(emails, ledger=None):
+    """Prefilter and classify one page of parsed emails without saving
+    anything. Returns the jobs found, in the shape save_jobs expects, and how
+    many emails the prefilter skipped. Given a MessageLedger, the emails
+    skipped and those extracted are recorded; a failed extraction is not."""
+    candidates, skipped = [], []
+    for email_data in emails:
+        if email_prefilter.should_extract(email_data):
+            candidates.append(email_data)
+        else:
+            skipped.append(email_data)
+    settled = list(skipped)
+
+    found_jobs = []
+    for email_data, extracted in zip(candidates, extract_page(candidates)):
+        if extracted is None:
+            continue
+        settled.append(email_data)
+        is_job_application_email, job_title, company_name, status = extracted
+        if is_job_application_email:
+            found_jobs.append(
+                {
+                    "job_title": job_title,
+                    "company": company_name,
+                    "status": status,
+                    "sender_email": email_data["sender"],
+                    "internal_date": email_data["internal_date"],
+                }
+            )
+    if ledger is not None:
+        ledger.record(settled)
+    _note_failed(ledger, len(emails) - len(settled))
+    return found_jobs, len(skipped)
+
+
+def classify_page(user, emails, ledger=None):
+    """Classify one page of parsed emails and save the jobs found.
+    Returns the jobs as sheet rows and how many emails the prefilter skipped."""
+    found_jobs, skipped = find_jobs(emails, ledger)
+    return save_jobs(user, found_jobs), skipped
+
+
+def get_fetch_batch_size():
+    # One batch download per page of message ids
+    return int(os.getenv("FETCH_BATCH_SIZE", GMAIL_BATCH_LIMIT))
+
+
+def start_fetch(user, gmail_service):
+    """Work out where this fetch starts. Returns the mailbox historyId to
+    record once it finishes, and the sync_state used by list_message_page."""
+    # Record the mailbox position before listing so the next fetch can
+    # resume from it with the history API
+    history_id = get_mailbox_history_id(gmail_service)
+    sync_state = {
+        "start_history_id": get_start_history_id(user),
+        "after_date_string": get_after_date(user).strftime("%Y/%m/%d"),
+    }
+    if sync_state["start_history_id"]:
+        print(f"Fetching emails since history id: {sync_state['start_history_id']}")
+    else:
+        print(f"Fetching emails after: {sync_state['after_date_string']}")
+    return history_id, sync_state
+
+
+def next_start(user, history_id, sync_state, failed):
+    """The historyId and date the FetchLog records for the next fetch to
+    start from: the mailbox position this fetch started at or, when some of
+    its messages failed, the point its listing started from, so the next
+    fetch lists them again and the ledger skips the rest."""
+    if not failed:
+        return history_id, None
+    print(f"{failed} messages failed, the next fetch starts where this one did.")
+    return sync_state["start_history_id"], get_after_date(user)
+
+
+def finish_fetch(user, jobs, history_id, fetch_date=None):
+    """Sync the jobs saved by this fetch to the Google Sheet in one write and
+    record the fetch in the FetchLog, dated fetch_date or now. Returns the
+    number of rows written."""
+    # Keyed by row so a job updated twice is written once
+    sheet_rows = {job["row_number"]: job for job in jobs}
+    if sheet_rows:
+        sheet_service = get_user_googlesheet_service(user)
         first_sheet_name = get_first_sheet_name(sheet_service, user.google_sheet_id)
-        user_job_count = get_user_job_count(user)
-        # print(f"User job count: {user_job_count}")
-        curr_job_count = user_job_count + 1
+        add_job_to_sheet(
+            sheet_service,
+            first_sheet_name,
+            list(sheet_rows.values()),
+            user.google_sheet_id,
+        )
+        print(f"Added {len(sheet_rows)} jobs to the Google Sheet.")
+
+    # Create fetch log with the current date
+    FetchLog.objects.create(
+        last_fetch_date=fetch_date or datetime.now(timezone.utc),
+        user=user,
+        history_id=history_id,
+    )
+    bump_data_version(user.pk)
+    return len(sheet_rows)
 
-        after_date = get_after_date(user)
 
-        after_date_string = after_date.strftime("%Y/%m/%d")
-        print(f"Fetching emails after: {after_date_string}")
+def get_emails(user):
+    """Run a whole fetch for the user in this process. fetch_emails_task runs
+    the same stages spread over several Celery tasks."""
+    try:
+        # print("User is authorized:", is_user_authorized(user))
+        gmail_service = get_user_gmail_service(user)
+        history_id, sync_state = start_fetch(user, gmail_service)
 
         # Pagination setup
         next_page_token = None
         total_fetched = 0
-        batch_size = int(os.getenv("FETCH_BATCH_SIZE", 10))  # Adjust as needed
+        total_skipped = 0
+        jobs = []
+        batch_size = get_fetch_batch_size()
+        ledger = MessageLedger(user)
 
         # This loop will stop if next page token is None
         while True:
-            messages, next_page_token = get_messages_and_next_page_token(
-                gmail_service, after_date_string, next_page_token, batch_size
+            messages, next_page_token = list_message_page(
+                gmail_service, sync_state, next_page_token, batch_size
             )
             print(f"Fetched {len(messages)} messages in this batch.")
             total_fetched += len(messages)
 
-            job_list = []
-            for msg in messages:
-                job_title, company_name, application_status, job_applied = (
-                    classify_email(gmail_service, user, msg, curr_job_count)
-                )
-                if job_title:
-                    job_list.append(
-                        {
-                            "job_title": job_title,
-                            "company": company_name,
-                            "status": application_status,
-                            "row_number": job_applied.row_number,
-                        }
-                    )
-
-            # Add jobs to the Google Sheet for this batch
-            if job_list:
-                add_job_to_sheet(
-                    sheet_service, first_sheet_name, job_list, user.google_sheet_id
-                )
-                print(f"Added {len(job_list)} jobs to the Google Sheet.")
+            emails, screened_out = download_emails(gmail_service, messages, ledger)
+            print(f"Downloaded {len(emails)} of {len(messages)} messages.")
+
+            page_jobs, skipped = classify_page(user, emails, ledger)
+            ledger.save()
+            jobs.extend(page_jobs)
+            total_skipped += screened_out + skipped
 
             # Check for next page
             if not next_page_token:
                 break  # No more pages
 
-        # Create fetch log with the current date
-        FetchLog.objects.create(last_fetch_date=datetime.now(timezone.utc), user=user)
+        history_id, fetch_date = next_start(user, history_id, sync_state, ledger.failed)
+        finish_fetch(user, jobs, history_id, fetch_date=fetch_date)
         print(f"Total emails fetched: {total_fetched}")
+        print(f"Emails skipped by the prefilter: {total_skipped}")
 
     except HttpError as error:
         print(f"An error occurred: {error}")
 
 
-def extract_email_data(subject, body):
-    response = openai_extractor.get_response(subject, body)
+def extract_email_data(subject, body, sender=None):
+    response = email_extractor.get_response(subject, body, sender)
+    return extracted_fields(response)
+
+
+def extracted_fields(response):
+    """The fields of an extractor response that find_jobs uses."""
     job_title = response.get("job_title", None)
     company_name = response.get("company_name", None)
     application_status = response.get("status", None)
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import re
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import ExtractionCache
+from .parsers import Extractor
+
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """Lower-case and collapse whitespace so trivial differences share a key."""
+    return WHITESPACE_RE.sub(" ", text or "").strip().lower()
+
+
+def make_cache_key(email_subject, email_body, model, prompt_version):
+    """Hash the normalized email together with the model and prompt version."""
+    content = "\x1f".join(
+        [
+            str(model),
+            str(prompt_version),
+            normalize_text(email_subject),
+            normalize_text(email_body),
+        ]
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class CachedExtractor(Extractor):
+    """Wrap an extractor with a database cache of its responses.
+
+    Entries expire after EXTRACTION_CACHE_TTL_DAYS and the table is pruned to
+    EXTRACTION_CACHE_MAX_ENTRIES, oldest first, every PRUNE_EVERY writes.
+    """
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, extractor):
+        self.extractor = extractor
+        self.model = getattr(extractor, "model", type(extractor).__name__)
+        self.prompt_version = getattr(extractor, "prompt_version", "")
+        # Extractors that answer lists through another prompt key them apart
+        self.batch_prompt_version = getattr(
+            extractor, "batch_prompt_version", self.prompt_version
+        )
+        self.ttl = timedelta(days=int(os.getenv("EXTRACTION_CACHE_TTL_DAYS", 30)))
+        self.max_entries = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", 100000))
+        self.enabled = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+
+    def get_response(self, email_subject, email_body):
+        if not self.enabled:
+            return self.extractor.get_response(email_subject, email_body)
+
+        key = make_cache_key(email_subject, email_body, self.model, self.prompt_version)
+        entry = ExtractionCache.objects.filter(
+            key=key, created_at__gte=timezone.now() - self.ttl
+        ).first()
+        if entry is not None:
+            self.hits += 1
+            return entry.response
+
+        self.misses += 1
+        response = self.extractor.get_response(email_subject, email_body)
+        if isinstance(response, dict):
+            self._store(key, response)
+        return response
+
+    def get_responses(self, emails):
+        """Look the emails up in one query and pass the misses on to the
+        wrapped extractor in one call, so it can batch them. Answers are keyed
+        by the extractor's batch_prompt_version."""
+        if not self.enabled:
+            return self.extractor.get_responses(emails)
+
+        keys = [
+            make_cache_key(
+                email_data["subject"],
+                email_data["body"],
+                self.model,
+                self.batch_prompt_version,
+            )
+            for email_data in emails
+        ]
+        cached = dict(
+            ExtractionCache.objects.filter(
+                key__in=set(keys), created_at__gte=timezone.now() - self.ttl
+            ).values_list("key", "response")
+        )
+        responses = [cached.get(key) for key in keys]
+        missed = [position for position, key in enumerate(keys) if key not in cached]
+        self.hits += len(keys) - len(missed)
+        self.misses += len(missed)
+
+        extracted = self.extractor.get_responses([emails[i] for i in missed])
+        for position, response in zip(missed, extracted):
+            responses[position] = response
+            if isinstance(response, dict):
+                self._store(keys[position], response)
+        return responses
+
+    def _store(self, key, response):
+        ExtractionCache.objects.update_or_create(
+            key=key, defaults={"response": response, "created_at": timezone.now()}
+        )
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        """Delete expired entries and the oldest ones beyond max_entries."""
+        ExtractionCache.objects.filter(
+            created_at__lt=timezone.now() - self.ttl
+        ).delete()
+        boundary = (
+            ExtractionCache.objects.order_by("-created_at")
+            .values_list("created_at", flat=True)[
+                self.max_entries - 1 : self.max_entries
+            ]
+            .first()
+        )
+        if boundary is not None:
+            ExtractionCache.objects.filter(created_at__lt=boundary).delete()
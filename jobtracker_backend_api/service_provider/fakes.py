@@ -0,0 +1,635 @@
+"""In-process stand-ins for the Gmail, Sheets and OpenAI clients, used to run
+and measure the fetch path offline. Each fake mimics the call shapes the
+service modules use, sleeps for a configurable latency and can fail a share
+of its calls, and counts every API call it serves."""
+
+import base64
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from email.message import EmailMessage
+from types import SimpleNamespace
+
+import httplib2
+import httpx
+import openai
+from googleapiclient.errors import HttpError
+
+# Gmail rejects batches with more sub-requests than this
+GMAIL_MAX_BATCH_SIZE = 100
+
+# Header and subject of each email in a batched OpenAI prompt
+BATCH_EMAIL_RE = re.compile(r"^### Email (\d+)\nSubject: (.*)$", re.MULTILINE)
+
+COMPANIES = [
+    "Acme",
+    "Globex",
+    "Initech",
+    "Umbrella",
+    "Stark Industries",
+    "Wayne Enterprises",
+    "Hooli",
+    "Pied Piper",
+    "Vandelay Industries",
+    "Soylent",
+    "Tyrell",
+    "Cyberdyne",
+    "Wonka Industries",
+    "Massive Dynamic",
+    "Aperture Science",
+    "Oscorp",
+    "Gringotts",
+    "Monarch Solutions",
+    "Nakatomi Trading",
+    "Blue Sun",
+]
+
+JOB_TITLES = [
+    "Software Engineer",
+    "Backend Engineer",
+    "Data Engineer",
+    "Frontend Developer",
+    "Machine Learning Engineer",
+    "Site Reliability Engineer",
+    "Product Manager",
+    "Data Analyst",
+    "QA Engineer",
+    "DevOps Engineer",
+]
+
+ATS_SENDERS = [
+    "no-reply@us.greenhouse-mail.io",
+    "no-reply@hire.lever.co",
+    "{slug}@myworkday.com",
+    "notifications@smartrecruiters.com",
+    "no-reply@ashbyhq.com",
+]
+
+JOB_TEMPLATES = {
+    "applied": (
+        "Thank you for applying to {title} at {company}",
+        "Hi there,\n\nThank you for your interest in {company}. We have received "
+        "your application for the {title} position and our hiring team will "
+        "review it shortly. If your experience is a match we will reach out "
+        "about next steps.\n\nBest regards,\nThe {company} Recruiting Team",
+    ),
+    "interview": (
+        "Interview invitation: {title} at {company}",
+        "Hello,\n\nThanks again for applying for the {title} role. We would like "
+        "to invite you to a 45 minute interview with the team. Please use the "
+        "link below to pick a time that works for you.\n\n{company} Talent "
+        "Acquisition",
+    ),
+    "offer": (
+        "Your offer letter for {title} - {company}",
+        "Congratulations!\n\nWe are delighted to extend you an offer for the "
+        "{title} position at {company}. Your offer letter is attached; please "
+        "review and sign it within five business days.\n\nWarm regards,\n"
+        "{company} People Team",
+    ),
+    "rejected": (
+        "Update on your application for {title} at {company}",
+        "Dear candidate,\n\nThank you for the time you invested in applying to "
+        "{company}. Unfortunately, we have decided not to move forward with "
+        "your candidacy for the {title} role at this time. We wish you the "
+        "best in your search.\n\nSincerely,\nThe {company} Hiring Team",
+    ),
+}
+
+# What real application mail carries besides its message: a tracking link,
+# a legal footer and, in replies, the quoted thread
+TRACKING_LINK = (
+    "You can check the status of your application at any time: "
+    "https://{slug}.example-ats.com/candidate/applications/{token}"
+    "?utm_source=notification&utm_medium=email&utm_campaign=status_{token}"
+)
+LEGAL_FOOTER = (
+    "This email and any attachments are confidential and intended solely for "
+    "the use of the individual to whom they are addressed. If you have "
+    "received this email in error, please notify the sender and delete it. "
+    "{company} is an equal opportunity employer and does not discriminate on "
+    "the basis of race, religion, color, sex, age, disability or any other "
+    "protected characteristic.\n\n"
+    "\u00a9 2025 {company}. All rights reserved. Privacy Policy: "
+    "https://www.{slug}.com/legal/privacy?utm_source=email | Unsubscribe: "
+    "https://{slug}.example-ats.com/unsubscribe/{token}"
+)
+QUOTE_HEADER = "On Mon, Jan 6, 2025 at 9:30 AM {company} Recruiting wrote:"
+
+# Mail that is not about an application: subject, body, sender, labels, and
+# whether the message is HTML only with a List-Unsubscribe header
+OTHER_TEMPLATES = [
+    (
+        "{n} new jobs for you: {title}",
+        "Recommended jobs based on your profile. {title} at {company} and {n} "
+        "more openings near you. Manage your job alert settings.",
+        "jobalerts-noreply@linkedin.com",
+        ["INBOX", "CATEGORY_UPDATES"],
+        True,
+    ),
+    (
+        "This week at {company}: {n}% off everything",
+        "Our biggest sale of the season is here. Take {n}% off everything in "
+        "store and online. Sale ends Sunday. Shop the newsletter picks below.",
+        "newsletter@shop.example.com",
+        ["INBOX", "CATEGORY_PROMOTIONS"],
+        True,
+    ),
+    (
+        "Your order #{n}{n} has shipped",
+        "Good news! Your order has shipped and is on its way. Track your "
+        "package below. Order total and receipt details are attached.",
+        "orders@store.example.com",
+        ["INBOX", "CATEGORY_UPDATES"],
+        False,
+    ),
+    (
+        "{name} commented on your post",
+        "{name} and {n} others commented on your post. See what they said and "
+        "reply to keep the conversation going.",
+        "notifications@social.example.com",
+        ["INBOX", "CATEGORY_SOCIAL"],
+        True,
+    ),
+    (
+        "Security alert for your account",
+        "A new sign-in to your account was detected. If this was you, you "
+        "don't need to do anything. Otherwise please reset your password.",
+        "no-reply@accounts.example.com",
+        ["INBOX", "CATEGORY_UPDATES"],
+        False,
+    ),
+    (
+        "Lunch on {day}?",
+        "Hey, are you free for lunch on {day}? There is a new place near the "
+        "office I have been wanting to try. Let me know!\n\n{name}",
+        "{name_slug}@gmail.com",
+        ["INBOX", "CATEGORY_PERSONAL"],
+        False,
+    ),
+    (
+        "Invitation: webinar on scaling {title} teams",
+        "Join our free webinar next Thursday to hear how leading companies "
+        "scale their teams. Register now, seats are limited.",
+        "events@webinars.example.com",
+        ["INBOX", "CATEGORY_PROMOTIONS"],
+        True,
+    ),
+]
+
+NAMES = ["Alex", "Sam", "Jordan", "Taylor", "Morgan", "Riley", "Casey", "Jamie"]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+
+HTML_FOOTER = (
+    "<table width='100%' style='font-family:Arial;color:#888;font-size:11px'>"
+    "<tr><td>You are receiving this email because of your account settings. "
+    "<a href='https://example.com/preferences'>Manage preferences</a> | "
+    "<a href='https://example.com/unsubscribe'>Unsubscribe</a></td></tr>"
+    "<tr><td>123 Main Street, Springfield</td></tr></table>"
+)
+
+
+def _slug(text):
+    return "".join(ch for ch in text.lower() if ch.isalnum())
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).decode("ascii")
+
+
+def _to_html(text, padding):
+    paragraphs = "".join(
+        f"<p style='margin:0 0 12px 0;line-height:1.5'>{line}</p>"
+        for line in text.split("\n")
+        if line
+    )
+    # Marketing mail carries far more markup than text
+    filler = "<div style='display:none'>&nbsp;&zwnj;</div>" * padding
+    return (
+        "<html><head><style>body{margin:0;padding:0}</style></head><body>"
+        f"<table width='600' align='center'><tr><td>{paragraphs}</td></tr>"
+        f"</table>{filler}{HTML_FOOTER}</body></html>"
+    )
+
+
+class SyntheticMailbox:
+    """A reproducible mailbox of job application mail mixed with alerts,
+    marketing, receipts, social and personal mail. Every message records the
+    answer the extractor should give for it."""
+
+    def __init__(self, size=10000, job_ratio=0.2, seed=0):
+        rng = random.Random(seed)
+        # Separate, so the clutter leaves the rest of the mailbox as it was
+        clutter = random.Random(f"clutter-{seed}")
+        self.messages = []
+        self.by_id = {}
+        self.truth = {}
+        for index in range(size):
+            if rng.random() < job_ratio:
+                message = self._job_message(rng, clutter)
+            else:
+                message = self._other_message(rng)
+            message["id"] = f"{index + 1:016x}"
+            message["threadId"] = message["id"]
+            message["historyId"] = index + 1
+            # One message a minute, oldest first
+            message["internalDate"] = 1735689600000 + index * 60000
+            self.messages.append(message)
+            self.by_id[message["id"]] = message
+            self.truth[message["subject"]] = message["truth"]
+
+    def _job_message(self, rng, clutter):
+        company = rng.choice(COMPANIES)
+        title = rng.choice(JOB_TITLES)
+        status = rng.choice(list(JOB_TEMPLATES))
+        subject, text = JOB_TEMPLATES[status]
+        sender = rng.choice(ATS_SENDERS + ["careers@{slug}.com"])
+        values = {
+            "title": title,
+            "company": company,
+            "slug": _slug(company),
+            "token": f"{clutter.getrandbits(128):032x}",
+        }
+        return {
+            "subject": subject.format(**values),
+            "sender": f"{company} <{sender.format(**values)}>",
+            "labelIds": ["INBOX", "CATEGORY_UPDATES"],
+            "text": self._cluttered(text.format(**values), values, clutter),
+            "html_only": False,
+            "padding": rng.randint(0, 20),
+            "truth": {
+                "is_job_application_email": True,
+                "job_title": title,
+                "company_name": company,
+                "status": status,
+            },
+        }
+
+    def _cluttered(self, text, values, clutter):
+        paragraphs = [text]
+        if clutter.random() < 0.5:
+            paragraphs.append(TRACKING_LINK.format(**values))
+        if clutter.random() < 0.6:
+            paragraphs.append(LEGAL_FOOTER.format(**values))
+        if clutter.random() < 0.3:
+            quoted = JOB_TEMPLATES["applied"][1].format(**values)
+            for _ in range(clutter.randint(1, 3)):
+                quoted = "\n".join(
+                    [QUOTE_HEADER.format(**values)]
+                    + [f"> {line}" for line in quoted.split("\n")]
+                )
+            paragraphs.append(quoted)
+        return "\n\n".join(paragraphs)
+
+    def _other_message(self, rng):
+        subject, text, sender, labels, marketing = rng.choice(OTHER_TEMPLATES)
+        name = rng.choice(NAMES)
+        values = {
+            "n": rng.randint(2, 99),
+            "title": rng.choice(JOB_TITLES),
+            "company": rng.choice(COMPANIES),
+            "name": name,
+            "name_slug": _slug(name),
+            "day": rng.choice(DAYS),
+        }
+        return {
+            "subject": subject.format(**values),
+            "sender": sender.format(**values),
+            "labelIds": labels,
+            "text": text.format(**values),
+            "html_only": marketing,
+            "padding": rng.randint(100, 400) if marketing else rng.randint(0, 20),
+            "truth": {"is_job_application_email": False},
+        }
+
+    @property
+    def expected_jobs(self):
+        """Distinct (job_title, company) pairs a perfect fetch saves."""
+        return {
+            (m["truth"]["job_title"], m["truth"]["company_name"])
+            for m in self.messages
+            if m["truth"]["is_job_application_email"]
+        }
+
+    def headers(self, message):
+        headers = [
+            ("From", message["sender"]),
+            ("To", "me@example.com"),
+            ("Subject", message["subject"]),
+            ("Date", "Mon, 6 Jan 2025 09:30:00 +0000"),
+            ("Message-ID", f"<{message['id']}@mail.example.com>"),
+        ]
+        if message["html_only"]:
+            headers.append(("List-Unsubscribe", "<https://example.com/unsubscribe>"))
+        return headers
+
+    def html(self, message):
+        return _to_html(message["text"], message["padding"])
+
+    def raw(self, message):
+        mime_msg = EmailMessage()
+        for name, value in self.headers(message):
+            mime_msg[name] = value
+        if message["html_only"]:
+            mime_msg.set_content(self.html(message), subtype="html")
+        else:
+            mime_msg.set_content(message["text"])
+            mime_msg.add_alternative(self.html(message), subtype="html")
+        return mime_msg.as_bytes()
+
+    def payload(self, message):
+        """The parsed payload Gmail returns for format="full"."""
+        html_part = {
+            "mimeType": "text/html",
+            "headers": [
+                {"name": "Content-Type", "value": 'text/html; charset="utf-8"'}
+            ],
+            "body": {"data": _b64(self.html(message).encode("utf-8"))},
+        }
+        headers = [{"name": n, "value": v} for n, v in self.headers(message)]
+        if message["html_only"]:
+            return dict(html_part, headers=headers)
+        text_part = {
+            "mimeType": "text/plain",
+            "headers": [
+                {"name": "Content-Type", "value": 'text/plain; charset="utf-8"'}
+            ],
+            "body": {"data": _b64(message["text"].encode("utf-8"))},
+        }
+        return {
+            "mimeType": "multipart/alternative",
+            "headers": headers,
+            "parts": [text_part, html_part],
+        }
+
+
+class FakeAPI:
+    """Latency, error injection and call counting shared by the fakes.
+    error_rate is the share of calls that fail with a retryable error."""
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.calls[name] += amount
+
+    def fails(self):
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+    def wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+
+def _http_error(status, reason):
+    content = json.dumps({"error": {"code": status, "message": reason}})
+    return HttpError(httplib2.Response({"status": status}), content.encode())
+
+
+class FakeRequest:
+    """A googleapiclient HttpRequest: one API call per execute attempt."""
+
+    def __init__(self, api, name, handler):
+        self.api = api
+        self.name = name
+        self.handler = handler
+
+    def execute(self, num_retries=0):
+        for attempt in range(num_retries + 1):
+            self.api.count(self.name)
+            self.api.wait()
+            if not self.api.fails():
+                return self.handler()
+            self.api.count("errors")
+        raise _http_error(503, "Backend Error")
+
+
+class FakeBatch:
+    """A Gmail batch request: one HTTP call carrying every sub-request, each
+    of which can fail on its own."""
+
+    def __init__(self, api, callback):
+        self.api = api
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        if len(self.requests) == GMAIL_MAX_BATCH_SIZE:
+            raise ValueError(f"Batches hold at most {GMAIL_MAX_BATCH_SIZE} requests")
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        self.api.count("gmail.batch")
+        self.api.wait()
+        for request_id, request in self.requests:
+            self.api.count(request.name)
+            if self.api.fails():
+                self.api.count("errors")
+                self.callback(request_id, None, _http_error(429, "Rate Limit"))
+            else:
+                self.callback(request_id, request.handler(), None)
+
+
+class FakeGmailService(FakeAPI):
+    """The users().messages(), users().history(), users().getProfile() and
+    users().watch() calls of the Gmail API over a SyntheticMailbox. Searches ignore the query
+    and list every message; field masks are not applied."""
+
+    def __init__(self, mailbox, **kwargs):
+        super().__init__(**kwargs)
+        self.mailbox = mailbox
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def history(self):
+        return SimpleNamespace(list=self._list_history)
+
+    def getProfile(self, userId):
+        return FakeRequest(
+            self,
+            "gmail.users.getProfile",
+            lambda: {
+                "emailAddress": "me@example.com",
+                "historyId": str(len(self.mailbox.messages)),
+            },
+        )
+
+    def watch(self, userId, body):
+        return FakeRequest(
+            self,
+            "gmail.users.watch",
+            lambda: {
+                "historyId": str(len(self.mailbox.messages)),
+                # Gmail watches last 7 days, in epoch milliseconds
+                "expiration": str(int((time.time() + 7 * 24 * 3600) * 1000)),
+            },
+        )
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(self, callback)
+
+    def list(self, userId, q=None, maxResults=100, pageToken=None):
+        start = int(pageToken or 0)
+        page = self.mailbox.messages[start : start + maxResults]
+
+        def handler():
+            result = {
+                "messages": [{"id": m["id"], "threadId": m["threadId"]} for m in page],
+                "resultSizeEstimate": len(page),
+            }
+            if start + maxResults < len(self.mailbox.messages):
+                result["nextPageToken"] = str(start + maxResults)
+            return result
+
+        return FakeRequest(self, "gmail.messages.list", handler)
+
+    def _list_history(
+        self, userId, startHistoryId, historyTypes=None, maxResults=100, pageToken=None
+    ):
+        added = [
+            m for m in self.mailbox.messages if m["historyId"] > int(startHistoryId)
+        ]
+        start = int(pageToken or 0)
+        page = added[start : start + maxResults]
+
+        def handler():
+            result = {
+                "history": [
+                    {
+                        "id": str(m["historyId"]),
+                        "messagesAdded": [
+                            {
+                                "message": {
+                                    "id": m["id"],
+                                    "threadId": m["threadId"],
+                                    "labelIds": m["labelIds"],
+                                }
+                            }
+                        ],
+                    }
+                    for m in page
+                ],
+                "historyId": str(len(self.mailbox.messages)),
+            }
+            if start + maxResults < len(added):
+                result["nextPageToken"] = str(start + maxResults)
+            return result
+
+        return FakeRequest(self, "gmail.history.list", handler)
+
+    def get(self, userId, id, format="full", metadataHeaders=None, fields=None):
+        message = self.mailbox.by_id[id]
+
+        def handler():
+            result = {
+                "id": message["id"],
+                "threadId": message["threadId"],
+                "labelIds": message["labelIds"],
+                "internalDate": str(message["internalDate"]),
+            }
+            if format == "raw":
+                result["raw"] = _b64(self.mailbox.raw(message))
+            elif format == "metadata":
+                wanted = {name.lower() for name in metadataHeaders or []}
+                result["payload"] = {
+                    "headers": [
+                        {"name": name, "value": value}
+                        for name, value in self.mailbox.headers(message)
+                        if not wanted or name.lower() in wanted
+                    ]
+                }
+            else:
+                result["payload"] = self.mailbox.payload(message)
+            return result
+
+        return FakeRequest(self, "gmail.messages.get", handler)
+
+
+class FakeSheetsService(FakeAPI):
+    """The spreadsheets().get() and spreadsheets().values().batchUpdate()
+    calls of the Sheets API. Written cells are kept in self.cells."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.cells = {}
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, spreadsheetId):
+        return FakeRequest(
+            self,
+            "sheets.spreadsheets.get",
+            lambda: {"sheets": [{"properties": {"title": "Sheet1"}}]},
+        )
+
+    def batchUpdate(self, spreadsheetId, body):
+        def handler():
+            for item in body["data"]:
+                self.cells[item["range"]] = item["values"]
+            return {"totalUpdatedRanges": len(body["data"])}
+
+        return FakeRequest(self, "sheets.values.batchUpdate", handler)
+
+
+class FakeOpenAI(FakeAPI):
+    """client.chat.completions.create() answering from the mailbox's ground
+    truth, keyed by subject. Usage reports roughly four characters a token."""
+
+    def __init__(self, mailbox, **kwargs):
+        super().__init__(**kwargs)
+        self.mailbox = mailbox
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, **kwargs):
+        self.count("openai.chat.completions")
+        self.wait()
+        if self.fails():
+            self.count("errors")
+            raise openai.APIConnectionError(
+                request=httpx.Request("POST", "https://api.openai.com/v1/chat")
+            )
+        prompt = messages[-1]["content"]
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        self.count("openai.prompt_tokens", prompt_tokens)
+        batch = BATCH_EMAIL_RE.findall(prompt)
+        if batch:
+            answer = {
+                "results": [
+                    {"index": int(number), **self.answer(subject)}
+                    for number, subject in batch
+                ]
+            }
+        else:
+            answer = self.answer(prompt.partition("\n")[0].removeprefix("Subject: "))
+        return SimpleNamespace(
+            choices=[
+                SimpleNamespace(
+                    message=SimpleNamespace(content=json.dumps(answer)),
+                    finish_reason="stop",
+                )
+            ],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=25 * max(len(batch), 1),
+            ),
+        )
+
+    def answer(self, subject):
+        return self.mailbox.truth.get(subject, {"is_job_application_email": False})
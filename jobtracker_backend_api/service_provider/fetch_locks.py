@@ -0,0 +1,36 @@
+import os
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import FetchLock
+
+
+def _lock_timeout():
+    # A lock not refreshed for this long belongs to a worker that died mid-fetch
+    return timedelta(seconds=int(os.getenv("FETCH_LOCK_TIMEOUT", 2 * 60 * 60)))
+
+
+def acquire_fetch_lock(user_id, task_id):
+    """Take the user's fetch lock for task_id, unless another task holds it.
+    Returns the id of the task holding the lock afterwards, so the lock was
+    acquired (or was already held by task_id) when it equals task_id."""
+    FetchLock.objects.filter(
+        user_id=user_id, locked_at__lt=timezone.now() - _lock_timeout()
+    ).delete()
+    lock, _ = FetchLock.objects.get_or_create(
+        user_id=user_id, defaults={"task_id": task_id}
+    )
+    return lock.task_id
+
+
+def release_fetch_lock(user_id, task_id):
+    FetchLock.objects.filter(user_id=user_id, task_id=task_id).delete()
+
+
+def refresh_fetch_lock(user_id, task_id):
+    """Keep task_id's lock from going stale while its fetch makes progress,
+    so a long fetch is not taken for a dead one."""
+    FetchLock.objects.filter(user_id=user_id, task_id=task_id).update(
+        locked_at=timezone.now()
+    )
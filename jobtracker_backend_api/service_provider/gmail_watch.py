@@ -0,0 +1,97 @@
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import GmailWatch, User
+from .rate_limits import call_with_rate_limit, service_keys
+
+# users().watch costs 100 Gmail quota units
+GMAIL_WATCH_COST = 100
+
+# Watches expire after 7 days, renew those expiring within this margin
+WATCH_RENEW_MARGIN = timedelta(days=1)
+
+
+def push_enabled():
+    return bool(settings.GMAIL_PUBSUB_TOPIC)
+
+
+def start_watch(user, gmail_service):
+    """Ask Gmail to publish changes of the user's inbox to the Pub/Sub topic.
+    Calling it again renews the watch."""
+    request = gmail_service.users().watch(
+        userId="me",
+        body={"topicName": settings.GMAIL_PUBSUB_TOPIC, "labelIds": ["INBOX"]},
+    )
+    response = call_with_rate_limit(
+        request.execute, service_keys("gmail", gmail_service), GMAIL_WATCH_COST
+    )
+    expiration = datetime.fromtimestamp(
+        int(response["expiration"]) / 1000, tz=dt_timezone.utc
+    )
+    watch, _ = GmailWatch.objects.update_or_create(
+        user=user,
+        defaults={"history_id": response["historyId"], "expiration": expiration},
+    )
+    return watch
+
+
+def parse_push_message(body):
+    """Return the emailAddress and historyId of a Pub/Sub push request body.
+    Raises ValueError when it is not a Gmail notification."""
+    try:
+        data = base64.b64decode(body["message"]["data"])
+        notification = json.loads(data)
+        return notification["emailAddress"], str(notification["historyId"])
+    except (KeyError, TypeError, binascii.Error, json.JSONDecodeError) as error:
+        raise ValueError(f"Not a Gmail push notification: {error}") from error
+
+
+def record_notification(email_address, history_id):
+    """Store the historyId pushed for a watched mailbox. Returns the user id
+    when the notification is news, or None for unknown mailboxes and for
+    notifications Pub/Sub redelivered or delivered out of order."""
+    with transaction.atomic():
+        watch = (
+            GmailWatch.objects.select_for_update()
+            .filter(user__email=email_address)
+            .first()
+        )
+        if watch is None:
+            return None
+        if watch.notified_history_id and int(watch.notified_history_id) >= int(
+            history_id
+        ):
+            return None
+        watch.notified_history_id = history_id
+        watch.save(update_fields=["notified_history_id", "updated_at"])
+    return watch.user_id
+
+
+def needs_catch_up(user_id, history_id):
+    """Whether a notification newer than history_id arrived for the user,
+    e.g. while the fetch that recorded history_id was already listing."""
+    notified = (
+        GmailWatch.objects.filter(user_id=user_id)
+        .values_list("notified_history_id", flat=True)
+        .first()
+    )
+    return bool(notified and history_id and int(notified) > int(history_id))
+
+
+def get_users_to_watch():
+    """Users whose first fetch is done and who have no watch or one about to
+    expire. Active mailboxes with a live watch are not listed."""
+    return (
+        User.objects.filter(google_sheet_id__isnull=False, fetchlog__isnull=False)
+        .exclude(google_refresh_token="")
+        .exclude(gmailwatch__expiration__gt=timezone.now() + WATCH_RENEW_MARGIN)
+        .distinct()
+        .order_by("id")
+    )
@@ -1,8 +1,9 @@
 import re
-import time
 
 from googleapiclient.errors import HttpError
 
+from .rate_limits import call_with_rate_limit, service_keys
+
 
 def get_sheet_id(url):
     """Extract the Google Sheet ID from the URL."""
@@ -15,39 +16,46 @@ def get_sheet_id(url):
 
 def get_first_sheet_name(service, spreadsheet_id):
     # Get spreadsheet metadata
-    spreadsheet = service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
+    spreadsheet = call_with_rate_limit(
+        service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute,
+        service_keys("sheets", service),
+    )
     first_sheet = spreadsheet["sheets"][0]
     print(f"First sheet name: {first_sheet['properties']['title']}")
     return first_sheet["properties"]["title"]
 
 
-def add_job_to_sheet(service, first_sheet_name, job_list, SPREADSHEET_ID):
-    """Add a job to the Google Sheet."""
-    #
+def _write_rows(service, spreadsheet_id, data):
+    """Write all ranges in data with a single values().batchUpdate call.
+    Splits the batch in half and retries when the request is too large."""
+    request = (
+        service.spreadsheets()
+        .values()
+        .batchUpdate(
+            spreadsheetId=spreadsheet_id,
+            body={"valueInputOption": "RAW", "data": data},
+        )
+    )
     try:
-        for job in job_list:
-            job_title = job.get("job_title")
-            company = job.get("company")
-            status = job.get("status")
-            row_number = job.get("row_number")
-
-            # Define the spreadsheet ID and range
-            RANGE_NAME = f"{first_sheet_name}!A{row_number}:C{row_number}"  # Adjust the range as needed
-
-            # Prepare the values to be added
-            values = [[job_title, company, status]]
-            body = {"values": values}
-
-            # Append the values to the sheet
-
-            service.spreadsheets().values().update(
-                spreadsheetId=SPREADSHEET_ID,
-                range=RANGE_NAME,
-                valueInputOption="RAW",
-                body=body,
-            ).execute()
-
-            # print(f"{result.get('updates').get('updatedCells')} cells appended.")
-            time.sleep(1)
+        call_with_rate_limit(request.execute, service_keys("sheets", service))
     except HttpError as error:
-        print(f"An error occurred: {error}")
+        if error.resp.status != 413 or len(data) == 1:
+            raise
+        middle = len(data) // 2
+        _write_rows(service, spreadsheet_id, data[:middle])
+        _write_rows(service, spreadsheet_id, data[middle:])
+
+
+def add_job_to_sheet(service, first_sheet_name, job_list, SPREADSHEET_ID):
+    """Add jobs to the Google Sheet, one row per job at its row_number."""
+    data = [
+        {
+            "range": f"{first_sheet_name}!A{job['row_number']}:C{job['row_number']}",
+            "values": [[job.get("job_title"), job.get("company"), job.get("status")]],
+        }
+        for job in job_list
+    ]
+    if not data:
+        return
+    # Errors propagate so the fetch fails and is resumed, rewriting the rows
+    _write_rows(service, SPREADSHEET_ID, data)
@@ -0,0 +1,68 @@
+import email
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from bs4 import BeautifulSoup
+
+from ...email_services import extract_body
+
+DEFAULT_CORPUS = Path(__file__).resolve().parents[2] / "tests" / "fixtures" / "emails"
+
+
+def legacy_extract_body(mime_msg):
+    """Body extraction as it was before the streaming HTML converter: every
+    part decoded in full, HTML parsed with BeautifulSoup."""
+    contents = []
+    for part in mime_msg.walk():
+        content_type = part.get_content_type()
+        if "attachment" in str(part.get("Content-Disposition")):
+            continue
+        if content_type == "text/plain":
+            charset = part.get_content_charset() or "utf-8"
+            contents.append(part.get_payload(decode=True).decode(charset, "replace"))
+        elif content_type == "text/html":
+            charset = part.get_content_charset() or "utf-8"
+            html = part.get_payload(decode=True).decode(charset, "replace")
+            contents.append(BeautifulSoup(html, "html.parser").get_text())
+    return "\n".join(contents).replace("\n", "").replace("\r", "").strip()
+
+
+def time_per_message(func, messages, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for mime_msg in messages:
+            func(mime_msg)
+    return (time.perf_counter() - start) / (rounds * len(messages))
+
+
+class Command(BaseCommand):
+    help = "Compare CPU time per message of the current and legacy body extraction."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--corpus", default=str(DEFAULT_CORPUS))
+        parser.add_argument("--rounds", type=int, default=20)
+
+    def handle(self, *args, **options):
+        paths = sorted(Path(options["corpus"]).glob("*.eml"))
+        if not paths:
+            self.stderr.write(f"No .eml files found in {options['corpus']}")
+            return
+        messages = [email.message_from_bytes(path.read_bytes()) for path in paths]
+        rounds = options["rounds"]
+
+        self.stdout.write(f"{'message':<28}{'legacy us':>12}{'current us':>12}")
+        for path, mime_msg in zip(paths, messages):
+            legacy = time_per_message(legacy_extract_body, [mime_msg], rounds)
+            current = time_per_message(extract_body, [mime_msg], rounds)
+            self.stdout.write(
+                f"{path.name:<28}{legacy * 1e6:>12.1f}{current * 1e6:>12.1f}"
+            )
+
+        legacy = time_per_message(legacy_extract_body, messages, rounds)
+        current = time_per_message(extract_body, messages, rounds)
+        self.stdout.write(
+            f"{'mean':<28}{legacy * 1e6:>12.1f}{current * 1e6:>12.1f}"
+            f"   ({legacy / current:.1f}x faster)"
+        )
@@ -0,0 +1,228 @@
+import io
+import os
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, redirect_stdout
+from unittest.mock import patch
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ... import email_services, parsers
+from ...fakes import FakeGmailService, FakeOpenAI, FakeSheetsService, SyntheticMailbox
+from ...local_classifier import LocalClassifier
+from ...models import JobApplied, User
+
+# Stages of get_emails timed by the benchmark, in pipeline order
+STAGES = [
+    "start_fetch",
+    "list_message_page",
+    "download_emails",
+    "find_jobs",
+    "save_jobs",
+    "finish_fetch",
+]
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of values, q between 0 and 100."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+
+def _timed(func, durations):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            durations.append(time.perf_counter() - start)
+
+    return wrapper
+
+
+def run_fetch_benchmark(
+    mailbox,
+    gmail,
+    sheets,
+    openai_client,
+    env=None,
+    local_classifier=None,
+    normalize_bodies=True,
+):
+    """Run get_emails for a new user against the fakes and return the wall
+    time, per-stage durations, API call counts, body tokens and jobs saved.
+    The local classifier stage only runs when a local_classifier is given.
+    Expects to run against a throwaway database."""
+    user = User.objects.create_user(email="bench@example.com")
+    user.google_sheet_id = "bench-sheet"
+    user.save()
+
+    durations = defaultdict(list)
+    with ExitStack() as stack:
+        stack.enter_context(patch.dict(os.environ, env or {}))
+        for stage in STAGES:
+            func = getattr(email_services, stage)
+            stack.enter_context(
+                patch.object(email_services, stage, _timed(func, durations[stage]))
+            )
+        stack.enter_context(
+            patch.object(email_services, "get_user_gmail_service", lambda u: gmail)
+        )
+        stack.enter_context(
+            patch.object(
+                email_services, "get_user_googlesheet_service", lambda u: sheets
+            )
+        )
+        stack.enter_context(
+            patch.object(parsers, "get_openai_client", lambda key: openai_client)
+        )
+        # Measure the pipeline, not the database cache in front of OpenAI
+        stack.enter_context(
+            patch.object(email_services.openai_extractor, "enabled", False)
+        )
+        stack.enter_context(
+            patch.object(
+                email_services.email_extractor,
+                "classifier",
+                local_classifier or LocalClassifier(),
+            )
+        )
+        normalizer = email_services.body_normalizer
+        stack.enter_context(patch.object(normalizer, "enabled", normalize_bodies))
+        stack.enter_context(patch.object(normalizer, "stats", Counter()))
+        stack.enter_context(patch.object(normalizer, "track_tokens", True))
+        stack.enter_context(redirect_stdout(io.StringIO()))
+
+        start = time.perf_counter()
+        email_services.get_emails(user)
+        wall_time = time.perf_counter() - start
+        body_tokens = normalizer.report()
+
+    calls = gmail.calls + sheets.calls + openai_client.calls
+    return {
+        "wall_time": wall_time,
+        "durations": durations,
+        "calls": calls,
+        "body_tokens": body_tokens,
+        "jobs_saved": JobApplied.objects.filter(user=user).count(),
+        "rows_written": len(sheets.cells),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure get_emails end to end against in-process fakes of Gmail, "
+        "Sheets and OpenAI over a synthetic mailbox, in a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=10000)
+        parser.add_argument("--job-ratio", type=float, default=0.2)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--gmail-latency", type=float, default=20, help="ms")
+        parser.add_argument("--sheets-latency", type=float, default=50, help="ms")
+        parser.add_argument("--openai-latency", type=float, default=100, help="ms")
+        parser.add_argument("--error-rate", type=float, default=0.0)
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument(
+            "--extraction-batch-size",
+            type=int,
+            default=10,
+            help="Emails per OpenAI request, 1 for one request each",
+        )
+        parser.add_argument(
+            "--rate-limit",
+            action="store_true",
+            help="Use the shared rate limiter (needs a database that allows "
+            "concurrent writers, not SQLite)",
+        )
+        parser.add_argument(
+            "--raw-bodies",
+            action="store_true",
+            help="Send bodies to OpenAI without normalizing them",
+        )
+        parser.add_argument(
+            "--local-classifier",
+            help="Model file of train_local_classifier to settle mail with first",
+        )
+
+    def handle(self, *args, **options):
+        mailbox = SyntheticMailbox(
+            options["messages"], options["job_ratio"], options["seed"]
+        )
+        faults = {"error_rate": options["error_rate"], "seed": options["seed"]}
+        gmail = FakeGmailService(
+            mailbox, latency=options["gmail_latency"] / 1000, **faults
+        )
+        sheets = FakeSheetsService(latency=options["sheets_latency"] / 1000, **faults)
+        openai_client = FakeOpenAI(
+            mailbox, latency=options["openai_latency"] / 1000, **faults
+        )
+        env = {
+            "FETCH_BATCH_SIZE": str(options["batch_size"]),
+            "EXTRACTION_CONCURRENCY": str(options["concurrency"]),
+            "EXTRACTION_BATCH_SIZE": str(options["extraction_batch_size"]),
+            "RATE_LIMIT_ENABLED": str(options["rate_limit"]).lower(),
+        }
+
+        local_classifier = None
+        if options["local_classifier"]:
+            local_classifier = LocalClassifier.load(options["local_classifier"])
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            report = run_fetch_benchmark(
+                mailbox,
+                gmail,
+                sheets,
+                openai_client,
+                env,
+                local_classifier,
+                not options["raw_bodies"],
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.write_report(mailbox, report)
+
+    def write_report(self, mailbox, report):
+        messages = len(mailbox.messages)
+        wall_time = report["wall_time"]
+        job_emails = sum(
+            m["truth"]["is_job_application_email"] for m in mailbox.messages
+        )
+        self.stdout.write(f"Messages: {messages} ({job_emails} job application emails)")
+        self.stdout.write(
+            f"Wall time: {wall_time:.2f} s, {messages / wall_time:.1f} messages/s"
+        )
+        self.stdout.write(
+            f"Jobs saved: {report['jobs_saved']} of {len(mailbox.expected_jobs)} "
+            f"expected, {report['rows_written']} sheet rows written"
+        )
+        body_tokens = report["body_tokens"]
+        if body_tokens["emails"]:
+            self.stdout.write(
+                f"Body tokens: {body_tokens['tokens_in']} -> "
+                f"{body_tokens['tokens_out']} ({body_tokens['saved_share']:.1%} "
+                f"saved, {body_tokens['truncated']} bodies truncated)"
+            )
+
+        self.stdout.write("")
+        self.stdout.write(
+            f"{'stage':<20}{'calls':>8}{'total s':>10}{'p50 ms':>10}{'p99 ms':>10}"
+        )
+        for stage in STAGES:
+            values = report["durations"][stage]
+            self.stdout.write(
+                f"{stage:<20}{len(values):>8}{sum(values):>10.2f}"
+                f"{percentile(values, 50) * 1000:>10.1f}"
+                f"{percentile(values, 99) * 1000:>10.1f}"
+            )
+
+        self.stdout.write("")
+        self.stdout.write(f"{'api call':<32}{'count':>10}")
+        for name, count in sorted(report["calls"].items()):
+            self.stdout.write(f"{name:<32}{count:>10}")
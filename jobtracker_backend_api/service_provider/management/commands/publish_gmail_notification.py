@@ -0,0 +1,44 @@
+import base64
+import json
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+import requests
+
+
+def build_push_body(email_address, history_id):
+    """A Pub/Sub push request body carrying a Gmail watch notification."""
+    data = json.dumps({"emailAddress": email_address, "historyId": history_id})
+    return {
+        "message": {
+            "data": base64.b64encode(data.encode()).decode(),
+            "messageId": str(uuid.uuid4()),
+            "publishTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "subscription": "projects/local/subscriptions/gmail-push",
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Stand in for Pub/Sub: post a Gmail watch notification for a mailbox "
+        "to the push webhook of a running server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("email")
+        parser.add_argument("--history-id", type=int, default=int(time.time()))
+        parser.add_argument("--url", default="http://localhost:8000/gmail/push/")
+        parser.add_argument("--token", default=settings.GMAIL_PUSH_TOKEN)
+
+    def handle(self, *args, **options):
+        response = requests.post(
+            options["url"],
+            params={"token": options["token"]},
+            json=build_push_body(options["email"], options["history_id"]),
+            timeout=10,
+        )
+        self.stdout.write(f"{response.status_code} {response.reason}")
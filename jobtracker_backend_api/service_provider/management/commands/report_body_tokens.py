@@ -0,0 +1,116 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...authenticate import get_user_gmail_service
+from ...body_normalizer import STEPS, BodyNormalizer, count_tokens, get_encoding
+from ...email_services import (
+    FULL_FIELDS,
+    _header_dict,
+    download_messages,
+    extract_payload_body,
+    openai_extractor,
+)
+from ...fakes import FakeGmailService, SyntheticMailbox
+from ...models import ProcessedMessage, User
+
+STEP_NAMES = {
+    "raw": "raw body",
+    "quoted": "quoted history",
+    "whitespace": "whitespace",
+    "boilerplate": "boilerplate",
+    "links": "links",
+    "budget": "token budget",
+}
+
+
+def load_bodies(gmail_service, message_ids):
+    """(subject, body text) of the messages, as extract_payload_body gives
+    them to the normalizer."""
+    payloads = download_messages(
+        gmail_service, [{"id": i} for i in message_ids], "full", fields=FULL_FIELDS
+    )
+    bodies = []
+    for payload in payloads.values():
+        payload = payload.get("payload", {})
+        subject = _header_dict(payload).get("subject") or "No Subject"
+        bodies.append((subject, extract_payload_body(payload)))
+    return bodies
+
+
+class Command(BaseCommand):
+    help = (
+        "Report how many tokens body normalization saves, step by step, on a "
+        "user's processed mail or on a synthetic mailbox."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", help="Email address of a user whose processed mail to use"
+        )
+        parser.add_argument("--limit", type=int, default=500)
+        parser.add_argument(
+            "--synthetic",
+            type=int,
+            default=0,
+            help="Number of synthetic messages to use instead",
+        )
+        parser.add_argument(
+            "--budget", type=int, help="Token budget, BODY_TOKEN_BUDGET by default"
+        )
+
+    def handle(self, *args, **options):
+        normalizer = BodyNormalizer(openai_extractor.model, track_tokens=True)
+        normalizer.enabled = True
+        if options["budget"]:
+            normalizer.token_budget = options["budget"]
+
+        bodies = [(s, b) for s, b in self.load(options) if b]
+        if not bodies:
+            raise CommandError("No email bodies to report on.")
+
+        breakdown = Counter()
+        for subject, text in bodies:
+            breakdown["raw"] += count_tokens(text, normalizer.model)
+            normalizer.normalize(subject, text, breakdown)
+        report = normalizer.report()
+
+        encoding = get_encoding(normalizer.model)
+        counted = (
+            f"with tiktoken ({encoding.name})"
+            if encoding
+            else "by estimate, about four characters a token"
+        )
+        self.stdout.write(
+            f"Emails: {report['emails']}, tokens counted {counted}, budget "
+            f"{normalizer.token_budget} tokens"
+        )
+        self.stdout.write(
+            f"Body tokens: {report['tokens_in']} -> {report['tokens_out']}, "
+            f"{report['tokens_saved']} saved ({report['saved_share']:.1%}), "
+            f"{report['truncated']} bodies truncated"
+        )
+        self.stdout.write("")
+        self.stdout.write(f"{'step':<16}{'tokens left':>14}{'saved':>10}")
+        previous = breakdown["raw"]
+        for step in ["raw"] + STEPS:
+            self.stdout.write(
+                f"{STEP_NAMES[step]:<16}{breakdown[step]:>14}"
+                f"{previous - breakdown[step]:>10}"
+            )
+            previous = breakdown[step]
+
+    def load(self, options):
+        if options["synthetic"]:
+            mailbox = SyntheticMailbox(options["synthetic"])
+            return load_bodies(
+                FakeGmailService(mailbox), [m["id"] for m in mailbox.messages]
+            )
+        if not options["user"]:
+            raise CommandError("Give --user or --synthetic.")
+        user = User.objects.get(email=options["user"])
+        message_ids = ProcessedMessage.objects.filter(user=user).order_by("-id")
+        message_ids = message_ids.values_list("message_id", flat=True)
+        return load_bodies(
+            get_user_gmail_service(user), list(message_ids[: options["limit"]])
+        )
@@ -0,0 +1,183 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...authenticate import get_user_gmail_service
+from ...email_services import (
+    FULL_FIELDS,
+    download_messages,
+    openai_extractor,
+    parse_payload_message,
+)
+from ...extraction_cache import make_cache_key
+from ...local_classifier import (
+    LocalClassifier,
+    NaiveBayesClassifier,
+    calibrate,
+    email_features,
+    evaluate,
+    split_examples,
+)
+from ...models import ExtractionCache, ProcessedMessage, User
+
+# Shares of job mail the report shows the local settling would miss
+SWEEP = [0.0, 0.005, 0.01, 0.02, 0.05]
+
+
+def load_jsonl_examples(path):
+    """Labelled emails, one JSON object per line with subject, sender, body
+    and is_job_application_email."""
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def load_cached_examples(user, gmail_service, limit):
+    """The user's most recently processed emails, labelled with the answer
+    the LLM gave for them, looked up in the extraction cache. Emails the LLM
+    never saw, or whose answer has expired, are left out."""
+    message_ids = ProcessedMessage.objects.filter(user=user).order_by("-id")
+    message_ids = message_ids.values_list("message_id", flat=True)[:limit]
+    payloads = download_messages(
+        gmail_service, [{"id": i} for i in message_ids], "full", fields=FULL_FIELDS
+    )
+    emails = {}
+    for payload in payloads.values():
+        email_data = parse_payload_message(payload)
+        # The answer may come from the single or the batch prompt
+        for prompt_version in {
+            openai_extractor.prompt_version,
+            openai_extractor.batch_prompt_version,
+        }:
+            key = make_cache_key(
+                email_data["subject"],
+                email_data["body"],
+                openai_extractor.model,
+                prompt_version,
+            )
+            emails[key] = email_data
+    # One example per email, were it answered by both prompts
+    examples = {}
+    for key, response in ExtractionCache.objects.filter(
+        key__in=list(emails)
+    ).values_list("key", "response"):
+        email_data = emails[key]
+        examples[email_data["id"]] = {
+            "subject": email_data["subject"],
+            "sender": email_data["sender"],
+            "body": email_data["body"],
+            "is_job_application_email": bool(response.get("is_job_application_email")),
+        }
+    return list(examples.values())
+
+
+def _threshold(report):
+    threshold = report["threshold"]
+    return "none" if threshold is None else f"{threshold:.2f}"
+
+
+def featurize(examples):
+    return [
+        (
+            email_features(ex["subject"], ex["body"], ex.get("sender")),
+            bool(ex["is_job_application_email"]),
+        )
+        for ex in examples
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Train the local classifier that settles clear non-job mail before "
+        "the LLM, from emails labelled by the LLM. Calibrates its threshold "
+        "on held-out emails and reports the LLM calls it avoids."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--data", help="JSON lines of labelled emails")
+        parser.add_argument(
+            "--user", help="Email address of a user whose processed mail to use"
+        )
+        parser.add_argument("--limit", type=int, default=5000)
+        parser.add_argument("--holdout", type=float, default=0.2)
+        parser.add_argument(
+            "--max-missed",
+            type=float,
+            default=0.01,
+            help="Share of held-out job mail the local stage may settle",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--output",
+            default=os.getenv("LOCAL_CLASSIFIER_PATH", "local_classifier.json"),
+        )
+        parser.add_argument(
+            "--evaluate",
+            action="store_true",
+            help="Only report how the saved model does on the data",
+        )
+
+    def handle(self, *args, **options):
+        examples = self.load_examples(options)
+        if not examples:
+            raise CommandError("No labelled emails to train on.")
+
+        if options["evaluate"]:
+            classifier = LocalClassifier.load(options["output"])
+            if classifier.model is None:
+                raise CommandError(f"No model at {options['output']}.")
+            scores, labels = self.score(classifier.model, featurize(examples))
+            self.write_report(evaluate(scores, labels, classifier.threshold))
+            return
+
+        train, holdout = split_examples(
+            featurize(examples), options["holdout"], options["seed"]
+        )
+        model = NaiveBayesClassifier().train(train)
+        scores, labels = self.score(model, holdout)
+        threshold = calibrate(scores, labels, options["max_missed"])
+        report = evaluate(scores, labels, threshold)
+
+        self.stdout.write(f"Trained on {len(train)} emails, held out {len(holdout)}")
+        self.write_report(report)
+        self.stdout.write("")
+        self.stdout.write(f"{'max missed':>12}{'threshold':>12}{'llm avoided':>14}")
+        for max_missed in SWEEP:
+            sweep = evaluate(scores, labels, calibrate(scores, labels, max_missed))
+            self.stdout.write(
+                f"{max_missed:>12.1%}{_threshold(sweep):>12}"
+                f"{sweep['llm_calls_avoided']:>14.1%}"
+            )
+
+        LocalClassifier(model, threshold).save(options["output"], report)
+        self.stdout.write(f"Saved to {options['output']}")
+
+    def load_examples(self, options):
+        examples = []
+        if options["data"]:
+            examples += load_jsonl_examples(options["data"])
+        if options["user"]:
+            user = User.objects.get(email=options["user"])
+            examples += load_cached_examples(
+                user, get_user_gmail_service(user), options["limit"]
+            )
+        return examples
+
+    def score(self, model, examples):
+        scores = [model.score(features) for features, _ in examples]
+        return scores, [is_job for _, is_job in examples]
+
+    def write_report(self, report):
+        self.stdout.write(
+            f"Emails: {report['emails']} ({report['job_emails']} job application "
+            f"emails), threshold {_threshold(report)}"
+        )
+        self.stdout.write(
+            f"Settled locally: {report['settled_locally']} "
+            f"({report['llm_calls_avoided']:.1%} of LLM calls avoided)"
+        )
+        self.stdout.write(
+            f"Missed job emails: {report['missed_job_emails']} (job recall "
+            f"{report['job_recall']:.1%}, settled accuracy "
+            f"{report['settled_accuracy']:.1%})"
+        )
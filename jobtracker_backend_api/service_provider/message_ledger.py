@@ -0,0 +1,162 @@
+import os
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import FetchRunThread, ProcessedMessage
+
+
+def is_sent(email_data):
+    """Whether the email is the user's own, e.g. a reply to a recruiter."""
+    return "SENT" in email_data.get("label_ids", [])
+
+
+class MessageLedger:
+    """The Gmail messages of a user already processed by a fetch.
+
+    filter_new drops listed messages the ledger knows, before anything is
+    downloaded; newest_in_thread keeps only the newest message of each thread
+    for classification. The user's own sent mail never stands in for a
+    thread, so a reply does not hide the message it answers. Given the
+    FetchRun, the newest message of a thread is agreed on by all the run's
+    pages through FetchRunThread. A message is recorded only once it is settled, that
+    is screened out or extracted, together with the older messages of its
+    thread it stood in for; a failed download or extraction leaves it to be
+    tried again by the next fetch. save() writes the recorded messages once
+    their page is classified. Disabled by MESSAGE_LEDGER_ENABLED=false.
+    """
+
+    def __init__(self, user, run=None):
+        self.user = user
+        self.run = run
+        self.enabled = os.getenv("MESSAGE_LEDGER_ENABLED", "true").lower() == "true"
+        # Newest internalDate known per thread id
+        self.thread_dates = {}
+        # Emails passed to newest_in_thread, per thread id
+        self.thread_emails = {}
+        self.pending = {}
+        # Messages that could not be settled, e.g. a failed download
+        self.failed = 0
+        # Listed messages filter_new passed on to be downloaded
+        self.new = 0
+
+    def _note_thread(self, thread_id, internal_date):
+        if thread_id and internal_date > self.thread_dates.get(thread_id, -1):
+            self.thread_dates[thread_id] = internal_date
+
+    def filter_new(self, messages):
+        """Return the listed messages not processed before. One query, which
+        also loads the newest processed message of their threads."""
+        if not self.enabled or not messages:
+            self.new += len(messages)
+            return messages
+        ids = [msg["id"] for msg in messages]
+        thread_ids = {msg.get("threadId") for msg in messages} - {None}
+        rows = (
+            ProcessedMessage.objects.filter(user=self.user)
+            .filter(Q(message_id__in=ids) | Q(thread_id__in=thread_ids))
+            .values_list("message_id", "thread_id", "internal_date")
+        )
+        seen = set()
+        for message_id, thread_id, internal_date in rows:
+            seen.add(message_id)
+            self._note_thread(thread_id, internal_date)
+        new = [msg for msg in messages if msg["id"] not in seen]
+        self.new += len(new)
+        return new
+
+    def newest_in_thread(self, emails):
+        """Return the parsed emails that are the newest known message of
+        their thread, and sent mail newer than that, which is classified on
+        its own. Nothing is recorded yet, see record()."""
+        if not self.enabled:
+            return emails
+        for email_data in emails:
+            thread_id = email_data["thread_id"]
+            if thread_id:
+                self.thread_emails.setdefault(thread_id, []).append(email_data)
+            if not is_sent(email_data):
+                self._note_thread(thread_id, email_data["internal_date"])
+        if self.run is not None:
+            self._claim_threads(emails)
+        return [
+            email_data
+            for email_data in emails
+            if not email_data["thread_id"]
+            or email_data["internal_date"]
+            >= self.thread_dates.get(email_data["thread_id"], -1)
+        ]
+
+    def _claim_threads(self, emails):
+        """Claim the run's threads for the newest messages on this page. A
+        message loses to a newer one another page of the run claimed first;
+        of pages classified at the same time, both may keep theirs."""
+        claims = {
+            email_data["thread_id"]: email_data
+            for email_data in emails
+            if email_data["thread_id"]
+            and not is_sent(email_data)
+            and email_data["internal_date"]
+            == self.thread_dates[email_data["thread_id"]]
+        }
+        if not claims:
+            return
+        with transaction.atomic():
+            FetchRunThread.objects.bulk_create(
+                [
+                    FetchRunThread(
+                        run=self.run,
+                        thread_id=thread_id,
+                        message_id=email_data["id"],
+                        internal_date=email_data["internal_date"],
+                    )
+                    for thread_id, email_data in claims.items()
+                ],
+                ignore_conflicts=True,
+            )
+            threads = FetchRunThread.objects.select_for_update().filter(
+                run=self.run, thread_id__in=list(claims)
+            )
+            for thread in threads:
+                email_data = claims[thread.thread_id]
+                if email_data["internal_date"] > thread.internal_date:
+                    thread.message_id = email_data["id"]
+                    thread.internal_date = email_data["internal_date"]
+                    thread.save(update_fields=["message_id", "internal_date"])
+                else:
+                    self._note_thread(thread.thread_id, thread.internal_date)
+
+    def record(self, emails):
+        """Record settled emails as processed, with the older messages of
+        their thread that newest_in_thread dropped in their favour. Sent mail
+        is recorded without its thread, so it never hides a message of it."""
+        if not self.enabled:
+            return
+        for email_data in emails:
+            settled = [email_data]
+            if not is_sent(email_data):
+                settled += [
+                    older
+                    for older in self.thread_emails.get(email_data["thread_id"], [])
+                    if older["internal_date"] <= email_data["internal_date"]
+                ]
+            for message in settled:
+                self.pending[message["id"]] = ProcessedMessage(
+                    user=self.user,
+                    message_id=message["id"],
+                    thread_id="" if is_sent(message) else message["thread_id"] or "",
+                    internal_date=message["internal_date"],
+                )
+
+    def note_failed(self, count):
+        """Count messages left unsettled, so the fetch does not move past
+        them; this works with the ledger disabled too."""
+        self.failed += count
+
+    def save(self):
+        """Write the messages recorded since the last save in one query."""
+        if self.pending:
+            ProcessedMessage.objects.bulk_create(
+                self.pending.values(), ignore_conflicts=True
+            )
+            self.pending = {}
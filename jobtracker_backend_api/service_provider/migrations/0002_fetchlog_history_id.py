@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 01:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_provider', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fetchlog',
+            name='history_id',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.6 on 2026-10-18 01:18
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_jobs(apps, schema_editor):
+    """Blank out NULL titles/companies, which a unique constraint treats as
+    distinct, and keep only the newest row of each (user, job_title, company)."""
+    JobApplied = apps.get_model('service_provider', 'JobApplied')
+    JobApplied.objects.filter(job_title__isnull=True).update(job_title='')
+    JobApplied.objects.filter(company__isnull=True).update(company='')
+    duplicates = (
+        JobApplied.objects.values('user', 'job_title', 'company')
+        .annotate(count=Count('id'), keep_id=Max('id'))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        JobApplied.objects.filter(
+            user=duplicate['user'],
+            job_title=duplicate['job_title'],
+            company=duplicate['company'],
+        ).exclude(id=duplicate['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_provider', '0003_extractioncache'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='jobapplied',
+            constraint=models.UniqueConstraint(fields=('user', 'job_title', 'company'), name='unique_user_job'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 01:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_provider', '0004_jobapplied_unique_user_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FetchLock',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('task_id', models.CharField(max_length=255)),
+                ('locked_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.6 on 2026-10-18 01:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_provider', '0005_fetchlock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FetchRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.CharField(max_length=255)),
+                ('history_id', models.CharField(blank=True, max_length=32, null=True)),
+                ('status', models.CharField(default='running', max_length=20)),
+                ('pages_total', models.IntegerField(blank=True, null=True)),
+                ('pages_done', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FetchRunPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.IntegerField()),
+                ('messages', models.JSONField(default=list)),
+                ('found_jobs', models.JSONField(default=list)),
+                ('skipped', models.IntegerField(default=0)),
+                ('done', models.BooleanField(default=False)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='service_provider.fetchrun')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('run', 'index'), name='unique_run_page')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.6 on 2026-10-18 01:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_provider', '0006_fetchrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fetchrun',
+            name='classified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='fetchrun',
+            name='jobs_found',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='fetchrun',
+            name='listed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='fetchrun',
+            name='messages_classified',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='fetchrun',
+            name='messages_downloaded',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='fetchrun',
+            name='messages_listed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='fetchrun',
+            name='rows_written',
+            field=models.IntegerField(default=0),
+        ),
+    ]
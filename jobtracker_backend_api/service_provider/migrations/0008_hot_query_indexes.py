@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-18 01:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_provider', '0007_fetchrun_progress'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fetchlog',
+            index=models.Index(fields=['user', '-last_fetch_date'], name='fetchlog_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='jobapplied',
+            index=models.Index(fields=['user', 'company', 'job_title'], name='jobapplied_user_company_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='jobapplied',
+            index=models.Index(fields=['user', '-id'], name='jobapplied_user_id_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-18 01:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_provider', '0010_ratelimitbucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GmailWatch',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('history_id', models.CharField(max_length=32)),
+                ('notified_history_id', models.CharField(blank=True, max_length=32, null=True)),
+                ('expiration', models.DateTimeField(db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
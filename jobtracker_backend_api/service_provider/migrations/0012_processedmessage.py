@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-18 01:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_provider', '0011_gmailwatch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessedMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message_id', models.CharField(max_length=32)),
+                ('thread_id', models.CharField(blank=True, default='', max_length=32)),
+                ('internal_date', models.BigIntegerField(default=0)),
+                ('processed_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'thread_id'], name='processedmsg_user_thread_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'message_id'), name='unique_user_message')],
+            },
+        ),
+    ]
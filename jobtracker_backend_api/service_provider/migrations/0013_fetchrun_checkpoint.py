@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-18 01:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_provider', '0012_processedmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fetchrun',
+            name='attempts',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='fetchrun',
+            name='next_page_token',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='fetchrun',
+            name='pages_listed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='fetchrun',
+            name='sync_state',
+            field=models.JSONField(default=dict),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.6 on 2026-10-18 02:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_provider', '0013_fetchrun_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FetchRunThread',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('thread_id', models.CharField(max_length=32)),
+                ('message_id', models.CharField(max_length=32)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='threads', to='service_provider.fetchrun')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('run', 'thread_id'), name='unique_run_thread')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 02:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_provider', '0014_fetchrunthread'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fetchrun',
+            name='pages_failed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='fetchrunpage',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 02:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_provider', '0015_fetchrunpage_attempts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fetchrunthread',
+            name='internal_date',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
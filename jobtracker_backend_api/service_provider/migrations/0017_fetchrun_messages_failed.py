@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 02:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_provider', '0016_fetchrunthread_internal_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fetchrun',
+            name='messages_failed',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -26,6 +26,9 @@ class User(AbstractBaseUser, PermissionsMixin):
     token_expiry = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     google_sheet_id = models.CharField(max_length=255, null=True, blank=True)
+    # Bumped whenever the user's jobs, fetch logs or sheet change, see
+    # response_cache.py
+    data_version = models.IntegerField(default=0)
 
     def __str__(self):
         return self.email
@@ -50,6 +53,22 @@ class JobApplied(models.Model):
     sender_email = models.EmailField(null=True)
     row_number = models.IntegerField(null=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "job_title", "company"], name="unique_user_job"
+            ),
+        ]
+        indexes = [
+            # save_jobs looks up a page of jobs by company
+            models.Index(
+                fields=["user", "company", "job_title"],
+                name="jobapplied_user_company_idx",
+            ),
+            # Newest first listing of a user's jobs
+            models.Index(fields=["user", "-id"], name="jobapplied_user_id_idx"),
+        ]
+
     def __str__(self):
         return self.job_title
 
@@ -58,6 +77,188 @@ class FetchLog(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True)
     id = models.AutoField(primary_key=True)
     last_fetch_date = models.DateTimeField()
+    # Gmail mailbox historyId at the start of the fetch, used for incremental sync
+    history_id = models.CharField(max_length=32, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # get_last_fetch_log
+            models.Index(
+                fields=["user", "-last_fetch_date"], name="fetchlog_user_date_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"Last fetch date: {self.last_fetch_date}"
+
+
+class ProcessedMessage(models.Model):
+    """A Gmail message already classified, or passed over for a newer message
+    of its thread. Only ids are kept, never content."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    message_id = models.CharField(max_length=32)
+    thread_id = models.CharField(max_length=32, blank=True, default="")
+    # Gmail internalDate, epoch milliseconds
+    internal_date = models.BigIntegerField(default=0)
+    processed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "message_id"], name="unique_user_message"
+            ),
+        ]
+        indexes = [
+            # Newest processed message of the threads on a page
+            models.Index(
+                fields=["user", "thread_id"], name="processedmsg_user_thread_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return self.message_id
+
+
+class ExtractionCache(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    response = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.key
+
+
+class FetchLock(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    task_id = models.CharField(max_length=255)
+    locked_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Fetch lock: {self.task_id}"
+
+
+class RateLimitBucket(models.Model):
+    key = models.CharField(max_length=255, primary_key=True)
+    tokens = models.FloatField()
+    updated_at = models.DateTimeField()
+    blocked_until = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Rate limit {self.key}: {self.tokens:.1f}"
+
+
+class GmailWatch(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    # Mailbox historyId when the watch was registered and the latest one pushed
+    history_id = models.CharField(max_length=32)
+    notified_history_id = models.CharField(max_length=32, null=True, blank=True)
+    expiration = models.DateTimeField(db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Gmail watch until {self.expiration}"
+
+
+class FetchRun(models.Model):
+    RUNNING = "running"
+    FINISHING = "finishing"
+    DONE = "done"
+    FAILED = "failed"
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    task_id = models.CharField(max_length=255)
+    history_id = models.CharField(max_length=32, null=True, blank=True)
+    status = models.CharField(max_length=20, default=RUNNING)
+    # Listing checkpoint, saved with each page so a new task can resume it
+    sync_state = models.JSONField(default=dict)
+    next_page_token = models.CharField(max_length=255, null=True, blank=True)
+    pages_listed = models.IntegerField(default=0)
+    # Tasks that started or resumed the run
+    attempts = models.IntegerField(default=1)
+    pages_total = models.IntegerField(null=True, blank=True)
+    pages_done = models.IntegerField(default=0)
+    # Pages done without their jobs, after an error or too many attempts
+    pages_failed = models.IntegerField(default=0)
+    messages_listed = models.IntegerField(default=0)
+    messages_downloaded = models.IntegerField(default=0)
+    messages_classified = models.IntegerField(default=0)
+    # Messages of failed downloads, extractions and pages, listed again by
+    # the next fetch
+    messages_failed = models.IntegerField(default=0)
+    jobs_found = models.IntegerField(default=0)
+    rows_written = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    listed_at = models.DateTimeField(null=True, blank=True)
+    classified_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Fetch run {self.task_id}: {self.status}"
+
+    def progress(self):
+        """Counters of each stage and the seconds each finished stage took."""
+        stages = {}
+        started = self.created_at
+        for stage, ended in [
+            ("list", self.listed_at),
+            ("classify", self.classified_at),
+            ("finish", self.finished_at),
+        ]:
+            if started is None or ended is None:
+                break
+            stages[stage] = round((ended - started).total_seconds(), 3)
+            started = ended
+        return {
+            "stage": self.status,
+            "pages_total": self.pages_total,
+            "pages_done": self.pages_done,
+            "pages_failed": self.pages_failed,
+            "messages_listed": self.messages_listed,
+            "messages_downloaded": self.messages_downloaded,
+            "messages_classified": self.messages_classified,
+            "messages_failed": self.messages_failed,
+            "jobs_found": self.jobs_found,
+            "rows_written": self.rows_written,
+            "stage_seconds": stages,
+        }
+
+
+class FetchRunPage(models.Model):
+    run = models.ForeignKey(FetchRun, on_delete=models.CASCADE, related_name="pages")
+    index = models.IntegerField()
+    messages = models.JSONField(default=list)
+    found_jobs = models.JSONField(default=list)
+    skipped = models.IntegerField(default=0)
+    done = models.BooleanField(default=False)
+    # Deliveries of the page's task, redeliveries after a lost worker included
+    attempts = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["run", "index"], name="unique_run_page"),
+        ]
+
+    def __str__(self):
+        return f"Page {self.index} of {self.run}"
+
+
+class FetchRunThread(models.Model):
+    """The newest message of a thread any page of a fetch run has seen, so a
+    thread whose messages fall on several pages is classified once."""
+
+    run = models.ForeignKey(FetchRun, on_delete=models.CASCADE, related_name="threads")
+    thread_id = models.CharField(max_length=32)
+    message_id = models.CharField(max_length=32)
+    # Gmail internalDate of the message, epoch milliseconds
+    internal_date = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["run", "thread_id"], name="unique_run_thread"
+            ),
+        ]
+
+    def __str__(self):
+        return f"Thread {self.thread_id} of {self.run}"
@@ -0,0 +1,12 @@
+from rest_framework.pagination import CursorPagination
+from rest_framework.settings import api_settings
+
+
+class JobCursorPagination(CursorPagination):
+    """Keyset pagination over the (user, -id) index: no COUNT and no OFFSET,
+    so a page costs the same however many jobs come before it."""
+
+    ordering = "-id"
+    page_size = api_settings.PAGE_SIZE or 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
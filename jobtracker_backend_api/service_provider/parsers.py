@@ -1,20 +1,130 @@
+import functools
 import json
 import os
 
+import openai
 from openai import OpenAI
 
+from .local_classifier import LocalClassifier
+from .rate_limits import call_with_rate_limit
+from .thread_pools import WorkerPool
+
+
+@functools.lru_cache(maxsize=None)
+def get_openai_client(api_key):
+    """Return a process-wide OpenAI client so its keep-alive connection pool is
+    reused across emails. The client is safe to share between threads.
+    Retries are left to call_with_rate_limit, which shares backoff between
+    workers."""
+    return OpenAI(api_key=api_key, max_retries=0)
+
+
+# Instructions for a request carrying several emails, each headed by its
+# number, answered by one result per email
+BATCH_PROMPT = """You are a job applicant checking emails for job application status.
+You receive several emails, each starting with a line "### Email <number>".
+For each email, check if it is a job application status update email or not.
+If it is, extract the job title, company name and status. The status can be "applied", "interview", "offer", or "rejected".
+Return one result per email, in order, with the number of the email as its index."""
+
+BATCH_RESULT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "index": {"type": "integer"},
+                    "is_job_application_email": {"type": "boolean"},
+                    "job_title": {"type": "string"},
+                    "company_name": {"type": "string"},
+                    "status": {
+                        "type": "string",
+                        "enum": ["applied", "interview", "offer", "rejected"],
+                    },
+                },
+                "required": ["index", "is_job_application_email"],
+            },
+        },
+    },
+    "required": ["results"],
+}
+
+
+def estimate_tokens(text):
+    """Rough token count of text, about four characters a token."""
+    return len(text) // 4 + 1
+
+
+def batch_email_content(number, email_data):
+    return (
+        f"### Email {number}\n"
+        f"Subject: {email_data['subject']}\nBody: {email_data['body']}"
+    )
+
+
+def pack_batches(emails, max_size, max_tokens):
+    """Split emails into consecutive batches of at most max_size emails and,
+    by estimate, max_tokens of prompt. An email over the budget goes alone."""
+    batches = []
+    batch, tokens = [], 0
+    for email_data in emails:
+        size = estimate_tokens(batch_email_content(len(batch) + 1, email_data))
+        if batch and (len(batch) == max_size or tokens + size > max_tokens):
+            batches.append(batch)
+            batch, tokens = [], 0
+        batch.append(email_data)
+        tokens += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class BadBatchError(ValueError):
+    """The answer to a batch request does not hold one result per email."""
+
+
+class Extractor:
+    """Base of the email extractors. get_response extracts one email;
+    get_responses extracts a list of them and by default loops over
+    get_response. Extractors that can do better override it."""
+
+    def get_response(self, email_subject, email_body):
+        raise NotImplementedError
+
+    def get_responses(self, emails):
+        """Extract emails, dicts with "subject" and "body". Returns one
+        response per email, in order; None for an email that failed."""
+        responses = []
+        for email_data in emails:
+            try:
+                responses.append(
+                    self.get_response(email_data["subject"], email_data["body"])
+                )
+            except Exception as error:
+                print(f"An error occurred while extracting an email: {error}")
+                responses.append(None)
+        return responses
+
+
+class OpenAIExtractor(Extractor):
+    # Bump whenever a prompt or schema changes so cached results are not
+    # reused; answers of the batch prompt are cached apart from single ones
+    prompt_version = "1"
+    batch_prompt_version = "batch-1"
 
-class OpenAIExtractor:
     def __init__(self):
         self.api_key = os.environ.get("OPENAI_API_KEY")
+        self.model = "gpt-4o-mini"
 
     def get_response(self, email_subject, email_body):
-        # Define the client of the OpenAI API
-        client = OpenAI(api_key=self.api_key)
+        # Shared client of the OpenAI API
+        client = get_openai_client(self.api_key)
 
         # Define the prompt
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
+        request = dict(
+            model=self.model,
             messages=[
                 {
                     "role": "developer",
@@ -48,14 +158,121 @@ class OpenAIExtractor:
                 },
             },
         )
+        response = call_with_rate_limit(
+            lambda: client.chat.completions.create(**request), ["openai"]
+        )
 
         # Parse the JSON content from the response
         response_content = response.choices[0].message.content
         response_json = json.loads(response_content)
         return response_json
 
+    def get_responses(self, emails):
+        """Pack the emails into requests of at most EXTRACTION_BATCH_SIZE
+        emails and EXTRACTION_BATCH_TOKENS prompt tokens, sent
+        EXTRACTION_CONCURRENCY at a time. A batch whose answer does not hold
+        one result per email is split in two and retried. Every answer comes
+        from BATCH_PROMPT, even for a batch of one."""
+        if not emails:
+            return []
+        batches = pack_batches(
+            emails,
+            int(os.getenv("EXTRACTION_BATCH_SIZE", 10)),
+            int(os.getenv("EXTRACTION_BATCH_TOKENS", 8000)),
+        )
+        concurrency = int(os.getenv("EXTRACTION_CONCURRENCY", 8))
+        # Workers take rate limit tokens over a connection each
+        with WorkerPool(max_workers=min(concurrency, len(batches))) as executor:
+            results = executor.map(self._extract_batch, batches)
+        return [response for batch in results for response in batch]
+
+    def _extract_batch(self, emails):
+        try:
+            return self._request_batch(emails)
+        except (BadBatchError, openai.BadRequestError) as error:
+            # Malformed or truncated answers, or a prompt the model refused
+            if len(emails) == 1:
+                print(f"An error occurred while extracting an email: {error}")
+                return [None]
+            print(f"Splitting a batch of {len(emails)} emails after: {error}")
+        except Exception as error:
+            print(f"An error occurred while extracting {len(emails)} emails: {error}")
+            return [None] * len(emails)
+        half = len(emails) // 2
+        return self._extract_batch(emails[:half]) + self._extract_batch(emails[half:])
+
+    def _request_batch(self, emails):
+        client = get_openai_client(self.api_key)
+        content = "\n\n".join(
+            batch_email_content(number, email_data)
+            for number, email_data in enumerate(emails, start=1)
+        )
+        request = dict(
+            model=self.model,
+            messages=[
+                {"role": "developer", "content": BATCH_PROMPT},
+                {"role": "user", "content": content},
+            ],
+            response_format={
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "email_batch_schema",
+                    "schema": BATCH_RESULT_SCHEMA,
+                },
+            },
+        )
+        response = call_with_rate_limit(
+            lambda: client.chat.completions.create(**request), ["openai"]
+        )
+        choice = response.choices[0]
+        if choice.finish_reason == "length":
+            raise BadBatchError("the answer was cut off")
+        try:
+            results = json.loads(choice.message.content)["results"]
+            by_index = {result.pop("index"): result for result in results}
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            raise BadBatchError(f"malformed answer: {error}") from error
+        numbers = range(1, len(emails) + 1)
+        if len(results) != len(emails) or set(by_index) != set(numbers):
+            raise BadBatchError(f"results for {list(by_index)} of {len(emails)}")
+        return [by_index[number] for number in numbers]
+
+
+class LocalExtractor(Extractor):
+    """First stage in front of an LLM extractor. The local classifier settles
+    emails it is confident are not job application mail, everything else is
+    escalated to the fallback extractor."""
+
+    def __init__(self, fallback, classifier=None):
+        self.fallback = fallback
+        self.classifier = classifier or LocalClassifier.load()
+
+    def get_response(self, email_subject, email_body, sender=None):
+        if self.classifier.settles(email_subject, email_body, sender):
+            return {"is_job_application_email": False}
+        return self.fallback.get_response(email_subject, email_body)
+
+    def get_responses(self, emails):
+        """Settle what the classifier can and pass the rest to the fallback
+        in one call, so it can batch them."""
+        responses = [None] * len(emails)
+        escalated = []
+        for position, email_data in enumerate(emails):
+            if self.classifier.settles(
+                email_data["subject"], email_data["body"], email_data.get("sender")
+            ):
+                responses[position] = {"is_job_application_email": False}
+            else:
+                escalated.append(position)
+        fallback_responses = self.fallback.get_responses(
+            [emails[position] for position in escalated]
+        )
+        for position, response in zip(escalated, fallback_responses):
+            responses[position] = response
+        return responses
+
 
-class OllamaExtractor:
+class OllamaExtractor(Extractor):
     def __init__(self, model):
         self.model = model
 
@@ -63,7 +280,7 @@ class OllamaExtractor:
         return self.model.get_response(email_subject, email_body)
 
 
-class DummyExtractor:
+class DummyExtractor(Extractor):
     def __init__(self):
         pass
 
@@ -0,0 +1,143 @@
+import os
+from email.utils import parseaddr
+
+# Applicant tracking systems that send application status emails
+ATS_DOMAINS = [
+    "greenhouse.io",
+    "greenhouse-mail.io",
+    "lever.co",
+    "hire.lever.co",
+    "myworkday.com",
+    "myworkdayjobs.com",
+    "workday.com",
+    "icims.com",
+    "smartrecruiters.com",
+    "ashbyhq.com",
+    "jobvite.com",
+    "taleo.net",
+    "successfactors.com",
+    "bamboohr.com",
+    "workablemail.com",
+    "breezy.hr",
+    "recruitee.com",
+    "jazzhr.com",
+    "applytojob.com",
+    "paylocity.com",
+    "ultipro.com",
+]
+
+# Gmail category labels that application status emails rarely land in
+NOISE_LABELS = ["CATEGORY_PROMOTIONS", "CATEGORY_SOCIAL", "CATEGORY_FORUMS"]
+
+POSITIVE_KEYWORDS = [
+    "your application",
+    "application for",
+    "applying",
+    "applied",
+    "interview",
+    "candidacy",
+    "candidate",
+    "position",
+    "recruiter",
+    "recruiting",
+    "hiring team",
+    "talent acquisition",
+    "next steps",
+    "assessment",
+    "offer letter",
+    "unfortunately",
+    "not to move forward",
+    "thank you for your interest",
+]
+
+NEGATIVE_KEYWORDS = [
+    "job alert",
+    "jobs for you",
+    "recommended jobs",
+    "newsletter",
+    "receipt",
+    "invoice",
+    "your order",
+    "shipped",
+    "webinar",
+    "% off",
+    "discount",
+    "sale ends",
+    "verify your email",
+    "password reset",
+    "security alert",
+]
+
+# Only the start of the body is scanned, keywords there are the useful signal
+BODY_SCAN_CHARS = 4000
+
+
+def _env_list(name):
+    return [item.strip().lower() for item in os.getenv(name, "").split(",") if item]
+
+
+def sender_domain(sender):
+    """Return the lower-cased domain of a From header value."""
+    address = parseaddr(sender or "")[1]
+    return address.rpartition("@")[2].lower()
+
+
+def _domain_matches(domain, domains):
+    return any(domain == item or domain.endswith("." + item) for item in domains)
+
+
+class EmailPrefilter:
+    """Cheap header and keyword rules run before the LLM extractor.
+
+    Only clear negatives are dropped: mail from an ATS domain is always kept,
+    and anything scoring at or above the threshold goes on to extraction.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("PREFILTER_ENABLED", "true").lower() == "true"
+        self.threshold = int(os.getenv("PREFILTER_THRESHOLD", 0))
+        self.header_threshold = int(os.getenv("PREFILTER_HEADER_THRESHOLD", -2))
+        self.ats_domains = ATS_DOMAINS + _env_list("PREFILTER_ATS_DOMAINS")
+        self.blocked_domains = _env_list("PREFILTER_BLOCKED_DOMAINS")
+
+    def score(self, email_data):
+        """Score how likely an email is a job application email.
+        email_data holds lower-cased "headers", "label_ids", "subject", "body"."""
+        headers = email_data.get("headers", {})
+        subject = (email_data.get("subject") or "").lower()
+        body = (email_data.get("body") or "")[:BODY_SCAN_CHARS].lower()
+
+        score = 0
+        for keyword in POSITIVE_KEYWORDS:
+            if keyword in subject:
+                score += 2
+            elif keyword in body:
+                score += 1
+        for keyword in NEGATIVE_KEYWORDS:
+            if keyword in subject or keyword in body:
+                score -= 1
+        if headers.get("list-unsubscribe") or headers.get("list-id"):
+            score -= 2
+        if set(NOISE_LABELS).intersection(email_data.get("label_ids", [])):
+            score -= 3
+        return score
+
+    def should_download(self, email_data):
+        """Header-only screening before the body is downloaded. Without the
+        body the score is less reliable, so a lower PREFILTER_HEADER_THRESHOLD
+        applies and only mail that is clearly noise is dropped."""
+        return self._passes(email_data, self.header_threshold)
+
+    def should_extract(self, email_data):
+        """Return False when the email is clearly not about a job application."""
+        return self._passes(email_data, self.threshold)
+
+    def _passes(self, email_data, threshold):
+        if not self.enabled:
+            return True
+        domain = sender_domain(email_data.get("headers", {}).get("from"))
+        if _domain_matches(domain, self.ats_domains):
+            return True
+        if _domain_matches(domain, self.blocked_domains):
+            return False
+        return self.score(email_data) >= threshold
@@ -0,0 +1,197 @@
+import os
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+import openai
+from googleapiclient.errors import HttpError
+
+from .models import RateLimitBucket
+
+# Env var and default of the rate of each bucket, in cost units per second.
+# Gmail allows 250 quota units/s per user and 1,200,000/min per project; a
+# messages.get or messages.list costs 5 units. Sheets allows 60 requests/min
+# per user and 300/min per project.
+RATE_LIMITS = {
+    "gmail": ("GMAIL_PROJECT_RATE", 20000),
+    "gmail:user": ("GMAIL_USER_RATE", 250),
+    "sheets": ("SHEETS_PROJECT_RATE", 5),
+    "sheets:user": ("SHEETS_USER_RATE", 1),
+    "openai": ("OPENAI_REQUEST_RATE", 50),
+}
+
+# Gmail quota units per call
+GMAIL_GET_COST = 5
+GMAIL_LIST_COST = 5
+GMAIL_HISTORY_COST = 2
+
+MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", 5))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# Tokens this process took from a bucket beyond the cost of the call, per
+# key: (tokens, time.monotonic() they lapse at)
+_leases = {}
+_leases_lock = threading.Lock()
+
+
+def _enabled():
+    return os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+
+
+def _lease_seconds():
+    # Seconds of a bucket's rate a worker takes per locked update, spent
+    # locally by later calls until they lapse after as many seconds
+    return float(os.getenv("RATE_LIMIT_LEASE_SECONDS", 0.1))
+
+
+def _rate(key):
+    api, _, scope = key.partition(":")
+    env_name, default = RATE_LIMITS[f"{api}:user" if scope else api]
+    return float(os.getenv(env_name, default))
+
+
+def service_keys(api, service):
+    """Buckets a call through service draws from: the API project and, for
+    services built per user by authenticate.py, that user."""
+    # vars() so a mock's auto-created attributes are not mistaken for a user
+    user_id = vars(service).get("rate_limit_user")
+    return [api] if user_id is None else [api, f"{api}:user:{user_id}"]
+
+
+def _reserve(key, cost):
+    """Take cost tokens from the bucket, and when it has them a lease of up
+    to RATE_LIMIT_LEASE_SECONDS of its rate on top. Returns the seconds to
+    wait first, 0 once reserved, and the tokens taken. A bucket with any
+    tokens left may go into debt, so calls costing more than a second of
+    quota still go through."""
+    rate = _rate(key)
+    now = timezone.now()
+    with transaction.atomic():
+        bucket, _ = RateLimitBucket.objects.select_for_update().get_or_create(
+            key=key, defaults={"tokens": rate, "updated_at": now}
+        )
+        if bucket.blocked_until and bucket.blocked_until > now:
+            return (bucket.blocked_until - now).total_seconds(), 0
+        elapsed = max((now - bucket.updated_at).total_seconds(), 0)
+        tokens = min(rate, bucket.tokens + elapsed * rate)
+        if tokens <= 0:
+            return -tokens / rate or 1 / rate, 0
+        taken = max(cost, min(tokens, rate * _lease_seconds()))
+        bucket.tokens = tokens - taken
+        bucket.updated_at = now
+        bucket.save(update_fields=["tokens", "updated_at"])
+    return 0, taken
+
+
+def _spend_lease(key, cost):
+    """Spend cost tokens of this process's lease on the bucket, if it holds
+    enough that have not lapsed."""
+    with _leases_lock:
+        tokens, lapses_at = _leases.get(key, (0, 0))
+        if tokens < cost or time.monotonic() >= lapses_at:
+            return False
+        _leases[key] = (tokens - cost, lapses_at)
+        return True
+
+
+def acquire(keys, cost=1):
+    """Block until every bucket in keys lets a call of this cost through.
+    Buckets live in the database, so all workers share them; each worker
+    leases a few tokens per locked update so calls do not all queue on the
+    bucket's row."""
+    if not _enabled():
+        return
+    for key in keys:
+        if _spend_lease(key, cost):
+            continue
+        while True:
+            wait, taken = _reserve(key, cost)
+            if wait <= 0:
+                break
+            time.sleep(wait)
+        if taken > cost:
+            with _leases_lock:
+                _leases[key] = (taken - cost, time.monotonic() + _lease_seconds())
+
+
+def throttle(keys, seconds):
+    """Hold back every worker's calls through keys for the given seconds,
+    after the API answered with a rate limit error."""
+    if not _enabled():
+        return
+    with _leases_lock:
+        for key in keys:
+            _leases.pop(key, None)
+    until = timezone.now() + timedelta(seconds=seconds)
+    for key in keys:
+        RateLimitBucket.objects.get_or_create(
+            key=key, defaults={"tokens": 0, "updated_at": timezone.now()}
+        )
+    RateLimitBucket.objects.filter(key__in=keys).filter(
+        Q(blocked_until__isnull=True) | Q(blocked_until__lt=until)
+    ).update(blocked_until=until, tokens=0, updated_at=until)
+
+
+def is_rate_limited(error):
+    if isinstance(error, HttpError):
+        return error.resp.status == 429
+    return isinstance(error, openai.RateLimitError)
+
+
+def is_retryable(error):
+    """Rate limits, server errors and dropped connections are worth retrying."""
+    if isinstance(error, HttpError):
+        return error.resp.status == 429 or error.resp.status >= 500
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, openai.APIConnectionError)
+
+
+def retry_after(error):
+    """Seconds the API asked us to wait in its Retry-After header, if any."""
+    if isinstance(error, HttpError):
+        headers = error.resp
+    elif isinstance(error, openai.APIStatusError):
+        headers = error.response.headers
+    else:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def backoff_delay(attempt, error=None):
+    """Retry-After when given, else exponential backoff with full jitter."""
+    delay = retry_after(error) if error is not None else None
+    if delay is None:
+        delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+    return delay
+
+
+def call_with_rate_limit(func, keys, cost=1):
+    """Call func once the buckets in keys allow it, retrying retryable errors
+    with backoff. A rate limit error holds back the most specific bucket for
+    all workers until its Retry-After has passed."""
+    for attempt in range(MAX_RETRIES + 1):
+        acquire(keys, cost)
+        try:
+            return func()
+        except Exception as error:
+            if attempt == MAX_RETRIES or not is_retryable(error):
+                raise
+            delay = backoff_delay(attempt, error)
+            if is_rate_limited(error):
+                throttle(keys[-1:], delay)
+            print(f"Retrying {keys[-1]} call in {delay:.1f}s after: {error}")
+            time.sleep(delay)
@@ -0,0 +1,39 @@
+import hashlib
+import os
+
+from django.core.cache import cache
+from django.db.models import F
+
+from rest_framework.response import Response
+
+from .models import User
+
+
+def bump_data_version(user_id):
+    """Mark every cached response of the user as stale. Call after writing
+    jobs, fetch logs or sheet settings of the user."""
+    User.objects.filter(pk=user_id).update(data_version=F("data_version") + 1)
+
+
+def cached_response(request, build):
+    """Serve a read-only response of request.user from the cache.
+
+    Entries and ETags are stamped with the user's data_version, which the
+    authentication lookup has already loaded, so a client sending a matching
+    If-None-Match gets a 304 without any further queries. build() returns the
+    response data when it is not cached."""
+    user = request.user
+    url = request.build_absolute_uri()
+    digest = hashlib.sha256(f"{user.pk}:{user.data_version}:{url}".encode())
+    key = f"response:{digest.hexdigest()}"
+    etag = f'"{digest.hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if etag in request.headers.get("If-None-Match", ""):
+        return Response(status=304, headers=headers)
+
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, int(os.getenv("RESPONSE_CACHE_TIMEOUT", 300)))
+    return Response(data, headers=headers)
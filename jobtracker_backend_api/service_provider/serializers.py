@@ -1,5 +1,3 @@
-from django.db import models
-
 from rest_framework import serializers
 
 from .models import FetchLog, GoogleSheet, JobApplied, User
@@ -9,33 +7,29 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = User
         fields = "__all__"
-        indexes = [
-            models.Index(fields=["email"]),
-        ]
 
 
 class JobAppliedSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = JobApplied
         fields = "__all__"
-        indexes = [
-            models.Index(fields=["job_title", "company", "email_sender"]),
-        ]
+
+
+class JobAppliedListSerializer(serializers.ModelSerializer):
+    """Plain fields only, no hyperlinks to reverse for every row."""
+
+    class Meta:
+        model = JobApplied
+        fields = ["id", "job_title", "company", "status", "sender_email", "row_number"]
 
 
 class FetchLogSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = FetchLog
         fields = "__all__"
-        indexes = [
-            models.Index(fields=["last_fetch_date"]),
-        ]
 
 
 class GoogleSheetSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = GoogleSheet
         fields = "__all__"
-        indexes = [
-            models.Index(fields=["sheet_id"]),
-        ]
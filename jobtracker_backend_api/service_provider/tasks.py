@@ -1,12 +1,321 @@
+import os
+import uuid
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
 
 from celery import shared_task
+from googleapiclient.errors import HttpError
+from kombu.exceptions import KombuError
 
-from .email_services import get_emails
+from .authenticate import get_user_gmail_service
+from .email_services import (
+    download_emails,
+    find_jobs,
+    finish_fetch,
+    get_fetch_batch_size,
+    list_message_page,
+    next_start,
+    save_jobs,
+    start_fetch,
+)
+from .fetch_locks import acquire_fetch_lock, refresh_fetch_lock, release_fetch_lock
+from .gmail_watch import get_users_to_watch, needs_catch_up, push_enabled, start_watch
+from .message_ledger import MessageLedger
+from .models import FetchRun, FetchRunPage
+from .rate_limits import backoff_delay, is_retryable
 
+# A fetch runs as a pipeline of tasks so large mailboxes spread over workers:
+#   fetch_emails_task     lists message ids and enqueues one task per page
+#   classify_page_task    downloads and classifies a page, any worker
+#   finish_fetch_task     saves all jobs and syncs the sheet once
+# The last stage is triggered by whichever task completes the run, which
+# works with result backends that do not support chords (e.g. rpc://).
+#
+# Each listed page is committed with a checkpoint of the listing, so a fetch
+# that failed or whose worker died is resumed by the user's next fetch task
+# from its last committed page. All stages ack late and are safe to run
+# again when the broker redelivers them.
+#
+# Page tasks share the run's FetchRunThread rows through their ledgers, so
+# a thread whose messages fall on several pages is classified by its newest
+# received message once. A page classified before another page brought in a
+# newer message of one of its threads, as history mode, which lists oldest
+# first, can do, has classified the older message as well; save_jobs orders
+# jobs by message date, so the newer status is the one kept.
 
-@shared_task
-def fetch_emails_task(user_id):
+FETCH_MAX_ATTEMPTS = int(os.getenv("FETCH_MAX_ATTEMPTS", 3))
+PAGE_MAX_ATTEMPTS = int(os.getenv("PAGE_MAX_ATTEMPTS", 3))
+
+
+@shared_task(bind=True, acks_late=True, max_retries=3)
+def fetch_emails_task(self, user_id):
+    if acquire_fetch_lock(user_id, self.request.id) != self.request.id:
+        print(f"A fetch is already running for user {user_id}, skipping.")
+        return
+
+    run = None
+    try:
+        User = get_user_model()
+        user = User.objects.get(id=user_id)
+        gmail_service = get_user_gmail_service(user)
+        run = _start_or_resume_run(user, gmail_service, self.request.id)
+        _list_pages(run, gmail_service)
+    except HttpError as error:
+        if is_retryable(error) and self.request.retries < self.max_retries:
+            # The retry runs under the same task id, keeps the lock and
+            # resumes the run from its checkpoint
+            raise self.retry(
+                exc=error, countdown=backoff_delay(self.request.retries, error)
+            )
+        print(f"An error occurred: {error}")
+        _abort_run(user_id, self.request.id, run)
+        return
+    except Exception:
+        _abort_run(user_id, self.request.id, run)
+        raise
+    _finish_if_complete(run.pk)
+
+
+def _start_or_resume_run(user, gmail_service, task_id):
+    """Take over the user's last run if it never finished, else start one."""
+    run = FetchRun.objects.filter(user=user).order_by("-id").first()
+    resumable = (
+        run is not None
+        and run.status in (FetchRun.RUNNING, FetchRun.FAILED)
+        and run.attempts < FETCH_MAX_ATTEMPTS
+    )
+    if not resumable:
+        if run is not None and run.status in (FetchRun.RUNNING, FetchRun.FAILED):
+            print(f"Giving up on fetch run {run.pk} after {run.attempts} attempts.")
+        history_id, sync_state = start_fetch(user, gmail_service)
+        return FetchRun.objects.create(
+            user=user, task_id=task_id, history_id=history_id, sync_state=sync_state
+        )
+
+    print(f"Resuming fetch run {run.pk} after {run.pages_listed} listed pages.")
+    run.task_id = task_id
+    run.status = FetchRun.RUNNING
+    run.attempts += 1
+    run.finished_at = None
+    run.save(update_fields=["task_id", "status", "attempts", "finished_at"])
+    # Pages committed but never classified, e.g. their worker died
+    for page_id in run.pages.filter(done=False).values_list("id", flat=True):
+        classify_page_task.delay(page_id)
+    return run
+
+
+def _list_pages(run, gmail_service):
+    """List the run's remaining pages, committing each with the checkpoint."""
+    batch_size = get_fetch_batch_size()
+    while run.pages_total is None:
+        messages, next_page_token = list_message_page(
+            gmail_service, run.sync_state, run.next_page_token, batch_size
+        )
+        run.pages_listed += 1
+        run.next_page_token = next_page_token
+        checkpoint = {
+            "sync_state": run.sync_state,
+            "next_page_token": next_page_token,
+            "pages_listed": run.pages_listed,
+            "messages_listed": F("messages_listed") + len(messages),
+        }
+        if not next_page_token:
+            run.pages_total = run.pages_listed
+            checkpoint.update(pages_total=run.pages_total, listed_at=timezone.now())
+        with transaction.atomic():
+            page = FetchRunPage.objects.create(
+                run=run, index=run.pages_listed - 1, messages=messages
+            )
+            FetchRun.objects.filter(pk=run.pk).update(**checkpoint)
+        refresh_fetch_lock(run.user_id, run.task_id)
+        classify_page_task.delay(page.id)
+    print(f"Listed {run.pages_total} pages of messages for user {run.user_id}.")
+
+
+def _abort_run(user_id, task_id, run):
+    if run is not None:
+        FetchRun.objects.filter(pk=run.pk).update(
+            status=FetchRun.FAILED, finished_at=timezone.now()
+        )
+    release_fetch_lock(user_id, task_id)
+
+
+@shared_task(acks_late=True)
+def classify_page_task(page_id):
+    page = FetchRunPage.objects.select_related("run__user").get(pk=page_id)
+    if page.done:
+        return
+    # Counted before any work, so a page that kills its worker is given up
+    # instead of being redelivered forever
+    FetchRunPage.objects.filter(pk=page.pk).update(attempts=F("attempts") + 1)
+    if page.attempts >= PAGE_MAX_ATTEMPTS:
+        print(f"Giving up on page {page.index} after {page.attempts} attempts.")
+        classified, ledger = 0, None
+    else:
+        classified, ledger = _classify_page(page)
+
+    # The page, its ledger entries and the run's counters commit together,
+    # and only once if the page was classified twice
+    with transaction.atomic():
+        if not FetchRunPage.objects.filter(pk=page.pk, done=False).update(
+            found_jobs=page.found_jobs, skipped=page.skipped, done=True
+        ):
+            return
+        if ledger is not None:
+            ledger.save()
+        FetchRun.objects.filter(pk=page.run_id).update(
+            pages_done=F("pages_done") + 1,
+            pages_failed=F("pages_failed") + int(ledger is None),
+            messages_failed=F("messages_failed")
+            + (len(page.messages) if ledger is None else ledger.failed),
+            messages_downloaded=F("messages_downloaded")
+            + (0 if ledger is None else ledger.new),
+            messages_classified=F("messages_classified") + classified,
+            jobs_found=F("jobs_found") + len(page.found_jobs),
+        )
+    refresh_fetch_lock(page.run.user_id, page.run.task_id)
+    _finish_if_complete(page.run_id)
+
+
+def _classify_page(page):
+    """Download and classify the page's messages into page.found_jobs and
+    page.skipped. Returns the number of messages classified and the ledger to
+    save, None if the page failed."""
+    ledger = MessageLedger(page.run.user, page.run)
+    try:
+        gmail_service = get_user_gmail_service(page.run.user)
+        emails, screened_out = download_emails(gmail_service, page.messages, ledger)
+        page.found_jobs, skipped = find_jobs(emails, ledger)
+        page.skipped = screened_out + skipped
+    except Exception as error:
+        # A broken page must not stall the run, its messages are skipped
+        print(f"An error occurred while classifying page {page.index}: {error}")
+        return 0, None
+    return len(page.messages), ledger
+
+
+def _finish_if_complete(run_id):
+    """Enqueue the last stage once every page of a fully listed run is done.
+    The row lock makes sure only one caller sees the run complete."""
+    with transaction.atomic():
+        run = FetchRun.objects.select_for_update().get(pk=run_id)
+        complete = (
+            run.status == FetchRun.RUNNING
+            and run.pages_total is not None
+            and run.pages_done == run.pages_total
+        )
+        if complete:
+            run.status = FetchRun.FINISHING
+            run.classified_at = timezone.now()
+            run.save(update_fields=["status", "classified_at"])
+    if complete:
+        finish_fetch_task.delay(run_id)
+
+
+@shared_task(acks_late=True)
+def finish_fetch_task(run_id):
+    run = FetchRun.objects.select_related("user").get(pk=run_id)
+    if run.status != FetchRun.FINISHING:
+        # Redelivered after it already finished
+        return
+    refresh_fetch_lock(run.user_id, run.task_id)
+    pages = list(run.pages.order_by("index"))
+    found_jobs = [job for page in pages for job in page.found_jobs]
+    run.status = FetchRun.FAILED
+    try:
+        jobs = save_jobs(run.user, found_jobs)
+        history_id, fetch_date = next_start(
+            run.user, run.history_id, run.sync_state, run.messages_failed
+        )
+        run.rows_written = finish_fetch(
+            run.user, jobs, history_id, fetch_date=fetch_date
+        )
+        run.status = FetchRun.DONE
+        run.pages.all().delete()
+        run.threads.all().delete()
+        print(f"Total emails fetched: {sum(len(page.messages) for page in pages)}")
+        print(f"Emails skipped by the prefilter: {sum(p.skipped for p in pages)}")
+    except HttpError as error:
+        print(f"An error occurred: {error}")
+    finally:
+        run.finished_at = timezone.now()
+        run.save(update_fields=["status", "rows_written", "finished_at"])
+        release_fetch_lock(run.user_id, run.task_id)
+    # Push notifications that coalesced into this run after it listed
+    if run.status == FetchRun.DONE and needs_catch_up(run.user_id, run.history_id):
+        enqueue_fetch(run.user_id)
+
+
+def enqueue_fetch(user_id):
+    """Start a fetch for the user, or return the id of the fetch task already
+    running so that repeated requests coalesce into it."""
+    task_id = str(uuid.uuid4())
+    running_task_id = acquire_fetch_lock(user_id, task_id)
+    if running_task_id == task_id:
+        try:
+            fetch_emails_task.apply_async(args=[user_id], task_id=task_id)
+        except KombuError:
+            # The task was never published, so nothing would release the lock
+            release_fetch_lock(user_id, task_id)
+            raise
+    return running_task_id
+
+
+def get_active_user_ids(shard, shards):
+    """Ids of users with a connected sheet and a first fetch done, in one shard.
+    In push mode users with a live Gmail watch are fetched on notification
+    instead."""
     User = get_user_model()
-    user = User.objects.get(id=user_id)
-    get_emails(user)
+    users = User.objects.filter(
+        google_sheet_id__isnull=False, fetchlog__isnull=False
+    ).exclude(google_refresh_token="")
+    if push_enabled():
+        users = users.exclude(gmailwatch__expiration__gt=timezone.now())
+    return list(
+        users.annotate(shard=F("id") % shards)
+        .filter(shard=shard)
+        .values_list("id", flat=True)
+        .distinct()
+        .order_by("id")
+    )
+
+
+@shared_task
+def schedule_user_fetches():
+    """Periodic entry point: fan the active users out to one task per shard."""
+    shards = settings.FETCH_SCHEDULE_SHARDS
+    for shard in range(shards):
+        schedule_fetch_shard.delay(shard, shards)
+
+
+@shared_task
+def schedule_fetch_shard(shard, shards):
+    """Enqueue the fetches of one shard, spread evenly over the interval."""
+    user_ids = get_active_user_ids(shard, shards)
+    interval = settings.FETCH_SCHEDULE_INTERVAL
+    for index, user_id in enumerate(user_ids):
+        fetch_emails_task.apply_async(
+            args=[user_id], countdown=interval * index // len(user_ids)
+        )
+    print(f"Scheduled {len(user_ids)} fetches for shard {shard + 1}/{shards}.")
+
+
+@shared_task
+def renew_gmail_watches():
+    """Periodic entry point in push mode: start a Gmail watch for new users
+    and renew the ones about to expire."""
+    if not push_enabled():
+        return
+    renewed = 0
+    for user in get_users_to_watch():
+        try:
+            start_watch(user, get_user_gmail_service(user))
+            renewed += 1
+        except Exception as error:
+            # The user stays in scheduled fetching until a watch succeeds
+            print(f"Could not watch the mailbox of user {user.id}: {error}")
+    print(f"Renewed {renewed} Gmail watches.")
@@ -0,0 +1,100 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.utils import timezone
+
+from google.oauth2.credentials import Credentials
+
+from .. import authenticate
+from ..models import User
+
+
+def fake_refresh(creds, request):
+    creds.token = "refreshed"
+    creds.expiry = (timezone.now() + timedelta(hours=1)).replace(tzinfo=None)
+
+
+@patch.dict(
+    "os.environ",
+    {"GOOGLE_API_CLIENT_ID": "client-id", "GOOGLE_API_CLIENT_SECRET": "secret"},
+)
+class CachedServiceTest(TestCase):
+    """Test cases for the per-user Google service cache"""
+
+    def setUp(self):
+        authenticate._service_cache.clear()
+        self.user = User.objects.create_user(email="user@example.com")
+        self.user.google_access_token = "access"
+        self.user.google_refresh_token = "refresh"
+        self.user.token_expiry = timezone.now() + timedelta(hours=1)
+        self.user.save()
+
+    def test_reuses_service_until_token_changes(self):
+        service = authenticate.get_user_gmail_service(self.user)
+        self.assertIs(authenticate.get_user_gmail_service(self.user), service)
+        self.assertIsNot(authenticate.get_user_googlesheet_service(self.user), service)
+
+        self.user.google_access_token = "new-access"
+        self.assertIsNot(authenticate.get_user_gmail_service(self.user), service)
+
+    @patch.object(Credentials, "refresh", fake_refresh)
+    def test_rebuilds_after_token_expiry(self):
+        service = authenticate.get_user_gmail_service(self.user)
+        User.objects.filter(pk=self.user.pk).update(token_expiry=timezone.now())
+        self.user.token_expiry = timezone.now()
+        authenticate._service_cache[(self.user.pk, "gmail", "v1")][
+            "expires_at"
+        ] = self.user.token_expiry
+        self.assertIsNot(authenticate.get_user_gmail_service(self.user), service)
+        self.assertEqual(self.user.google_access_token, "refreshed")
+
+    @patch.object(authenticate, "SERVICE_CACHE_SIZE", 1)
+    def test_evicts_least_recently_used(self):
+        authenticate.get_user_gmail_service(self.user)
+        authenticate.get_user_googlesheet_service(self.user)
+        self.assertEqual(
+            list(authenticate._service_cache), [(self.user.pk, "sheets", "v4")]
+        )
+
+
+@patch.dict(
+    "os.environ",
+    {"GOOGLE_API_CLIENT_ID": "client-id", "GOOGLE_API_CLIENT_SECRET": "secret"},
+)
+class UserCredentialsTest(TestCase):
+    """Test cases for refreshing and persisting user tokens"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com")
+        self.user.google_access_token = "access"
+        self.user.google_refresh_token = "refresh"
+        self.user.token_expiry = timezone.now() + timedelta(hours=1)
+        self.user.save()
+
+    @patch.object(Credentials, "refresh")
+    def test_fresh_token_needs_no_refresh(self, refresh):
+        creds = authenticate.get_user_credentials(self.user)
+        refresh.assert_not_called()
+        self.assertEqual(creds.token, "access")
+        self.assertTrue(creds.valid)
+
+    @patch.object(Credentials, "refresh", autospec=True, side_effect=fake_refresh)
+    def test_expiring_token_is_refreshed_and_saved(self, refresh):
+        self.user.token_expiry = timezone.now() + timedelta(seconds=30)
+        self.user.save()
+        creds = authenticate.get_user_credentials(self.user)
+        self.assertEqual(refresh.call_count, 1)
+        self.assertEqual(creds.token, "refreshed")
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.google_access_token, "refreshed")
+        self.assertGreater(self.user.token_expiry, timezone.now())
+
+    @patch.object(Credentials, "refresh")
+    def test_reuses_token_saved_by_another_task(self, refresh):
+        stale = User.objects.get(pk=self.user.pk)
+        stale.token_expiry = timezone.now() - timedelta(minutes=1)
+        creds = authenticate.get_user_credentials(stale)
+        refresh.assert_not_called()
+        self.assertEqual(creds.token, "access")
+        self.assertEqual(stale.token_expiry, self.user.token_expiry)
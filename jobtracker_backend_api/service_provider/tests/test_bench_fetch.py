@@ -0,0 +1,37 @@
+from django.test import TestCase
+
+from ..fakes import FakeGmailService, FakeOpenAI, FakeSheetsService, SyntheticMailbox
+from ..management.commands.bench_fetch import percentile, run_fetch_benchmark
+
+
+class FetchBenchmarkTest(TestCase):
+    """Test cases for the offline fetch benchmark"""
+
+    def test_fetch_against_fakes_finds_every_job(self):
+        mailbox = SyntheticMailbox(size=250, seed=1)
+        gmail = FakeGmailService(mailbox)
+        report = run_fetch_benchmark(
+            mailbox,
+            gmail,
+            FakeSheetsService(),
+            FakeOpenAI(mailbox),
+            env={
+                "FETCH_BATCH_SIZE": "50",
+                "GMAIL_METADATA_FIRST": "true",
+                "RATE_LIMIT_ENABLED": "false",
+            },
+        )
+        self.assertEqual(report["jobs_saved"], len(mailbox.expected_jobs))
+        self.assertEqual(report["rows_written"], len(mailbox.expected_jobs))
+        calls = report["calls"]
+        self.assertEqual(calls["gmail.messages.list"], 5)
+        # One metadata and one body batch per page
+        self.assertEqual(calls["gmail.batch"], 10)
+        self.assertEqual(calls["sheets.values.batchUpdate"], 1)
+        self.assertLess(calls["openai.chat.completions"], 250)
+        self.assertEqual(len(report["durations"]["download_emails"]), 5)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual((percentile(values, 50), percentile(values, 99)), (51, 100))
+        self.assertEqual(percentile([], 50), 0.0)
@@ -0,0 +1,151 @@
+import io
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..body_normalizer import BodyNormalizer, count_tokens
+from ..email_services import extract_body
+from .test_email_services import load_email
+
+REPLY = """Hi Jordan,
+
+Thanks for applying to the Data Analyst role at Globex. We would like to
+invite you to a phone screen next week.
+
+Track your application: https://globex.example-ats.com/candidate/apps/8f2e?utm_source=email&utm_campaign=screen
+
+This email and any attachments are confidential and intended solely for the
+addressee. If you have received this email in error, please delete it.
+
+On Mon, Jun 2, 2025 at 9:14 AM Globex Recruiting <jobs@globex.example>
+wrote:
+> Hi Jordan,
+>
+> Thank you for applying to Globex.
+"""
+
+
+class BodyNormalizerTest(TestCase):
+    """Test cases for normalizing email bodies before extraction"""
+
+    def setUp(self):
+        self.normalizer = BodyNormalizer()
+        self.normalizer.enabled = True
+        self.normalizer.token_budget = 512
+
+    def test_strips_quotes_footers_and_links(self):
+        self.normalizer.track_tokens = True
+        body = self.normalizer.normalize("Phone screen", REPLY)
+        self.assertEqual(
+            body.split("\n"),
+            [
+                "Hi Jordan,",
+                "Thanks for applying to the Data Analyst role at Globex. We would "
+                "like to invite you to a phone screen next week.",
+                "Track your application: globex.example-ats.com",
+            ],
+        )
+        report = self.normalizer.report()
+        self.assertEqual(report["tokens_in"], count_tokens(REPLY))
+        self.assertEqual(report["tokens_out"], count_tokens(body))
+
+    def test_keeps_status_next_to_boilerplate_phrases(self):
+        rejection = (
+            "Hi Jane,\n\nThis is an automated message about your application. "
+            "Unfortunately, we have decided not to move forward with your "
+            "candidacy for the Backend Engineer role. Please do not reply.\n\n"
+            "Best, Acme Talent Team\n\nUnsubscribe | Privacy Policy"
+        )
+        self.assertEqual(
+            self.normalizer.normalize("Your application", rejection).split("\n"),
+            [
+                "Hi Jane,",
+                "This is an automated message about your application. "
+                "Unfortunately, we have decided not to move forward with your "
+                "candidacy for the Backend Engineer role. Please do not reply.",
+                "Best, Acme Talent Team",
+            ],
+        )
+        invite = (
+            "Hi Jane,\n\nWe would like to invite you to an interview for the "
+            "Data Analyst role. Powered by Greenhouse, do not reply to this "
+            "address; if you have received this in error, let us know.\n\nThanks"
+        )
+        body = self.normalizer.normalize("Interview", invite)
+        self.assertIn("invite you to an interview for the Data Analyst role", body)
+        self.assertTrue(body.endswith("Thanks"))
+
+    def test_token_counts_are_only_tracked_on_request(self):
+        self.normalizer.normalize("Phone screen", REPLY)
+        report = self.normalizer.report()
+        self.assertEqual((report["emails"], report["tokens_in"]), (1, 0))
+
+    def test_outlook_history_and_all_quote_messages(self):
+        reply = "Sounds good, I accept the offer and can start on June 2nd."
+        text = f"{reply}\n\nFrom: Acme HR\nSent: Monday\nSubject: Offer"
+        self.assertEqual(self.normalizer.normalize("Re: Offer", text), reply)
+        self.assertEqual(
+            self.normalizer.normalize("Fwd", "> Your offer from Acme"),
+            "> Your offer from Acme",
+        )
+
+    def test_short_reply_keeps_the_history_it_answers(self):
+        text = (
+            "Tuesday at 3pm works.\n\nOn Mon, Jun 2, 2025 Acme HR wrote:\n"
+            "> Can you do a phone screen for the Engineer role this week?"
+        )
+        body = self.normalizer.normalize("Re: Phone screen", text)
+        self.assertIn("Tuesday at 3pm works.", body)
+        self.assertIn("phone screen for the Engineer role", body)
+
+    def test_forwarded_message_is_kept(self):
+        text = (
+            "FYI, see below - I think this is good news for the application.\n\n"
+            "---------- Forwarded message ---------\n"
+            "From: Acme HR <hr@acme.example>\n"
+            "Date: Mon, Jun 2, 2025\n"
+            "Subject: Offer\n\n"
+            "We are happy to offer you the Engineer role."
+        )
+        body = self.normalizer.normalize("Fwd: Offer", text)
+        self.assertIn("offer you the Engineer role", body)
+        body = self.normalizer.normalize(
+            "Fwd: Offer", text.replace("---------- Forwarded", "Begin forwarded")
+        )
+        self.assertIn("offer you the Engineer role", body)
+
+    def test_keeps_subject_and_opening_paragraphs_within_budget(self):
+        self.normalizer.token_budget = 120
+        paragraphs = [f"Paragraph {i} " + "word " * 60 for i in range(5)]
+        body = self.normalizer.normalize("Your application", "\n\n".join(paragraphs))
+        self.assertTrue(body.startswith("Paragraph 0"))
+        self.assertNotIn("Paragraph 2", body)
+        self.assertLessEqual(count_tokens("Your application") + count_tokens(body), 120)
+        self.assertEqual(self.normalizer.report()["truncated"], 1)
+
+    def test_html_blocks_become_paragraphs(self):
+        body = self.normalizer.normalize(
+            "Update", extract_body(load_email("rejection.eml"))
+        )
+        self.assertEqual(body.split("\n")[0], "Dear Jordan,")
+        self.assertTrue(body.endswith("Initech Talent Team"))
+
+    def test_disabled_flattens_body(self):
+        self.normalizer.enabled = False
+        self.assertEqual(
+            self.normalizer.normalize("Hi", "Line one\nLine two\n"), "Line oneLine two"
+        )
+
+
+class ReportBodyTokensTest(TestCase):
+    """Test cases for the report_body_tokens command"""
+
+    @patch.dict("os.environ", {"RATE_LIMIT_ENABLED": "false"})
+    def test_reports_tokens_saved_per_step(self):
+        stdout = io.StringIO()
+        call_command("report_body_tokens", "--synthetic", "100", stdout=stdout)
+        output = stdout.getvalue()
+        self.assertIn("Emails: 100", output)
+        self.assertIn("saved (", output)
+        self.assertIn("quoted history", output)
@@ -1,8 +1,32 @@
-from unittest.mock import MagicMock
-from django.test import TestCase
 import base64
+import email
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from ..email_services import (
+    GMAIL_BATCH_LIMIT,
+    HistoryExpiredError,
+    download_emails,
+    download_messages,
+    extract_body,
+    extract_page,
+    extract_payload_body,
+    extract_text_content,
+    get_history_messages_and_next_page_token,
+    list_message_page,
+    parse_payload_message,
+    save_jobs,
+)
+from ..models import JobApplied, User
 
-from ..email_services import extract_text_content
 
 class ExtractTextContentTest(TestCase):
     """Test cases for extract_text_content function"""
@@ -13,4 +37,420 @@ class ExtractTextContentTest(TestCase):
         part.get.return_value = ""
         part.get_content_charset.return_value = "utf-8"
         part.get_payload.return_value = b"Plain text body"
-        self.assertEqual(extract_text_content(part), "Plain text body")
\ No newline at end of file
+        self.assertEqual(extract_text_content(part), "Plain text body")
+
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "emails"
+
+
+def load_email(name):
+    return email.message_from_bytes((FIXTURES / name).read_bytes())
+
+
+class ExtractBodyTest(TestCase):
+    """Test cases for extract_body function"""
+
+    def test_prefers_plain_text(self):
+        body = extract_body(load_email("ats_confirmation.eml"))
+        self.assertIn("Software Engineer, Backend position at Acme", body)
+        self.assertNotIn("Powered by Greenhouse", body)
+
+    def test_falls_back_to_html(self):
+        body = extract_body(load_email("rejection.eml"))
+        self.assertIn("Product Designer position at Initech", body)
+        self.assertNotIn("<p>", body)
+
+    def test_drops_script_and_style(self):
+        body = extract_body(load_email("marketing_newsletter.eml"))
+        self.assertIn("Summer Sale", body)
+        self.assertNotIn("dataLayer", body)
+        self.assertNotIn("margin:", body)
+
+    def test_skips_attachments(self):
+        body = extract_body(load_email("interview_invite.eml"))
+        self.assertIn("Data Analyst role at Globex", body)
+        self.assertNotIn("VCALENDAR", body)
+
+    def test_caps_decoded_bytes(self):
+        message = MIMEMultipart()
+        for _ in range(2):
+            message.attach(MIMEText("\u00e9" * 40, "plain", "utf-8"))
+        body = extract_body(message, max_bytes=100)
+        # 80 bytes of the first part, 20 of the second
+        self.assertEqual(len(body.replace("\n", "").encode()), 100)
+
+
+class ExtractPayloadBodyTest(TestCase):
+    """Test cases for extract_payload_body function"""
+
+    def test_cut_html_drops_partial_tag(self):
+        html = b"<p>Hello</p><span>world</span>"
+        payload = {
+            "mimeType": "text/html",
+            "body": {"data": base64.urlsafe_b64encode(html).decode()},
+        }
+        self.assertEqual(extract_payload_body(payload, max_bytes=16), "Hello")
+
+
+class FakeBatch:
+    """Stand-in for googleapiclient's BatchHttpRequest."""
+
+    def __init__(self, callback, failing_ids):
+        self.callback = callback
+        self.failing_ids = failing_ids
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append(request_id)
+
+    def execute(self):
+        for request_id in self.requests:
+            if request_id in self.failing_ids:
+                error = self.failing_ids[request_id]
+                if isinstance(error, list):
+                    error = error.pop(0) if error else None
+                if error is not None:
+                    self.callback(request_id, None, error)
+                    continue
+            self.callback(request_id, {"id": request_id, "raw": ""}, None)
+
+
+class DownloadMessagesTest(TestCase):
+    """Test cases for download_messages function"""
+
+    def setUp(self):
+        self.batches = []
+        self.failing_ids = {"m3": Exception("boom")}
+        self.gmail_service = MagicMock()
+
+        def new_batch(callback):
+            batch = FakeBatch(callback, self.failing_ids)
+            self.batches.append(batch)
+            return batch
+
+        self.gmail_service.new_batch_http_request.side_effect = new_batch
+
+    def test_skips_failed_messages(self):
+        messages = [{"id": f"m{i}"} for i in range(5)]
+        payloads = download_messages(self.gmail_service, messages)
+        self.assertEqual(sorted(payloads), ["m0", "m1", "m2", "m4"])
+        self.assertEqual(len(self.batches), 1)
+
+    def test_splits_into_batch_limit_chunks(self):
+        messages = [{"id": f"m{i}"} for i in range(GMAIL_BATCH_LIMIT + 1)]
+        download_messages(self.gmail_service, messages)
+        self.assertEqual(
+            [len(batch.requests) for batch in self.batches], [GMAIL_BATCH_LIMIT, 1]
+        )
+
+    @patch("jobtracker_backend_api.service_provider.email_services.time.sleep")
+    def test_retries_rate_limited_messages(self, sleep):
+        self.failing_ids = {"m1": [http_error(429)], "m3": [http_error(500)] * 9}
+        messages = [{"id": f"m{i}"} for i in range(5)]
+        with patch.dict("os.environ", {"RATE_LIMIT_ENABLED": "false"}):
+            payloads = download_messages(self.gmail_service, messages)
+        # m3 keeps failing until the retries run out
+        self.assertEqual(sorted(payloads), ["m0", "m1", "m2", "m4"])
+        self.assertEqual(
+            [batch.requests for batch in self.batches[:2]],
+            [[f"m{i}" for i in range(5)], ["m1", "m3"]],
+        )
+
+
+def http_error(status):
+    return HttpError(httplib2.Response({"status": status}), b"")
+
+
+class HistorySyncTest(TestCase):
+    """Test cases for historyId based incremental sync"""
+
+    def setUp(self):
+        self.gmail_service = MagicMock()
+        self.history_list = self.gmail_service.users().history().list
+
+    def test_collects_added_messages(self):
+        self.history_list.return_value.execute.return_value = {
+            "history": [
+                {"messagesAdded": [{"message": {"id": "a", "threadId": "t1"}}]},
+                {
+                    "messagesAdded": [
+                        {"message": {"id": "a", "threadId": "t1"}},
+                        {
+                            "message": {
+                                "id": "b",
+                                "threadId": "t2",
+                                "labelIds": ["SPAM"],
+                            }
+                        },
+                        {
+                            "message": {
+                                "id": "c",
+                                "threadId": "t3",
+                                "labelIds": ["INBOX"],
+                            }
+                        },
+                    ]
+                },
+            ],
+            "nextPageToken": "next",
+        }
+        messages, next_page_token = get_history_messages_and_next_page_token(
+            self.gmail_service, "100"
+        )
+        self.assertEqual([msg["id"] for msg in messages], ["a", "c"])
+        self.assertEqual(next_page_token, "next")
+
+    def test_expired_history_raises(self):
+        self.history_list.return_value.execute.side_effect = http_error(404)
+        with self.assertRaises(HistoryExpiredError):
+            get_history_messages_and_next_page_token(self.gmail_service, "100")
+
+    def test_falls_back_to_date_scan(self):
+        self.history_list.return_value.execute.side_effect = http_error(404)
+        messages_list = self.gmail_service.users().messages().list
+        messages_list.return_value.execute.return_value = {"messages": [{"id": "x"}]}
+        sync_state = {"start_history_id": "100", "after_date_string": "2025/01/01"}
+
+        messages, _ = list_message_page(self.gmail_service, sync_state, "stale", 10)
+
+        self.assertEqual(messages, [{"id": "x"}])
+        self.assertIsNone(sync_state["start_history_id"])
+        messages_list.assert_called_with(
+            userId="me", q="after:2025/01/01", maxResults=10, pageToken=None
+        )
+
+
+@patch.dict("os.environ", {"EXTRACTION_BATCH_SIZE": "1"})
+class ExtractPageTest(TestCase):
+    """Test cases for extract_page function"""
+
+    def test_keeps_order_and_isolates_failures(self):
+        def fake_extract(subject, body, sender):
+            time.sleep(0.01 * (5 - int(subject)))
+            if subject == "2":
+                raise ValueError("bad response")
+            return True, f"Job {subject}", "Acme", "applied"
+
+        emails = [
+            {"id": str(i), "subject": str(i), "body": "", "sender": None}
+            for i in range(5)
+        ]
+        with patch(
+            "jobtracker_backend_api.service_provider.email_services.extract_email_data",
+            side_effect=fake_extract,
+        ):
+            results = extract_page(emails)
+
+        self.assertEqual(
+            [result and result[1] for result in results],
+            ["Job 0", "Job 1", None, "Job 3", "Job 4"],
+        )
+
+    @patch.dict("os.environ", {"EXTRACTION_CONCURRENCY": "10"})
+    def test_runs_concurrently(self):
+        def slow_extract(subject, body, sender):
+            time.sleep(0.2)
+            return False, None, None, None
+
+        emails = [
+            {"id": str(i), "subject": "", "body": "", "sender": None} for i in range(10)
+        ]
+        with patch(
+            "jobtracker_backend_api.service_provider.email_services.extract_email_data",
+            side_effect=slow_extract,
+        ):
+            start = time.monotonic()
+            extract_page(emails)
+        self.assertLess(time.monotonic() - start, 1.0)
+
+    @patch.dict("os.environ", {"EXTRACTION_BATCH_SIZE": "10"})
+    def test_batches_through_the_extractor(self):
+        emails = [
+            {"id": str(i), "subject": str(i), "body": "", "sender": None}
+            for i in range(3)
+        ]
+        with patch(
+            "jobtracker_backend_api.service_provider.email_services.email_extractor"
+        ) as extractor:
+            extractor.get_responses.return_value = [
+                {"is_job_application_email": True, "job_title": "Engineer"},
+                None,
+                {"is_job_application_email": False},
+            ]
+            results = extract_page(emails)
+        extractor.get_responses.assert_called_once_with(emails)
+        self.assertEqual(
+            results, [(True, "Engineer", None, None), None, (False, None, None, None)]
+        )
+
+
+def found_job(job_title, company, status="applied", internal_date=0):
+    return {
+        "job_title": job_title,
+        "company": company,
+        "status": status,
+        "sender_email": "jobs@example.com",
+        "internal_date": internal_date,
+    }
+
+
+class SaveJobsTest(TestCase):
+    """Test cases for save_jobs function"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com")
+        JobApplied.objects.create(
+            user=self.user,
+            job_title="Engineer",
+            company="Acme",
+            status="applied",
+            row_number=2,
+        )
+
+    def test_upserts_page_in_constant_queries(self):
+        page = [found_job(f"Role {i}", "Globex") for i in range(20)]
+        page.append(found_job("Engineer", "Acme", "interview"))
+        # savepoint, user lock, existing rows, last row, bulk upsert, release
+        with self.assertNumQueries(7):
+            rows = save_jobs(self.user, page)
+
+        self.assertEqual(len(rows), 21)
+        engineer = JobApplied.objects.get(job_title="Engineer")
+        self.assertEqual((engineer.status, engineer.row_number), ("interview", 2))
+        self.assertEqual(
+            sorted(
+                JobApplied.objects.filter(company="Globex").values_list(
+                    "row_number", flat=True
+                )
+            ),
+            list(range(3, 23)),
+        )
+
+    def test_repeated_job_keeps_last_status(self):
+        rows = save_jobs(
+            self.user,
+            [found_job("Analyst", "Initech"), found_job("Analyst", "Initech", "offer")],
+        )
+        self.assertEqual(
+            rows,
+            [
+                {
+                    "job_title": "Analyst",
+                    "company": "Initech",
+                    "status": "offer",
+                    "row_number": 3,
+                }
+            ],
+        )
+        self.assertEqual(JobApplied.objects.filter(job_title="Analyst").count(), 1)
+
+    def test_repeated_job_keeps_status_of_newest_message(self):
+        applied = found_job("Analyst", "Initech", "applied", 1000)
+        offer = found_job("Analyst", "Initech", "offer", 2000)
+        # Date mode lists newest first, history mode oldest first
+        for order in ([offer, applied], [applied, offer]):
+            with self.subTest(order=[job["status"] for job in order]):
+                rows = save_jobs(self.user, order)
+                self.assertEqual(rows[0]["status"], "offer")
+                job = JobApplied.objects.get(job_title="Analyst")
+                self.assertEqual(job.status, "offer")
+                job.delete()
+
+    def test_missing_company_is_deduplicated(self):
+        save_jobs(self.user, [found_job("Analyst", None)])
+        save_jobs(self.user, [found_job("Analyst", None, "rejected")])
+        job = JobApplied.objects.get(job_title="Analyst")
+        self.assertEqual((job.company, job.status), ("", "rejected"))
+
+
+def b64(text):
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+
+def headers(**values):
+    return [{"name": name.replace("_", "-"), "value": v} for name, v in values.items()]
+
+
+FULL_MESSAGE = {
+    "id": "m1",
+    "threadId": "t1",
+    "labelIds": ["INBOX"],
+    "payload": {
+        "mimeType": "multipart/mixed",
+        "headers": headers(From="jobs@acme.example", Subject="Your application"),
+        "parts": [
+            {
+                "mimeType": "multipart/alternative",
+                "parts": [
+                    {
+                        "mimeType": "text/plain",
+                        "headers": headers(Content_Type='text/plain; charset="utf-8"'),
+                        "body": {"data": b64("Thanks for applying \u2013 Acme")},
+                    },
+                    {
+                        "mimeType": "text/html",
+                        "body": {"data": b64("<p>Thanks for applying</p>")},
+                    },
+                ],
+            },
+            {
+                "mimeType": "application/pdf",
+                "filename": "offer.pdf",
+                "body": {"attachmentId": "a1", "size": 50000},
+            },
+        ],
+    },
+}
+
+
+class PayloadMessageTest(TestCase):
+    """Test cases for metadata-first downloads"""
+
+    def test_parse_full_message(self):
+        email_data = parse_payload_message(FULL_MESSAGE)
+        self.assertEqual(email_data["subject"], "Your application")
+        self.assertEqual(email_data["headers"]["from"], "jobs@acme.example")
+        self.assertEqual(email_data["body"], "Thanks for applying \u2013 Acme")
+
+    def test_parse_metadata_message(self):
+        email_data = parse_payload_message(
+            {"id": "m1", "payload": {"headers": headers(From="a@b.example")}}
+        )
+        self.assertEqual(
+            (email_data["subject"], email_data["body"]), ("No Subject", "")
+        )
+
+    def test_downloads_bodies_only_for_screened_messages(self):
+        newsletter = {
+            "id": "m2",
+            "labelIds": ["CATEGORY_PROMOTIONS"],
+            "payload": {
+                "headers": headers(
+                    From="news@shop.example", Subject="Sale", List_Unsubscribe="<x>"
+                )
+            },
+        }
+        calls = []
+
+        def fake_download(service, messages, message_format="raw", **params):
+            calls.append((message_format, [msg["id"] for msg in messages], params))
+            if message_format == "metadata":
+                return {"m1": FULL_MESSAGE, "m2": newsletter}
+            return {"m1": FULL_MESSAGE}
+
+        with patch(
+            "jobtracker_backend_api.service_provider.email_services.download_messages",
+            side_effect=fake_download,
+        ):
+            emails, skipped = download_emails(MagicMock(), [{"id": "m1"}, {"id": "m2"}])
+
+        self.assertEqual(([e["id"] for e in emails], skipped), (["m1"], 1))
+        self.assertEqual(
+            [(fmt, ids) for fmt, ids, _ in calls],
+            [
+                ("metadata", ["m1", "m2"]),
+                ("full", ["m1"]),
+            ],
+        )
+        self.assertIn("fields", calls[0][2])
+        self.assertIn("metadataHeaders", calls[0][2])
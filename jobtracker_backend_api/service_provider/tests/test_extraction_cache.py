@@ -0,0 +1,69 @@
+from unittest.mock import MagicMock
+
+from django.test import TestCase
+
+from ..extraction_cache import CachedExtractor, make_cache_key
+from ..models import ExtractionCache
+
+RESPONSE = {
+    "is_job_application_email": True,
+    "job_title": "Engineer",
+    "company_name": "Acme",
+    "status": "applied",
+}
+
+
+class CachedExtractorTest(TestCase):
+    """Test cases for CachedExtractor"""
+
+    def setUp(self):
+        self.extractor = MagicMock(
+            model="gpt-test", prompt_version="1", batch_prompt_version="batch-1"
+        )
+        self.extractor.get_response.return_value = RESPONSE
+        self.cached = CachedExtractor(self.extractor)
+
+    def test_key_ignores_whitespace_and_case(self):
+        self.assertEqual(
+            make_cache_key("Hello", "Thanks  for\napplying", "m", "1"),
+            make_cache_key("hello ", "thanks for applying", "m", "1"),
+        )
+
+    def test_key_changes_with_prompt_version(self):
+        self.assertNotEqual(
+            make_cache_key("Hello", "Body", "m", "1"),
+            make_cache_key("Hello", "Body", "m", "2"),
+        )
+
+    def test_repeat_lookup_skips_extractor(self):
+        self.assertEqual(self.cached.get_response("Subject", "Body"), RESPONSE)
+        self.assertEqual(self.cached.get_response("subject", "body "), RESPONSE)
+        self.extractor.get_response.assert_called_once()
+        self.assertEqual((self.cached.hits, self.cached.misses), (1, 1))
+
+    def test_prune_keeps_newest_entries(self):
+        self.cached.max_entries = 2
+        for i in range(4):
+            self.cached.get_response(f"Subject {i}", "Body")
+        self.cached.prune()
+        self.assertEqual(ExtractionCache.objects.count(), 2)
+        self.assertEqual(self.cached.get_response("Subject 3", "Body"), RESPONSE)
+        self.assertEqual(self.extractor.get_response.call_count, 4)
+
+    def test_batch_passes_only_misses_on(self):
+        self.extractor.get_responses.side_effect = [[RESPONSE], [RESPONSE, None]]
+        self.cached.get_responses([{"subject": "Cached", "body": "Body"}])
+        emails = [
+            {"subject": subject, "body": "Body"} for subject in ("A", "Cached", "B")
+        ]
+        self.assertEqual(self.cached.get_responses(emails), [RESPONSE, RESPONSE, None])
+        self.extractor.get_responses.assert_called_with([emails[0], emails[2]])
+        # The failed email is not cached
+        self.assertEqual(ExtractionCache.objects.count(), 2)
+
+    def test_batch_answers_are_cached_apart_from_single_ones(self):
+        self.extractor.get_responses.return_value = [RESPONSE]
+        self.cached.get_response("Subject", "Body")
+        self.cached.get_responses([{"subject": "Subject", "body": "Body"}])
+        self.extractor.get_responses.assert_called_once()
+        self.assertEqual(ExtractionCache.objects.count(), 2)
@@ -0,0 +1,110 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ..fakes import FakeGmailService, SyntheticMailbox
+from ..gmail_watch import start_watch
+from ..management.commands.publish_gmail_notification import build_push_body
+from ..models import FetchLog, FetchRun, GmailWatch, User
+from ..tasks import finish_fetch_task, get_active_user_ids, renew_gmail_watches
+
+TASKS = "jobtracker_backend_api.service_provider.tasks"
+VIEWS = "jobtracker_backend_api.service_provider.views"
+
+
+def create_active_user(email):
+    user = User.objects.create_user(email=email)
+    user.google_refresh_token = "refresh"
+    user.google_sheet_id = "sheet"
+    user.save()
+    FetchLog.objects.create(user=user, last_fetch_date="2025-01-01T00:00Z")
+    return user
+
+
+@override_settings(
+    GMAIL_PUBSUB_TOPIC="projects/p/topics/gmail", GMAIL_PUSH_TOKEN="secret"
+)
+class GmailPushTest(TestCase):
+    """Test cases for fetching on Gmail watch notifications"""
+
+    def setUp(self):
+        self.user = create_active_user("user@example.com")
+        self.gmail = FakeGmailService(SyntheticMailbox(10))
+        start_watch(self.user, self.gmail)
+
+    def push(self, email, history_id, token="secret"):
+        return self.client.post(
+            f"/gmail/push/?token={token}",
+            build_push_body(email, history_id),
+            content_type="application/json",
+        )
+
+    def test_start_watch_records_expiration(self):
+        watch = GmailWatch.objects.get(user=self.user)
+        self.assertEqual(watch.history_id, "10")
+        self.assertGreater(watch.expiration, timezone.now() + timedelta(days=6))
+        self.assertEqual(self.gmail.calls["gmail.users.watch"], 1)
+
+    @patch(f"{VIEWS}.enqueue_fetch")
+    def test_notification_enqueues_fetch_once(self, enqueue_fetch):
+        self.assertEqual(self.push("user@example.com", 12).status_code, 204)
+        # Redelivered by Pub/Sub
+        self.assertEqual(self.push("user@example.com", 12).status_code, 204)
+        enqueue_fetch.assert_called_once_with(self.user.id)
+
+    @patch(f"{VIEWS}.enqueue_fetch")
+    def test_unknown_mailbox_and_bad_body_are_acknowledged(self, enqueue_fetch):
+        self.assertEqual(self.push("stranger@example.com", 12).status_code, 204)
+        response = self.client.post(
+            "/gmail/push/?token=secret",
+            {"message": {}},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 204)
+        enqueue_fetch.assert_not_called()
+
+    @patch(f"{VIEWS}.enqueue_fetch")
+    def test_wrong_token_is_rejected(self, enqueue_fetch):
+        self.assertEqual(self.push("user@example.com", 12, "guess").status_code, 403)
+        enqueue_fetch.assert_not_called()
+
+    def test_watched_users_are_not_scheduled(self):
+        other = create_active_user("other@example.com")
+        self.assertEqual(get_active_user_ids(0, 1), [other.id])
+        with override_settings(GMAIL_PUBSUB_TOPIC=""):
+            self.assertEqual(get_active_user_ids(0, 1), [self.user.id, other.id])
+
+    @patch(f"{TASKS}.get_user_gmail_service")
+    def test_renews_missing_and_expiring_watches(self, get_service):
+        get_service.return_value = self.gmail
+        other = create_active_user("other@example.com")
+        renew_gmail_watches()
+        self.assertEqual(self.gmail.calls["gmail.users.watch"], 2)
+        self.assertTrue(GmailWatch.objects.filter(user=other).exists())
+
+        GmailWatch.objects.filter(user=self.user).update(
+            expiration=timezone.now() + timedelta(hours=1)
+        )
+        renew_gmail_watches()
+        self.assertEqual(self.gmail.calls["gmail.users.watch"], 3)
+        watch = GmailWatch.objects.get(user=self.user)
+        self.assertGreater(watch.expiration, timezone.now() + timedelta(days=6))
+
+    @patch(f"{TASKS}.enqueue_fetch")
+    @patch(f"{TASKS}.finish_fetch", return_value=0)
+    def test_catches_up_on_notifications_after_listing(self, _, enqueue_fetch):
+        run = FetchRun.objects.create(
+            user=self.user, task_id="t", history_id="12", status=FetchRun.FINISHING
+        )
+        GmailWatch.objects.filter(user=self.user).update(notified_history_id="12")
+        finish_fetch_task(run.id)
+        enqueue_fetch.assert_not_called()
+
+        run = FetchRun.objects.create(
+            user=self.user, task_id="t2", history_id="12", status=FetchRun.FINISHING
+        )
+        GmailWatch.objects.filter(user=self.user).update(notified_history_id="15")
+        finish_fetch_task(run.id)
+        enqueue_fetch.assert_called_once_with(self.user.id)
@@ -0,0 +1,65 @@
+from unittest.mock import MagicMock
+
+from django.test import TestCase
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from ..googlesheet_services import add_job_to_sheet
+
+JOBS = [
+    {"job_title": "Engineer", "company": "Acme", "status": "applied", "row_number": 2},
+    {"job_title": "Analyst", "company": "Globex", "status": "offer", "row_number": 3},
+    {
+        "job_title": "Designer",
+        "company": "Initech",
+        "status": "rejected",
+        "row_number": 4,
+    },
+]
+
+
+class AddJobToSheetTest(TestCase):
+    """Test cases for add_job_to_sheet function"""
+
+    def setUp(self):
+        self.service = MagicMock()
+        self.batch_update = self.service.spreadsheets().values().batchUpdate
+
+    def written_ranges(self):
+        return [
+            [item["range"] for item in call.kwargs["body"]["data"]]
+            for call in self.batch_update.call_args_list
+        ]
+
+    def test_writes_all_rows_in_one_call(self):
+        add_job_to_sheet(self.service, "Sheet1", JOBS, "sheet-id")
+        self.assertEqual(
+            self.written_ranges(), [["Sheet1!A2:C2", "Sheet1!A3:C3", "Sheet1!A4:C4"]]
+        )
+        data = self.batch_update.call_args.kwargs["body"]["data"]
+        self.assertEqual(data[1]["values"], [["Analyst", "Globex", "offer"]])
+
+    def test_splits_batch_when_payload_too_large(self):
+        too_large = HttpError(httplib2.Response({"status": 413}), b"")
+        self.batch_update.return_value.execute.side_effect = [too_large, None, None]
+        add_job_to_sheet(self.service, "Sheet1", JOBS, "sheet-id")
+        self.assertEqual(
+            self.written_ranges(),
+            [
+                ["Sheet1!A2:C2", "Sheet1!A3:C3", "Sheet1!A4:C4"],
+                ["Sheet1!A2:C2"],
+                ["Sheet1!A3:C3", "Sheet1!A4:C4"],
+            ],
+        )
+
+    def test_no_jobs_makes_no_call(self):
+        add_job_to_sheet(self.service, "Sheet1", [], "sheet-id")
+        self.batch_update.assert_not_called()
+
+    def test_other_errors_are_raised(self):
+        forbidden = HttpError(httplib2.Response({"status": 403}), b"")
+        self.batch_update.return_value.execute.side_effect = forbidden
+        with self.assertRaises(HttpError):
+            add_job_to_sheet(self.service, "Sheet1", JOBS, "sheet-id")
+        self.assertEqual(len(self.written_ranges()), 1)
@@ -0,0 +1,121 @@
+import io
+import json
+import os
+import tempfile
+from unittest.mock import MagicMock, patch
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..email_services import parse_payload_message
+from ..extraction_cache import make_cache_key
+from ..fakes import FakeGmailService, SyntheticMailbox
+from ..local_classifier import LocalClassifier, calibrate, evaluate
+from ..models import ExtractionCache, ProcessedMessage, User
+from ..parsers import LocalExtractor
+
+COMMAND = "jobtracker_backend_api.service_provider.management.commands"
+
+
+def parsed_emails(mailbox):
+    """The mailbox's emails as the fetch parses them, with their labels."""
+    gmail = FakeGmailService(mailbox)
+    for message in mailbox.messages:
+        payload = gmail.users().messages().get(userId="me", id=message["id"])
+        yield parse_payload_message(payload.execute()), message["truth"]
+
+
+class CalibrationTest(TestCase):
+    """Test cases for the local classifier's threshold"""
+
+    def test_threshold_misses_at_most_the_allowed_job_mail(self):
+        scores = [-9, -8, -7, -1, 2, 3, 4, 5, 6, 7]
+        labels = [False, False, False, True, False, True, True, True, True, True]
+        threshold = calibrate(scores, labels, max_missed=0.0)
+        self.assertEqual(threshold, -4)
+        report = evaluate(scores, labels, threshold)
+        self.assertEqual((report["settled_locally"], report["job_recall"]), (3, 1.0))
+
+        report = evaluate(scores, labels, calibrate(scores, labels, max_missed=0.2))
+        self.assertEqual(
+            (report["settled_locally"], report["missed_job_emails"]), (5, 1)
+        )
+
+    def test_nothing_is_settled_without_job_mail(self):
+        self.assertIsNone(calibrate([1, 2], [False, False]))
+        self.assertEqual(evaluate([1, 2], [False, False], None)["settled_locally"], 0)
+
+
+class TrainLocalClassifierTest(TestCase):
+    """Test cases for training and using the local classifier"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.model_path = os.path.join(directory.name, "model.json")
+        self.data_path = os.path.join(directory.name, "labels.jsonl")
+
+    def train(self, *args):
+        stdout = io.StringIO()
+        call_command(
+            "train_local_classifier",
+            *args,
+            "--output",
+            self.model_path,
+            "--max-missed",
+            "0",
+            stdout=stdout,
+        )
+        return stdout.getvalue()
+
+    def test_trains_from_labelled_file_and_settles_clear_negatives(self):
+        with open(self.data_path, "w") as file:
+            for email_data, truth in parsed_emails(SyntheticMailbox(1000, seed=1)):
+                example = {
+                    key: email_data[key] for key in ("subject", "sender", "body")
+                }
+                example["is_job_application_email"] = truth["is_job_application_email"]
+                file.write(json.dumps(example) + "\n")
+
+        output = self.train("--data", self.data_path)
+        self.assertIn("of LLM calls avoided", output)
+        with open(self.model_path) as file:
+            report = json.load(file)["report"]
+        self.assertEqual(report["job_recall"], 1.0)
+        self.assertGreater(report["llm_calls_avoided"], 0.5)
+
+        fallback = MagicMock()
+        extractor = LocalExtractor(fallback, LocalClassifier.load(self.model_path))
+        settled = 0
+        for email_data, truth in parsed_emails(SyntheticMailbox(200, seed=2)):
+            response = extractor.get_response(
+                email_data["subject"], email_data["body"], email_data["sender"]
+            )
+            if response == {"is_job_application_email": False}:
+                self.assertFalse(truth["is_job_application_email"])
+                settled += 1
+        self.assertEqual(fallback.get_response.call_count, 200 - settled)
+        self.assertGreater(settled, 100)
+
+    def test_trains_from_cached_llm_answers(self):
+        user = User.objects.create_user(email="user@example.com")
+        mailbox = SyntheticMailbox(300, seed=1)
+        for email_data, truth in parsed_emails(mailbox):
+            ProcessedMessage.objects.create(
+                user=user, message_id=email_data["id"], thread_id=email_data["id"]
+            )
+            key = make_cache_key(
+                email_data["subject"], email_data["body"], "gpt-4o-mini", "1"
+            )
+            ExtractionCache.objects.get_or_create(key=key, defaults={"response": truth})
+
+        with patch(
+            f"{COMMAND}.train_local_classifier.get_user_gmail_service",
+            return_value=FakeGmailService(mailbox),
+        ):
+            trained = self.train("--user", "user@example.com")
+            evaluated = self.train("--user", "user@example.com", "--evaluate")
+        # Repeated emails share one cached answer and are used once
+        examples = ExtractionCache.objects.count()
+        self.assertIn(f"Trained on {int(examples * 0.8)} emails", trained)
+        self.assertIn(f"Emails: {examples} ", evaluated)
@@ -0,0 +1,178 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.utils import timezone
+
+from .. import email_services
+from ..email_services import download_emails, find_jobs, get_emails
+from ..fakes import FakeGmailService, FakeSheetsService, SyntheticMailbox
+from ..message_ledger import MessageLedger
+from ..models import FetchLog, FetchRun, ProcessedMessage, User
+
+EMAIL_SERVICES = "jobtracker_backend_api.service_provider.email_services"
+
+
+def extract_all(emails):
+    return [(True, "Engineer", "Acme", "applied") for _ in emails]
+
+
+class MessageLedgerTest(TestCase):
+    """Test cases for skipping processed messages and collapsing threads"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com")
+        self.mailbox = SyntheticMailbox(6, job_ratio=1.0)
+        # The 2nd and 3rd messages are replies in the thread of the 1st
+        thread_id = self.mailbox.messages[0]["threadId"]
+        for message in self.mailbox.messages[1:3]:
+            message["threadId"] = thread_id
+        self.gmail = FakeGmailService(self.mailbox)
+
+    def listed(self, messages):
+        return [{"id": m["id"], "threadId": m["threadId"]} for m in messages]
+
+    def fetch(self, messages, extract=extract_all, run=None):
+        ledger = MessageLedger(self.user, run)
+        emails, _ = download_emails(self.gmail, self.listed(messages), ledger)
+        with patch(f"{EMAIL_SERVICES}.extract_page", side_effect=extract):
+            find_jobs(emails, ledger)
+        ledger.save()
+        return [email_data["id"] for email_data in emails]
+
+    def processed_ids(self):
+        return set(
+            ProcessedMessage.objects.filter(user=self.user).values_list(
+                "message_id", flat=True
+            )
+        )
+
+    def test_only_newest_message_of_thread_is_classified(self):
+        ids = self.fetch(self.mailbox.messages)
+        messages = self.mailbox.messages
+        self.assertEqual(ids, [m["id"] for m in messages[2:]])
+        self.assertEqual(ProcessedMessage.objects.filter(user=self.user).count(), 6)
+
+    def test_processed_messages_are_not_downloaded_again(self):
+        self.fetch(self.mailbox.messages[:4])
+        downloads = self.gmail.calls["gmail.messages.get"]
+
+        # An overlapping window lists the first four again
+        ids = self.fetch(self.mailbox.messages)
+        self.assertEqual(ids, [m["id"] for m in self.mailbox.messages[4:]])
+        self.assertEqual(self.gmail.calls["gmail.messages.get"] - downloads, 4)
+
+    def test_old_message_of_processed_thread_is_skipped(self):
+        self.fetch(self.mailbox.messages[2:3])
+        self.assertEqual(self.fetch(self.mailbox.messages[:2]), [])
+
+    def test_new_reply_in_processed_thread_is_classified(self):
+        self.fetch(self.mailbox.messages[:2])
+        self.assertEqual(
+            self.fetch(self.mailbox.messages[2:3]), [self.mailbox.messages[2]["id"]]
+        )
+
+    def reply_to(self, message, reply):
+        """Make reply the user's own answer to message."""
+        reply["threadId"] = message["threadId"]
+        reply["labelIds"] = ["SENT"]
+
+    def test_sent_reply_does_not_hide_the_mail_it_answers(self):
+        recruiter, reply = self.mailbox.messages[3:5]
+        self.reply_to(recruiter, reply)
+        ids = self.fetch([recruiter, reply])
+        self.assertEqual(ids, [recruiter["id"], reply["id"]])
+        # The reply is recorded without its thread
+        self.assertEqual(
+            ProcessedMessage.objects.get(message_id=reply["id"]).thread_id, ""
+        )
+
+    def test_older_sent_mail_is_collapsed(self):
+        application, answer = self.mailbox.messages[3:5]
+        self.reply_to(answer, application)
+        self.assertEqual(self.fetch([application, answer]), [answer["id"]])
+
+    def test_pages_of_a_run_agree_on_newest_message(self):
+        messages = self.mailbox.messages
+        run = FetchRun.objects.create(user=self.user, task_id="t")
+        # Date mode lists newest first
+        self.assertEqual(self.fetch(messages[2:3], run=run), [messages[2]["id"]])
+        self.assertEqual(self.fetch(messages[:2], run=run), [])
+
+        # History mode lists oldest first, a later page takes the thread over
+        ProcessedMessage.objects.all().delete()
+        run = FetchRun.objects.create(user=self.user, task_id="u")
+        self.assertEqual(self.fetch(messages[:2], run=run), [messages[1]["id"]])
+        self.assertEqual(self.fetch(messages[2:3], run=run), [messages[2]["id"]])
+
+    def test_sent_reply_on_another_page_does_not_claim_the_thread(self):
+        recruiter, reply = self.mailbox.messages[3:5]
+        self.reply_to(recruiter, reply)
+        run = FetchRun.objects.create(user=self.user, task_id="t")
+        self.assertEqual(self.fetch([reply], run=run), [reply["id"]])
+        self.assertEqual(self.fetch([recruiter], run=run), [recruiter["id"]])
+
+    def test_failed_extraction_is_not_recorded(self):
+        def fail_thread(emails):
+            return [
+                None if i == 0 else result
+                for i, result in enumerate(extract_all(emails))
+            ]
+
+        ids = self.fetch(self.mailbox.messages, fail_thread)
+        # The thread's newest message failed, so the thread is fetched again
+        messages = self.mailbox.messages
+        self.assertEqual(self.processed_ids(), {m["id"] for m in messages[3:]})
+        self.assertEqual(self.fetch(messages), ids[:1])
+
+    def test_failed_download_is_not_recorded(self):
+        failed = self.mailbox.messages[4]["id"]
+        download = email_services.download_messages
+
+        def lose_body(gmail_service, messages, message_format="raw", **params):
+            payloads = download(gmail_service, messages, message_format, **params)
+            if message_format == "full":
+                payloads.pop(failed, None)
+            return payloads
+
+        with patch(f"{EMAIL_SERVICES}.download_messages", side_effect=lose_body):
+            ids = self.fetch(self.mailbox.messages)
+        self.assertNotIn(failed, ids)
+        self.assertNotIn(failed, self.processed_ids())
+        self.assertIn(failed, self.fetch(self.mailbox.messages))
+
+    @patch.dict("os.environ", {"RATE_LIMIT_ENABLED": "false"})
+    def test_failed_extraction_is_fetched_again(self):
+        self.user.google_sheet_id = "sheet"
+        self.user.save()
+        FetchLog.objects.create(
+            user=self.user, history_id="0", last_fetch_date=timezone.now()
+        )
+        failed = self.mailbox.messages[4]
+        extracted = []
+
+        def fail_first(emails):
+            ids = [email_data["id"] for email_data in emails]
+            first_try = failed["id"] not in extracted
+            extracted.extend(ids)
+            return [
+                None if first_try and id == failed["id"] else result
+                for id, result in zip(ids, extract_all(emails))
+            ]
+
+        with patch(
+            f"{EMAIL_SERVICES}.get_user_gmail_service", return_value=self.gmail
+        ), patch(
+            f"{EMAIL_SERVICES}.get_user_googlesheet_service",
+            return_value=FakeSheetsService(),
+        ), patch(
+            f"{EMAIL_SERVICES}.extract_page", side_effect=fail_first
+        ):
+            get_emails(self.user)
+            # The next fetch lists from where this one started
+            self.assertEqual(FetchLog.objects.latest("id").history_id, "0")
+            self.assertNotIn(failed["id"], self.processed_ids())
+
+            get_emails(self.user)
+        self.assertEqual(extracted.count(failed["id"]), 2)
+        self.assertIn(failed["id"], self.processed_ids())
+        self.assertEqual(FetchLog.objects.latest("id").history_id, "6")
@@ -0,0 +1,118 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from ..fakes import FakeOpenAI, SyntheticMailbox
+from ..parsers import BATCH_PROMPT, DummyExtractor, OpenAIExtractor, pack_batches
+
+PARSERS = "jobtracker_backend_api.service_provider.parsers"
+
+
+def mailbox_emails(mailbox):
+    return [
+        {"subject": subject, "body": "Thanks for your application."}
+        for subject in mailbox.truth
+    ]
+
+
+class PackBatchesTest(TestCase):
+    """Test cases for packing emails into batch requests"""
+
+    def test_respects_size_and_token_budget(self):
+        emails = [{"subject": "Hi", "body": "x" * 400} for _ in range(10)]
+        self.assertEqual(
+            [len(batch) for batch in pack_batches(emails, 4, 10000)], [4, 4, 2]
+        )
+        # About 110 tokens an email
+        self.assertEqual(
+            [len(batch) for batch in pack_batches(emails, 10, 250)], [2] * 5
+        )
+
+    def test_email_over_budget_goes_alone(self):
+        emails = [{"subject": "Hi", "body": "x" * size} for size in (40, 4000, 40)]
+        self.assertEqual(
+            [len(batch) for batch in pack_batches(emails, 10, 100)], [1, 1, 1]
+        )
+
+
+@patch.dict(
+    "os.environ", {"EXTRACTION_BATCH_SIZE": "10", "RATE_LIMIT_ENABLED": "false"}
+)
+class OpenAIBatchTest(TestCase):
+    """Test cases for extracting several emails per OpenAI request"""
+
+    def setUp(self):
+        self.mailbox = SyntheticMailbox(200, seed=1)
+        self.emails = mailbox_emails(self.mailbox)[:25]
+        self.client = FakeOpenAI(self.mailbox)
+        patcher = patch(f"{PARSERS}.get_openai_client", return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def expected(self):
+        return [self.client.answer(email_data["subject"]) for email_data in self.emails]
+
+    def test_one_request_per_batch(self):
+        self.assertEqual(OpenAIExtractor().get_responses(self.emails), self.expected())
+        self.assertEqual(self.client.calls["openai.chat.completions"], 3)
+
+    def test_bad_batch_is_split_and_retried(self):
+        create = self.client.create
+
+        def drop_results_of_large_batches(model, messages, **kwargs):
+            response = create(model, messages, **kwargs)
+            answer = json.loads(response.choices[0].message.content)
+            if len(answer.get("results", [])) > 3:
+                answer["results"].pop()
+                response.choices[0].message.content = json.dumps(answer)
+            return response
+
+        self.client.chat.completions.create = drop_results_of_large_batches
+        with patch.dict("os.environ", {"EXTRACTION_BATCH_SIZE": "8"}):
+            responses = OpenAIExtractor().get_responses(self.emails[:8])
+        self.assertEqual(responses, self.expected()[:8])
+        # 8 fails, both 4s fail, the four 2s answer
+        self.assertEqual(self.client.calls["openai.chat.completions"], 7)
+
+    def test_single_email_gets_no_answer_after_splits(self):
+        def cut_off(model, messages, **kwargs):
+            self.client.count("openai.chat.completions")
+            self.assertIn("### Email", messages[-1]["content"])
+            return SimpleNamespace(
+                choices=[
+                    SimpleNamespace(
+                        message=SimpleNamespace(content='{"results": ['),
+                        finish_reason="length",
+                    )
+                ]
+            )
+
+        self.client.chat.completions.create = cut_off
+        self.assertEqual(OpenAIExtractor().get_responses(self.emails[:2]), [None] * 2)
+        self.assertEqual(self.client.calls["openai.chat.completions"], 3)
+
+    def test_batch_of_one_uses_batch_prompt(self):
+        create = self.client.create
+        prompts = []
+
+        def record_prompt(model, messages, **kwargs):
+            prompts.append(messages[0]["content"])
+            return create(model, messages, **kwargs)
+
+        self.client.chat.completions.create = record_prompt
+        responses = OpenAIExtractor().get_responses(self.emails[:1])
+        self.assertEqual(responses, self.expected()[:1])
+        self.assertEqual(prompts, [BATCH_PROMPT])
+
+
+class DefaultBatchTest(TestCase):
+    """Test cases for the loop-based get_responses of other extractors"""
+
+    def test_loops_over_get_response(self):
+        emails = [{"subject": "A", "body": ""}, {"subject": "B", "body": ""}]
+        self.assertEqual(DummyExtractor().get_responses(emails), ["Dummy Company"] * 2)
+
+        with patch.object(DummyExtractor, "get_response", side_effect=[1, KeyError()]):
+            self.assertEqual(DummyExtractor().get_responses(emails), [1, None])
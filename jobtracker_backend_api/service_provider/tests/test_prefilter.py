@@ -0,0 +1,78 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from ..prefilter import EmailPrefilter, sender_domain
+
+
+def make_email(sender, subject, body="", headers=None, label_ids=None):
+    return {
+        "headers": {"from": sender, **(headers or {})},
+        "label_ids": label_ids or [],
+        "subject": subject,
+        "body": body,
+    }
+
+
+class EmailPrefilterTest(TestCase):
+    """Test cases for EmailPrefilter"""
+
+    def setUp(self):
+        self.prefilter = EmailPrefilter()
+
+    def test_sender_domain(self):
+        self.assertEqual(
+            sender_domain("Acme <no-reply@Mail.Acme.com>"), "mail.acme.com"
+        )
+        self.assertEqual(sender_domain(None), "")
+
+    def test_keeps_ats_mail(self):
+        email_data = make_email(
+            "no-reply@us.greenhouse-mail.io",
+            "Weekly digest",
+            headers={"list-unsubscribe": "<mailto:x@y>"},
+            label_ids=["CATEGORY_PROMOTIONS"],
+        )
+        self.assertTrue(self.prefilter.should_extract(email_data))
+
+    def test_drops_newsletter(self):
+        email_data = make_email(
+            "news@shop.example.com",
+            "Sale ends tonight: 30% off",
+            body="Click to unsubscribe",
+            headers={"list-unsubscribe": "<mailto:x@y>"},
+            label_ids=["CATEGORY_PROMOTIONS"],
+        )
+        self.assertFalse(self.prefilter.should_extract(email_data))
+
+    def test_keeps_ambiguous_mail(self):
+        email_data = make_email("jane@startup.example", "Quick question")
+        self.assertTrue(self.prefilter.should_extract(email_data))
+
+    def test_keeps_application_update_with_unsubscribe(self):
+        email_data = make_email(
+            "careers@bigco.example",
+            "Your application for Software Engineer",
+            body="Thank you for your interest. We'd like to schedule an interview.",
+            headers={"list-unsubscribe": "<mailto:x@y>"},
+        )
+        self.assertTrue(self.prefilter.should_extract(email_data))
+
+    @patch.dict(
+        "os.environ",
+        {"PREFILTER_BLOCKED_DOMAINS": "spam.example", "PREFILTER_ENABLED": "true"},
+    )
+    def test_blocked_domain(self):
+        prefilter = EmailPrefilter()
+        email_data = make_email("x@news.spam.example", "Your application")
+        self.assertFalse(prefilter.should_extract(email_data))
+
+    @patch.dict("os.environ", {"PREFILTER_ENABLED": "false"})
+    def test_disabled(self):
+        prefilter = EmailPrefilter()
+        email_data = make_email(
+            "news@shop.example.com",
+            "Newsletter",
+            headers={"list-unsubscribe": "<mailto:x@y>"},
+        )
+        self.assertTrue(prefilter.should_extract(email_data))
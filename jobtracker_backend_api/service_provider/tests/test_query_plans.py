@@ -0,0 +1,59 @@
+from django.db import connection, transaction
+from django.test import TestCase
+
+from ..email_services import get_last_fetch_log
+from ..models import FetchLog, JobApplied, User
+
+# How SQLite and PostgreSQL report sorting rows the index did not order
+SORT_MARKERS = ("TEMP B-TREE", "Sort Key")
+
+
+def explain(queryset):
+    """Query plan of queryset. PostgreSQL is told to avoid sequential scans,
+    which it prefers on tiny tables, so the plan shows whether an index can
+    serve the query once the table grows."""
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        return queryset.explain()
+
+
+class QueryPlanTest(TestCase):
+    """Test cases for the indexes behind the hot queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="user@example.com")
+        other = User.objects.create_user(email="other@example.com")
+        for i in range(20):
+            for user in (cls.user, other):
+                FetchLog.objects.create(
+                    user=user, last_fetch_date=f"2025-01-{i + 1:02d}T00:00Z"
+                )
+                JobApplied.objects.create(
+                    user=user, job_title=f"Role {i}", company=f"Company {i % 5}"
+                )
+
+    def assertUsesIndex(self, queryset, index_name, ordered=False):
+        plan = explain(queryset)
+        self.assertIn(index_name, plan)
+        if ordered:
+            for marker in SORT_MARKERS:
+                self.assertNotIn(marker, plan)
+
+    def test_last_fetch_log(self):
+        queryset = FetchLog.objects.filter(user=self.user).order_by("-last_fetch_date")
+        self.assertUsesIndex(queryset[:1], "fetchlog_user_date_idx", ordered=True)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_last_fetch_log(self.user).last_fetch_date.day, 20)
+
+    def test_jobs_by_company(self):
+        queryset = JobApplied.objects.filter(
+            user=self.user, company__in=["Company 1", "Company 2"]
+        )
+        self.assertUsesIndex(queryset, "jobapplied_user_company_idx")
+
+    def test_jobs_listing(self):
+        queryset = JobApplied.objects.filter(user=self.user).order_by("-id")
+        self.assertUsesIndex(queryset[:10], "jobapplied_user_id_idx", ordered=True)
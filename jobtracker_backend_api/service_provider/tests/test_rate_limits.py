@@ -0,0 +1,92 @@
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase
+from django.utils import timezone
+
+import httplib2
+import httpx
+import openai
+from googleapiclient.errors import HttpError
+
+from .. import rate_limits
+from ..models import RateLimitBucket
+
+RATE_LIMITS = "jobtracker_backend_api.service_provider.rate_limits"
+
+
+def http_error(status, **headers):
+    return HttpError(httplib2.Response({"status": status, **headers}), b"")
+
+
+@patch.dict("os.environ", {"RATE_LIMIT_ENABLED": "true", "GMAIL_USER_RATE": "10"})
+class RateLimitTest(TestCase):
+    """Test cases for the shared rate limiter"""
+
+    def setUp(self):
+        rate_limits._leases.clear()
+
+    def test_bucket_waits_once_in_debt(self):
+        self.assertEqual(rate_limits._reserve("gmail:user:1", 25), (0, 25))
+        wait, _ = rate_limits._reserve("gmail:user:1", 5)
+        # 15 units of debt at 10 units a second
+        self.assertAlmostEqual(wait, 1.5, places=1)
+
+    @patch.dict("os.environ", {"GMAIL_USER_RATE": "100"})
+    def test_calls_spend_a_lease_between_locked_updates(self):
+        with patch.object(
+            rate_limits, "_reserve", wraps=rate_limits._reserve
+        ) as reserve:
+            # A lease of 0.1 s at 100 units a second covers ten calls
+            for _ in range(10):
+                rate_limits.acquire(["gmail:user:1"])
+            self.assertEqual(reserve.call_count, 1)
+            self.assertEqual(RateLimitBucket.objects.get().tokens, 90)
+
+            rate_limits.throttle(["gmail:user:1"], 0.01)
+            rate_limits.acquire(["gmail:user:1"])
+            self.assertGreater(reserve.call_count, 1)
+
+    def test_service_keys(self):
+        service = MagicMock()
+        self.assertEqual(rate_limits.service_keys("gmail", service), ["gmail"])
+        service.rate_limit_user = 7
+        self.assertEqual(
+            rate_limits.service_keys("gmail", service), ["gmail", "gmail:user:7"]
+        )
+
+    @patch(f"{RATE_LIMITS}.time.sleep")
+    def test_rate_limit_error_follows_retry_after(self, sleep):
+        func = MagicMock(side_effect=[http_error(429, **{"retry-after": "0.2"}), "ok"])
+        start = timezone.now()
+        result = rate_limits.call_with_rate_limit(func, ["gmail", "gmail:user:1"])
+
+        self.assertEqual(result, "ok")
+        sleep.assert_any_call(0.2)
+        # The whole fleet holds back on the user's bucket, not the project's
+        blocked = RateLimitBucket.objects.get(key="gmail:user:1").blocked_until
+        self.assertGreaterEqual(blocked, start + timedelta(seconds=0.2))
+        self.assertIsNone(RateLimitBucket.objects.get(key="gmail").blocked_until)
+
+    @patch(f"{RATE_LIMITS}.time.sleep")
+    def test_server_errors_back_off_with_jitter(self, sleep):
+        func = MagicMock(side_effect=[http_error(503), http_error(500), "ok"])
+        self.assertEqual(rate_limits.call_with_rate_limit(func, ["sheets"]), "ok")
+        delays = [call.args[0] for call in sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertTrue(0 <= delays[0] <= 1 and 0 <= delays[1] <= 2)
+
+    def test_other_errors_are_not_retried(self):
+        func = MagicMock(side_effect=http_error(404))
+        with self.assertRaises(HttpError):
+            rate_limits.call_with_rate_limit(func, ["gmail"])
+        func.assert_called_once()
+
+    def test_openai_retry_after(self):
+        request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+        response = httpx.Response(
+            429, headers={"retry-after-ms": "1500"}, request=request
+        )
+        error = openai.RateLimitError("slow down", response=response, body=None)
+        self.assertTrue(rate_limits.is_rate_limited(error))
+        self.assertEqual(rate_limits.retry_after(error), 1.5)
@@ -0,0 +1,304 @@
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+import httplib2
+from celery.exceptions import Retry
+from googleapiclient.errors import HttpError
+from kombu.exceptions import OperationalError
+
+from .. import email_services
+from ..fetch_locks import acquire_fetch_lock, refresh_fetch_lock
+from ..models import (
+    FetchLock,
+    FetchLog,
+    FetchRun,
+    FetchRunPage,
+    JobApplied,
+    ProcessedMessage,
+    User,
+)
+from ..tasks import (
+    classify_page_task,
+    enqueue_fetch,
+    fetch_emails_task,
+    schedule_fetch_shard,
+)
+
+TASKS = "jobtracker_backend_api.service_provider.tasks"
+EMAIL_SERVICES = "jobtracker_backend_api.service_provider.email_services"
+
+PAGES = [
+    ([{"id": "m1"}, {"id": "m2"}], "page-2"),
+    ([{"id": "m3"}], None),
+]
+
+
+def fake_find_jobs(messages, ledger=None):
+    jobs = [
+        {
+            "job_title": f"Role {msg['id']}",
+            "company": "Acme",
+            "status": "applied",
+            "sender_email": "jobs@acme.example",
+        }
+        for msg in messages
+    ]
+    return jobs, 0
+
+
+@patch(f"{TASKS}.finish_fetch", return_value=3)
+@patch(f"{TASKS}.find_jobs", side_effect=fake_find_jobs)
+@patch(f"{TASKS}.download_emails", side_effect=lambda service, msgs, ledger: (msgs, 0))
+@patch(f"{TASKS}.list_message_page", side_effect=PAGES)
+@patch(f"{TASKS}.start_fetch", return_value=("h-1", {}))
+@patch(f"{TASKS}.get_user_gmail_service", return_value=MagicMock())
+class FetchPipelineTest(TestCase):
+    """Test cases for the staged fetch pipeline and per-user locking"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com")
+
+    def test_pages_are_aggregated_once(self, *mocks):
+        finish_fetch = mocks[-1]
+        task_id = enqueue_fetch(self.user.id)
+
+        run = FetchRun.objects.get(task_id=task_id)
+        self.assertEqual(run.status, FetchRun.DONE)
+        self.assertEqual((run.pages_total, run.pages_done), (2, 2))
+        self.assertFalse(FetchRunPage.objects.exists())
+        progress = run.progress()
+        self.assertEqual(progress["stage"], FetchRun.DONE)
+        self.assertEqual(
+            [progress[key] for key in ("messages_listed", "messages_classified")],
+            [3, 3],
+        )
+        self.assertEqual((progress["jobs_found"], progress["rows_written"]), (3, 3))
+        self.assertEqual(
+            list(progress["stage_seconds"]), ["list", "classify", "finish"]
+        )
+
+        finish_fetch.assert_called_once()
+        user, jobs, history_id = finish_fetch.call_args.args
+        self.assertEqual(history_id, "h-1")
+        self.assertEqual([job["row_number"] for job in jobs], [2, 3, 4])
+        self.assertEqual(JobApplied.objects.filter(user=self.user).count(), 3)
+
+        # The lock was released
+        self.assertEqual(acquire_fetch_lock(self.user.id, "next"), "next")
+
+    def test_on_demand_fetch_coalesces_into_running_one(self, *mocks):
+        acquire_fetch_lock(self.user.id, "running-task")
+        self.assertEqual(enqueue_fetch(self.user.id), "running-task")
+        self.assertFalse(FetchRun.objects.exists())
+
+    def test_lock_is_released_when_publishing_fails(self, *mocks):
+        with patch.object(
+            fetch_emails_task, "apply_async", side_effect=OperationalError("down")
+        ):
+            with self.assertRaises(OperationalError):
+                enqueue_fetch(self.user.id)
+        self.assertEqual(acquire_fetch_lock(self.user.id, "next"), "next")
+
+    def test_task_skips_when_locked(self, *mocks):
+        acquire_fetch_lock(self.user.id, "running-task")
+        fetch_emails_task.apply(args=[self.user.id])
+        self.assertFalse(FetchRun.objects.exists())
+        self.assertEqual(acquire_fetch_lock(self.user.id, "other"), "running-task")
+
+
+def http_error(status):
+    return HttpError(httplib2.Response({"status": status}), b"")
+
+
+@patch(f"{TASKS}.finish_fetch", return_value=3)
+@patch(f"{TASKS}.find_jobs", side_effect=fake_find_jobs)
+@patch(f"{TASKS}.download_emails", side_effect=lambda service, msgs, ledger: (msgs, 0))
+@patch(f"{TASKS}.list_message_page")
+@patch(
+    f"{TASKS}.start_fetch",
+    return_value=("h-1", {"start_history_id": None, "after_date_string": "x"}),
+)
+@patch(f"{TASKS}.get_user_gmail_service", return_value=MagicMock())
+class FetchCheckpointTest(TestCase):
+    """Test cases for resuming fetch runs from their last committed page"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com")
+
+    def test_next_fetch_resumes_failed_run(self, _, start_fetch, list_page, *mocks):
+        list_page.side_effect = [PAGES[0], http_error(403)]
+        enqueue_fetch(self.user.id)
+        run = FetchRun.objects.get()
+        self.assertEqual(run.status, FetchRun.FAILED)
+        self.assertEqual((run.pages_listed, run.next_page_token), (1, "page-2"))
+        self.assertEqual(run.pages.get().done, True)
+
+        list_page.side_effect = [PAGES[1]]
+        task_id = enqueue_fetch(self.user.id)
+        run.refresh_from_db()
+        self.assertEqual(
+            (run.task_id, run.status, run.attempts), (task_id, FetchRun.DONE, 2)
+        )
+        start_fetch.assert_called_once()
+        self.assertEqual(
+            list_page.call_args.args[1:3],
+            ({"start_history_id": None, "after_date_string": "x"}, "page-2"),
+        )
+        self.assertEqual((run.pages_total, run.pages_done), (2, 2))
+        self.assertEqual(run.messages_listed, 3)
+        self.assertEqual(JobApplied.objects.filter(user=self.user).count(), 3)
+
+    @patch.dict("os.environ", {"RATE_LIMIT_ENABLED": "false"})
+    def test_failed_sheet_write_leaves_run_resumable(
+        self, _, start_fetch, list_page, download_emails, find_jobs, finish_fetch
+    ):
+        list_page.side_effect = PAGES
+        self.user.google_sheet_id = "sheet"
+        self.user.save()
+        sheets = MagicMock()
+        sheets.spreadsheets().get().execute.return_value = {
+            "sheets": [{"properties": {"title": "Sheet1"}}]
+        }
+        write = sheets.spreadsheets().values().batchUpdate().execute
+        write.side_effect = [http_error(403), None]
+        finish_fetch.side_effect = email_services.finish_fetch
+        with patch(
+            f"{EMAIL_SERVICES}.get_user_googlesheet_service", return_value=sheets
+        ):
+            enqueue_fetch(self.user.id)
+            run = FetchRun.objects.get()
+            self.assertEqual(run.status, FetchRun.FAILED)
+            self.assertFalse(FetchLog.objects.exists())
+
+            task_id = enqueue_fetch(self.user.id)
+        run.refresh_from_db()
+        self.assertEqual((run.task_id, run.status), (task_id, FetchRun.DONE))
+        self.assertEqual((run.rows_written, write.call_count), (3, 2))
+        start_fetch.assert_called_once()
+        self.assertEqual(FetchLog.objects.get().history_id, "h-1")
+
+    def test_retryable_error_retries_from_checkpoint(
+        self, _, start_fetch, list_page, *mocks
+    ):
+        list_page.side_effect = [PAGES[0], http_error(503), PAGES[1]]
+        with self.assertRaises(Retry):
+            enqueue_fetch(self.user.id)
+        run = FetchRun.objects.get()
+        self.assertEqual(run.status, FetchRun.RUNNING)
+        self.assertEqual(acquire_fetch_lock(self.user.id, "other"), run.task_id)
+
+        # The retry is delivered under the same task id
+        fetch_emails_task.apply(args=[self.user.id], task_id=run.task_id)
+        run.refresh_from_db()
+        self.assertEqual(run.status, FetchRun.DONE)
+        self.assertEqual(run.messages_classified, 3)
+        start_fetch.assert_called_once()
+
+    def test_gives_up_on_run_after_max_attempts(
+        self, gmail_service, start_fetch, list_page, *mocks
+    ):
+        list_page.side_effect = http_error(403)
+        for _ in range(4):
+            enqueue_fetch(self.user.id)
+        self.assertEqual(FetchRun.objects.count(), 2)
+        self.assertEqual(start_fetch.call_count, 2)
+
+    def test_redelivered_page_counts_once(self, *mocks):
+        run = FetchRun.objects.create(user=self.user, task_id="t", pages_total=2)
+        page = FetchRunPage.objects.create(run=run, index=0, messages=PAGES[0][0])
+        classify_page_task(page.id)
+        classify_page_task(page.id)
+        run.refresh_from_db()
+        self.assertEqual((run.pages_done, run.messages_classified), (1, 2))
+        page.refresh_from_db()
+        self.assertEqual(page.attempts, 1)
+
+    def test_counts_messages_sent_to_download(
+        self, gmail_service, start_fetch, list_page, download_emails, *mocks
+    ):
+        download_emails.side_effect = lambda service, msgs, ledger: (
+            ledger.filter_new(msgs)[:1],
+            0,
+        )
+        ProcessedMessage.objects.create(user=self.user, message_id="m1")
+        run = FetchRun.objects.create(user=self.user, task_id="t", pages_total=2)
+        page = FetchRunPage.objects.create(run=run, index=0, messages=PAGES[0][0])
+        classify_page_task(page.id)
+        run.refresh_from_db()
+        # m1 was processed before; m2 is counted even if it is not classified
+        self.assertEqual((run.messages_downloaded, run.messages_classified), (1, 2))
+
+    def test_page_that_kills_its_worker_is_given_up(
+        self,
+        gmail_service,
+        start_fetch,
+        list_page,
+        download_emails,
+        find_jobs,
+        finish_fetch,
+    ):
+        run = FetchRun.objects.create(
+            user=self.user,
+            task_id="t",
+            pages_total=1,
+            sync_state={"start_history_id": "h-0", "after_date_string": "x"},
+        )
+        # Three deliveries were lost with their worker before this one
+        page = FetchRunPage.objects.create(
+            run=run, index=0, messages=PAGES[0][0], attempts=3
+        )
+        classify_page_task(page.id)
+        download_emails.assert_not_called()
+        run.refresh_from_db()
+        self.assertEqual(run.status, FetchRun.DONE)
+        self.assertEqual((run.pages_done, run.pages_failed), (1, 1))
+        self.assertEqual(run.messages_classified, 0)
+        # The next fetch lists the page's messages again
+        self.assertEqual(run.messages_failed, len(page.messages))
+        self.assertEqual(finish_fetch.call_args.args[2], "h-0")
+
+
+class FetchLockTest(TestCase):
+    """Test cases for fetch_locks"""
+
+    @patch.dict("os.environ", {"FETCH_LOCK_TIMEOUT": "0"})
+    def test_stale_lock_is_replaced(self):
+        user = User.objects.create_user(email="user@example.com")
+        acquire_fetch_lock(user.id, "dead-task")
+        self.assertEqual(acquire_fetch_lock(user.id, "new-task"), "new-task")
+
+    @patch.dict("os.environ", {"FETCH_LOCK_TIMEOUT": "60"})
+    def test_progress_keeps_lock_from_going_stale(self):
+        user = User.objects.create_user(email="user@example.com")
+        acquire_fetch_lock(user.id, "long-task")
+        FetchLock.objects.update(locked_at=timezone.now() - timedelta(minutes=5))
+        refresh_fetch_lock(user.id, "long-task")
+        self.assertEqual(acquire_fetch_lock(user.id, "new-task"), "long-task")
+
+
+@override_settings(FETCH_SCHEDULE_INTERVAL=300)
+class ScheduleFetchShardTest(TestCase):
+    """Test cases for scheduled, sharded fetching"""
+
+    def setUp(self):
+        for i in range(6):
+            user = User.objects.create_user(email=f"user{i}@example.com")
+            user.google_refresh_token = "refresh"
+            user.google_sheet_id = "sheet"
+            user.save()
+            FetchLog.objects.create(user=user, last_fetch_date="2025-01-01T00:00Z")
+            FetchLog.objects.create(user=user, last_fetch_date="2025-01-02T00:00Z")
+        # Not set up yet: no sheet connected
+        User.objects.create_user(email="new@example.com")
+
+    @patch(f"{TASKS}.fetch_emails_task.apply_async")
+    def test_spreads_shard_over_interval(self, apply_async):
+        schedule_fetch_shard(0, 2)
+        user_ids = [call.kwargs["args"][0] for call in apply_async.call_args_list]
+        countdowns = [call.kwargs["countdown"] for call in apply_async.call_args_list]
+        self.assertEqual(len(user_ids), 3)
+        self.assertTrue(all(user_id % 2 == 0 for user_id in user_ids))
+        self.assertEqual(countdowns, [0, 100, 200])
@@ -0,0 +1,35 @@
+import threading
+from unittest.mock import patch
+
+from django.db import connections
+from django.test import TestCase
+
+from ..thread_pools import WorkerPool
+
+
+class WorkerPoolTest(TestCase):
+    """Test cases for closing worker connections once per pool"""
+
+    def test_workers_reuse_their_connection_until_shutdown(self):
+        def query(_):
+            connection = connections["default"]
+            connection.ensure_connection()
+            return threading.get_ident(), connection, connection.connection
+
+        # Closing the in-memory test database is a no-op, so count the calls
+        with patch.object(
+            type(connections["default"]), "close", autospec=True
+        ) as close:
+            with WorkerPool(max_workers=2) as pool:
+                results = list(pool.map(query, range(10)))
+                close.assert_not_called()
+
+        by_thread = {}
+        for thread, _, db_connection in results:
+            by_thread.setdefault(thread, set()).add(id(db_connection))
+        self.assertTrue(all(len(opened) == 1 for opened in by_thread.values()))
+        # One close per worker thread started
+        closed = [id(call.args[0]) for call in close.call_args_list]
+        self.assertLessEqual(len(closed), 2)
+        self.assertEqual(len(closed), len(set(closed)))
+        self.assertLessEqual({id(wrapper) for _, wrapper, _ in results}, set(closed))
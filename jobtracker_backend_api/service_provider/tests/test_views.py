@@ -0,0 +1,165 @@
+import json
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from ..email_services import save_jobs
+from ..models import FetchLog, FetchRun, JobApplied, User
+
+
+class FetchProgressTest(TestCase):
+    """Test cases for fetch progress reporting"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com")
+        self.run = FetchRun.objects.create(
+            user=self.user,
+            task_id="task-1",
+            status=FetchRun.DONE,
+            pages_total=2,
+            pages_done=2,
+            messages_listed=150,
+            jobs_found=4,
+        )
+        token = str(RefreshToken.for_user(self.user).access_token)
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+        # EventSource cannot send headers, the stream reads the JWT cookie
+        self.async_client.cookies["access_token"] = token
+
+    @patch("jobtracker_backend_api.service_provider.views.AsyncResult")
+    def test_task_status_includes_progress(self, async_result):
+        async_result.return_value.status = "SUCCESS"
+        response = self.client.get("/task_status/task-1/")
+        self.assertEqual(response.data["status"], "SUCCESS")
+        self.assertEqual(response.data["progress"]["messages_listed"], 150)
+
+    def test_task_status_requires_login(self):
+        del self.client.defaults["HTTP_AUTHORIZATION"]
+        response = self.client.get("/task_status/task-1/")
+        self.assertEqual(response.status_code, 401)
+
+    @patch("jobtracker_backend_api.service_provider.views.AsyncResult")
+    def test_task_status_hides_progress_of_other_users(self, async_result):
+        async_result.return_value.status = "SUCCESS"
+        other = User.objects.create_user(email="other@example.com")
+        token = str(RefreshToken.for_user(other).access_token)
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+        response = self.client.get("/task_status/task-1/")
+        self.assertNotIn("progress", response.data)
+
+    async def test_event_stream_ends_with_finished_run(self):
+        response = await self.async_client.get("/task_status/task-1/events/")
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = b"".join([chunk async for chunk in response.streaming_content])
+        body = body.decode()
+        events = [json.loads(line[6:]) for line in body.split("\n") if line]
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]["stage"], FetchRun.DONE)
+        self.assertEqual(events[0]["jobs_found"], 4)
+
+    async def test_event_stream_requires_login(self):
+        self.async_client.cookies.clear()
+        response = await self.async_client.get("/task_status/task-1/events/")
+        self.assertEqual(response.status_code, 401)
+
+
+class JobListTest(TestCase):
+    """Test cases for the per-user job listing"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="user@example.com")
+        other = User.objects.create_user(email="other@example.com")
+        for i in range(25):
+            JobApplied.objects.create(
+                user=cls.user,
+                job_title=f"Role {i}",
+                company="Acme" if i % 2 else "Globex",
+                status="interview" if i % 5 == 0 else "applied",
+            )
+        JobApplied.objects.create(user=other, job_title="Other", company="Acme")
+
+    def setUp(self):
+        token = str(RefreshToken.for_user(self.user).access_token)
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+
+    def test_pages_through_own_jobs_by_cursor(self):
+        titles = []
+        url = "/jobs/"
+        while url:
+            # The user lookup and one page query, no COUNT
+            with self.assertNumQueries(2):
+                response = self.client.get(url)
+            self.assertNotIn("count", response.data)
+            titles += [job["job_title"] for job in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(titles, [f"Role {i}" for i in range(24, -1, -1)])
+
+    def test_lean_rows(self):
+        response = self.client.get("/jobs/?page_size=1")
+        self.assertEqual(
+            set(response.data["results"][0]),
+            {"id", "job_title", "company", "status", "sender_email", "row_number"},
+        )
+
+    def test_filters_by_status_and_company(self):
+        response = self.client.get("/jobs/?status=interview&company=Acme")
+        self.assertEqual(
+            [job["job_title"] for job in response.data["results"]],
+            ["Role 15", "Role 5"],
+        )
+
+    def test_other_users_jobs_are_not_found(self):
+        other_job = JobApplied.objects.get(job_title="Other")
+        self.assertEqual(self.client.get(f"/jobs/{other_job.id}/").status_code, 404)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class ResponseCacheTest(TestCase):
+    """Test cases for cached, ETag-stamped responses"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com")
+        token = str(RefreshToken.for_user(self.user).access_token)
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+
+    def test_not_modified_until_new_jobs_are_saved(self):
+        response = self.client.get("/jobs/")
+        etag = response["ETag"]
+        self.assertEqual(response.data["results"], [])
+
+        # Only the user lookup of the authentication
+        with self.assertNumQueries(1):
+            response = self.client.get("/jobs/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        save_jobs(
+            self.user,
+            [
+                {
+                    "job_title": "Engineer",
+                    "company": "Acme",
+                    "status": "applied",
+                    "sender_email": "jobs@acme.example",
+                }
+            ],
+        )
+        response = self.client.get("/jobs/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(len(response.data["results"]), 1)
+
+    def test_user_summary_is_served_from_cache(self):
+        self.assertTrue(self.client.get("/users/").data["first_time_user"])
+        with self.assertNumQueries(1):
+            self.assertTrue(self.client.get("/users/").data["first_time_user"])
+
+        self.client.post(
+            "/fetch_logs/add_log/", {"last_fetch_date": "2025-01-01T00:00:00+00:00"}
+        )
+        self.assertTrue(FetchLog.objects.filter(user=self.user).exists())
+        self.assertFalse(self.client.get("/users/").data["first_time_user"])
@@ -0,0 +1,33 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+
+
+class WorkerPool(ThreadPoolExecutor):
+    """A ThreadPoolExecutor whose worker threads keep the database connection
+    they open across tasks; the connections are closed once, when the pool
+    shuts down."""
+
+    def __init__(self, max_workers):
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        super().__init__(max_workers=max_workers, initializer=self._note_connections)
+
+    def _note_connections(self):
+        # Django gives each thread its own connections, opened on first use
+        with self._connections_lock:
+            self._connections.extend(connections.all())
+
+    def shutdown(self, wait=True, **kwargs):
+        super().shutdown(wait=wait, **kwargs)
+        if not wait:
+            return
+        # The workers are gone, so their connections are closed from here
+        for connection in self._connections:
+            connection.inc_thread_sharing()
+            try:
+                connection.close()
+            finally:
+                connection.dec_thread_sharing()
+        self._connections = []
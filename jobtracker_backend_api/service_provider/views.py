@@ -1,25 +1,40 @@
+import asyncio
+import hmac
+import json
 import os
+import time
 from urllib.parse import parse_qs, urlencode
 
 from django.conf import settings
 
 # from django.contrib.auth.models import Group, User
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect
 from django.utils import timezone
 
 import requests
+from asgiref.sync import sync_to_async
 from celery.result import AsyncResult
 from rest_framework import viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from .auth import CookieJWTAuthentication
+from .gmail_watch import parse_push_message, record_notification
 from .googlesheet_services import get_sheet_id
-from .models import FetchLog, JobApplied, User
-from .serializers import FetchLogSerializer, JobAppliedSerializer, UserSerializer
-from .tasks import fetch_emails_task
+from .models import FetchLog, FetchRun, JobApplied, User
+from .pagination import JobCursorPagination
+from .response_cache import bump_data_version, cached_response
+from .serializers import (
+    FetchLogSerializer,
+    JobAppliedListSerializer,
+    JobAppliedSerializer,
+    UserSerializer,
+)
+from .tasks import enqueue_fetch
 
 
 class GoogleOAuthLoginRedirect(APIView):
@@ -107,7 +122,15 @@ class GoogleOAuthCallback(APIView):
             seconds=token_res["expires_in"]
         )
         user.last_login = timezone.now()
-        user.save()
+        # Only the fields set here, so a concurrent data_version bump is kept
+        user.save(
+            update_fields=[
+                "google_access_token",
+                "google_refresh_token",
+                "token_expiry",
+                "last_login",
+            ]
+        )
 
         # Generate JWT
         response = redirect(redirect_uri)
@@ -120,12 +143,15 @@ class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
 
     def list(self, request, *args, **kwargs):
-        return Response(
-            {
+        return cached_response(
+            request,
+            lambda: {
                 "email": request.user.email,
-                "first_time_user": len(FetchLog.objects.filter(user=request.user)) == 0,
+                "first_time_user": not FetchLog.objects.filter(
+                    user=request.user
+                ).exists(),
                 "sheet_id": request.user.google_sheet_id,
-            }
+            },
         )
 
     @action(detail=False, methods=["post"])
@@ -136,7 +162,8 @@ class UserViewSet(viewsets.ModelViewSet):
         user = request.user
         sheet_url = request.data.get("google_sheet_url")
         user.google_sheet_id = get_sheet_id(sheet_url)
-        user.save()
+        user.save(update_fields=["google_sheet_id"])
+        bump_data_version(user.pk)
         return Response({"status": "updated", "google_sheet_id": user.google_sheet_id})
 
     @action(detail=False, methods=["post"])
@@ -146,7 +173,8 @@ class UserViewSet(viewsets.ModelViewSet):
         """
         user = request.user
         user.google_sheet_id = None
-        user.save()
+        user.save(update_fields=["google_sheet_id"])
+        bump_data_version(user.pk)
         return Response({"status": "removed", "google_sheet_id": user.google_sheet_id})
 
 
@@ -158,14 +186,49 @@ class JobAppliedViewSet(viewsets.ModelViewSet):
     queryset = JobApplied.objects.all().order_by("-id")
     serializer_class = JobAppliedSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = JobCursorPagination
+    # Exact match filters, e.g. /jobs/?status=interview&company=Acme
+    filter_fields = ["status", "company"]
+
+    def get_queryset(self):
+        queryset = JobApplied.objects.filter(user=self.request.user).order_by("-id")
+        filters = {
+            field: self.request.query_params[field]
+            for field in self.filter_fields
+            if field in self.request.query_params
+        }
+        return queryset.filter(**filters)
+
+    def get_serializer_class(self):
+        if self.action == "list":
+            return JobAppliedListSerializer
+        return super().get_serializer_class()
+
+    def list(self, request, *args, **kwargs):
+        return cached_response(
+            request,
+            lambda: super(JobAppliedViewSet, self).list(request, *args, **kwargs).data,
+        )
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        bump_data_version(self.request.user.pk)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        bump_data_version(self.request.user.pk)
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        bump_data_version(self.request.user.pk)
 
     @action(detail=False, methods=["get", "post"])
     def fetch_emails(self, request):
         """
         Custom action to fetch emails from external source.
         """
-        task = fetch_emails_task.delay(request.user.id)
-        return Response({"task_id": task.id})
+        task_id = enqueue_fetch(request.user.id)
+        return Response({"task_id": task_id})
 
 
 class FetchLogViewSet(viewsets.ModelViewSet):
@@ -177,6 +240,18 @@ class FetchLogViewSet(viewsets.ModelViewSet):
     queryset = FetchLog.objects.all().order_by("-last_fetch_date")
     serializer_class = FetchLogSerializer
 
+    def perform_create(self, serializer):
+        fetch_log = serializer.save()
+        bump_data_version(fetch_log.user_id)
+
+    def perform_update(self, serializer):
+        fetch_log = serializer.save()
+        bump_data_version(fetch_log.user_id)
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        bump_data_version(instance.user_id)
+
     @action(detail=False, methods=["post"])
     def add_log(self, request):
         """
@@ -193,10 +268,88 @@ class FetchLogViewSet(viewsets.ModelViewSet):
         fetch_log = FetchLog.objects.create(
             user=request.user, last_fetch_date=last_fetch_date
         )
+        bump_data_version(request.user.pk)
         return Response({"status": "fetch log added", "id": fetch_log.id})
 
 
+# Seconds between checks of a fetch run while its progress is streamed
+PROGRESS_POLL_INTERVAL = float(os.getenv("PROGRESS_POLL_INTERVAL", 1))
+# Seconds a progress stream stays open, EventSource clients reconnect after it
+PROGRESS_STREAM_TIMEOUT = int(os.getenv("PROGRESS_STREAM_TIMEOUT", 300))
+
+
 class TaskStatusView(APIView):
+    permission_classes = [IsAuthenticated]
+
     def get(self, request, task_id):
         result = AsyncResult(task_id)
-        return Response({"status": result.status})
+        response = {"status": result.status}
+        run = (
+            FetchRun.objects.filter(user=request.user, task_id=task_id)
+            .order_by("-id")
+            .first()
+        )
+        if run is not None:
+            response["progress"] = run.progress()
+        return Response(response)
+
+
+async def _fetch_progress_events(user, task_id):
+    """Yield a server-sent event whenever the fetch run's progress changes,
+    until the run is done or failed."""
+    last_progress = None
+    deadline = time.monotonic() + PROGRESS_STREAM_TIMEOUT
+    while time.monotonic() < deadline:
+        run = (
+            await FetchRun.objects.filter(user=user, task_id=task_id)
+            .order_by("-id")
+            .afirst()
+        )
+        progress = run.progress() if run is not None else {"stage": "pending"}
+        if progress != last_progress:
+            yield f"data: {json.dumps(progress)}\n\n"
+            last_progress = progress
+        if run is not None and run.status in (FetchRun.DONE, FetchRun.FAILED):
+            return
+        await asyncio.sleep(PROGRESS_POLL_INTERVAL)
+
+
+async def task_events(request, task_id):
+    """Stream the progress of one of the user's fetches as server-sent events.
+    Served by the ASGI application so an open stream does not hold a worker."""
+    auth = await sync_to_async(CookieJWTAuthentication().authenticate)(request)
+    if auth is None:
+        return JsonResponse(
+            {"detail": "Authentication credentials were not provided."}, status=401
+        )
+    response = StreamingHttpResponse(
+        _fetch_progress_events(auth[0], task_id), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+class GmailPushView(APIView):
+    """Pub/Sub push endpoint of Gmail watch notifications. Pub/Sub cannot log
+    in, the subscription's push URL carries GMAIL_PUSH_TOKEN instead."""
+
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        token = request.query_params.get("token", "")
+        if not settings.GMAIL_PUSH_TOKEN or not hmac.compare_digest(
+            token, settings.GMAIL_PUSH_TOKEN
+        ):
+            return Response(status=403)
+        try:
+            email_address, history_id = parse_push_message(request.data)
+        except ValueError as error:
+            # Acknowledge anyway, Pub/Sub would redeliver it forever
+            print(error)
+            return Response(status=204)
+        user_id = record_notification(email_address, history_id)
+        if user_id is not None:
+            enqueue_fetch(user_id)
+        return Response(status=204)
@@ -126,6 +126,30 @@ CORS_ALLOW_METHODS = [
 # Celery settings
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL")  # Or your Redis URL
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND")
+# Fetch tasks ack late and resume from checkpoints, so hand a task back to the
+# broker when its worker dies and reserve one message per worker process
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Scheduled fetching, run by `celery beat`
+FETCH_SCHEDULE_INTERVAL = int(os.environ.get("FETCH_SCHEDULE_INTERVAL", 60 * 60))
+FETCH_SCHEDULE_SHARDS = int(os.environ.get("FETCH_SCHEDULE_SHARDS", 4))
+# Push mode: Gmail publishes new mail to this Pub/Sub topic, whose push
+# subscription posts to /gmail/push/?token=GMAIL_PUSH_TOKEN. Users with a live
+# watch are left out of scheduled fetching.
+GMAIL_PUBSUB_TOPIC = os.environ.get("GMAIL_PUBSUB_TOPIC", "")
+GMAIL_PUSH_TOKEN = os.environ.get("GMAIL_PUSH_TOKEN", "")
+GMAIL_WATCH_RENEW_INTERVAL = int(os.environ.get("GMAIL_WATCH_RENEW_INTERVAL", 60 * 60))
+CELERY_BEAT_SCHEDULE = {
+    "schedule-user-fetches": {
+        "task": "jobtracker_backend_api.service_provider.tasks.schedule_user_fetches",
+        "schedule": FETCH_SCHEDULE_INTERVAL,
+    },
+    "renew-gmail-watches": {
+        "task": "jobtracker_backend_api.service_provider.tasks.renew_gmail_watches",
+        "schedule": GMAIL_WATCH_RENEW_INTERVAL,
+    },
+}
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
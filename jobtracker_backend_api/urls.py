@@ -21,6 +21,8 @@ urlpatterns = [
     path("auth/google/callback/", views.GoogleOAuthCallback.as_view()),
     # path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
     path("task_status/<str:task_id>/", views.TaskStatusView.as_view()),
+    path("task_status/<str:task_id>/events/", views.task_events),
+    path("gmail/push/", views.GmailPushView.as_view()),
 ]
 
 